@@ -10,6 +10,7 @@ Copyright (c) 2013-2014, CEA/DSV/I2BM/Neurospin. All rights reserved.
 """
 from . import bases
 from . import deflation
+from . import distributed
 from . import gradient
 from . import multiblock
 from . import nipals
@@ -17,5 +18,5 @@ from . import primaldual
 from . import proximal
 from . import utils
 
-__all__ = ["bases", "deflation", "gradient", "multiblock", "nipals",
-           "primaldual", "proximal", "utils"]
\ No newline at end of file
+__all__ = ["bases", "deflation", "distributed", "gradient", "multiblock",
+           "nipals", "primaldual", "proximal", "utils"]
\ No newline at end of file
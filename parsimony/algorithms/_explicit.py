@@ -409,15 +409,13 @@ class FISTA(bases.ExplicitAlgorithm,
             if self.conesta_stop is not None:
                 mu_min = self.conesta_stop[0]
 #                print "mu_min:", mu_min
-                mu_old = function.set_mu(mu_min)
-#                print "mu_old:", mu_old
-                stop_step = function.step(betanew)
+                stop_step = function.step(betanew, mu=mu_min)
 #                print "step  :", step
-                # Take one ISTA step for use in the stopping criterion.
+                # Take one ISTA step, with mu = mu_min, for use in the
+                # stopping criterion.
                 stop_z = function.prox(betanew - stop_step \
-                                                    * function.grad(betanew),
+                                      * function.grad(betanew, mu=mu_min),
                                   stop_step)
-                function.set_mu(mu_old)
 #                print "err   :", maths.norm(betanew - z)
 #                print "sc err:", (1.0 / step) * maths.norm(betanew - z)
 #                print "eps   :", self.eps
@@ -1575,7 +1573,7 @@ class ParallelDykstrasProximalAlgorithm(bases.ExplicitAlgorithm):
             for i in xrange(num_prox):
                 p[i] = prox[i].prox(z[i], factor)
             for i in xrange(num_prox, num_prox + num_proj):
-                p[i] = proj[i].proj(z[i])
+                p[i] = proj[i - num_prox].proj(z[i])
 
             x_old = x_new
             x_new = np.zeros(x_old.shape)
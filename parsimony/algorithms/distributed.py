@@ -0,0 +1,584 @@
+# -*- coding: utf-8 -*-
+"""
+The :mod:`parsimony.algorithms.distributed` module contains algorithms for
+data that are split into row shards, held by different workers.
+
+Algorithms may not store states. I.e., if they are classes, do not keep
+references to objects with state in the algorithm objects. It should be
+possible to copy and share algorithms between e.g. estimators, and thus they
+should not depend on any state.
+
+Created on Tue Sep 23 13:27:40 2014
+
+Copyright (c) 2013-2014, CEA/DSV/I2BM/Neurospin. All rights reserved.
+
+@author:  Tommy Löfstedt
+@email:   lofstedt.tommy@gmail.com
+@license: BSD 3-clause.
+"""
+import traceback
+import multiprocessing
+
+import numpy as np
+
+try:
+    from . import bases  # Only works when imported as a package.
+except ValueError:
+    import parsimony.algorithms.bases as bases  # When run as a program.
+import parsimony.utils as utils
+import parsimony.utils.maths as maths
+import parsimony.utils.consts as consts
+from parsimony.algorithms.utils import Info
+import parsimony.functions.properties as properties
+import parsimony.functions.nesterov.properties as nesterov_properties
+from parsimony.functions.penalties import ZeroFunction
+from parsimony.functions.combinedfunctions import CombinedFunction
+
+__all__ = ["ConsensusADMM", "LocalTransport", "ProcessTransport"]
+
+
+class ConsensusADMM(bases.ExplicitAlgorithm,
+                    bases.IterativeAlgorithm,
+                    bases.InformationAlgorithm):
+    """Consensus ADMM for a loss that is split into row shards, plus a
+    penalty:
+
+        min. sum_k loss_k(x_k) + penalty(z)
+        s.t. x_k = z, for all k.
+
+    Every worker owns one shard, and updates its local variables as
+
+        x_k = argmin_x loss_k(x) + (rho / 2) * ||x - z + u_k||²_2,
+        u_k = u_k + x_k - z,
+
+    while the coordinator applies the proximal operator of the penalty to the
+    average,
+
+        z = prox_{penalty / (K * rho)}(mean_k(x_k + u_k)).
+
+    Only p-vectors are sent between the coordinator and the workers in every
+    iteration: z to the workers and x_k and x_k + u_k back.
+
+    For linear regression shards, the local problems are linear systems that
+    are solved with a Cholesky factorisation computed once, of the p-by-p or
+    the n_k-by-n_k matrix, whichever is smaller. Other shards, e.g. logistic
+    regression, are solved by Newton's method, warm-started from the
+    previous x_k.
+
+    The penalty may have a proximal operator (e.g. L1), be a Nesterov
+    function with mu = 0 (e.g. exact total variation or group lasso), for
+    which the proximal operator is computed by projected gradient on the dual
+    variable, or have a gradient (e.g. smoothed total variation, or a
+    CombinedFunction with a smooth part and a proximal part), in which case
+    the proximal operator is computed with FISTA.
+
+    Parameters
+    ----------
+    rho : Positive float. The penalty parameter of the augmented Lagrangian.
+            Default is 1.0.
+
+    transport : Transport. Runs the workers and passes messages to them.
+            Default is None, which means LocalTransport(), all workers in this
+            process.
+
+    eps : Positive float. Tolerance for the stopping criterion. The algorithm
+            stops when both the primal residual, sqrt(sum_k ||x_k - z||²_2),
+            and the dual residual, rho * sqrt(K) * ||z - z_old||_2, are
+            smaller than eps.
+
+    info : List or tuple of utils.consts.Info. What, if any, extra run
+            information should be stored. Default is an empty list, which means
+            that no run information is computed nor returned.
+
+    max_iter : Non-negative integer. Maximum allowed number of iterations.
+
+    min_iter : Non-negative integer less than or equal to max_iter. Minimum
+            number of iterations that must be performed. Default is 1.
+
+    max_inner_iter : Positive integer. Maximum number of iterations for the
+            local problems that have no closed form, and for the proximal
+            operators of the penalty that are computed iteratively.
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> import parsimony.functions.losses as losses
+    >>> import parsimony.functions.penalties as penalties
+    >>> from parsimony.functions import CombinedFunction, ShardedFunction
+    >>> from parsimony.algorithms.proximal import FISTA
+    >>> from parsimony.algorithms.distributed import ConsensusADMM
+    >>>
+    >>> np.random.seed(42)
+    >>> X = np.random.randn(90, 20)
+    >>> y = np.dot(X[:, :3], np.ones((3, 1))) + 0.1 * np.random.randn(90, 1)
+    >>> shards = [losses.LinearRegression(X[i::3, :], y[i::3, :], mean=False)
+    ...           for i in xrange(3)]
+    >>> function = ShardedFunction(shards, penalties.L1(l=5.0))
+    >>> admm = ConsensusADMM(rho=50.0, eps=1e-8, max_iter=1000)
+    >>> beta = admm.run(function, np.zeros((20, 1)))
+    >>>
+    >>> combined = CombinedFunction()
+    >>> combined.add_function(losses.LinearRegression(X, y, mean=False))
+    >>> combined.add_prox(penalties.L1(l=5.0))
+    >>> beta_ = FISTA(eps=1e-10, max_iter=10000).run(combined,
+    ...                                             np.zeros((20, 1)))
+    >>> np.linalg.norm(beta - beta_) < 5e-7
+    True
+    """
+    INTERFACES = [properties.Function]
+
+    INFO_PROVIDED = [Info.ok,
+                     Info.num_iter,
+                     Info.time,
+                     Info.fvalue,
+                     Info.converged]
+
+    def __init__(self, rho=1.0, transport=None, eps=consts.TOLERANCE,
+                 info=[], max_iter=consts.MAX_ITER, min_iter=1,
+                 max_inner_iter=100):
+
+        super(ConsensusADMM, self).__init__(info=info,
+                                            max_iter=max_iter,
+                                            min_iter=min_iter)
+        self.rho = max(consts.TOLERANCE, float(rho))
+        self.transport = transport
+        self.eps = eps
+        self.max_inner_iter = max(1, int(max_inner_iter))
+
+    @bases.force_reset
+    @bases.check_compatibility
+    def run(self, function, beta):
+        """Find the minimiser of the given function, starting at beta.
+
+        Parameters
+        ----------
+        function : ShardedFunction. The function to minimise.
+
+        beta : Numpy array. The start vector.
+        """
+        if self.info_requested(Info.ok):
+            self.info_set(Info.ok, False)
+
+        transport = self.transport
+        if transport is None:
+            transport = LocalTransport()
+
+        num_shards = len(function.shards)
+        factor = 1.0 / (num_shards * self.rho)
+        penalty = function.penalty
+
+        if self.info_requested(Info.time):
+            t = []
+        if self.info_requested(Info.fvalue):
+            f = []
+        if self.info_requested(Info.converged):
+            self.info_set(Info.converged, False)
+
+        # The proximal operators that are computed iteratively are
+        # warm-started from their solutions in the previous iteration.
+        prox_state = dict()
+
+        workers = [_ConsensusWorker(shard, self.rho, self.eps,
+                                    self.max_inner_iter)
+                   for shard in function.shards]
+        transport.start(workers)
+        try:
+            transport.call("reset", beta)
+
+            z = beta
+            for i in xrange(1, max(self.min_iter, self.max_iter) + 1):
+
+                if self.info_requested(Info.time):
+                    tm = utils.time_cpu()
+
+                results = transport.call("update", z)
+
+                w = results[0][1].copy()
+                for k in xrange(1, num_shards):
+                    w += results[k][1]
+                w /= float(num_shards)
+
+                z_old = z
+                z = _prox(penalty, w, factor, self.eps, self.max_inner_iter,
+                          prox_state)
+
+                primal = np.sqrt(sum([maths.norm(x_k - z) ** 2.0
+                                      for x_k, _ in results]))
+                dual = self.rho * np.sqrt(num_shards) * maths.norm(z - z_old)
+
+                if self.info_requested(Info.time):
+                    t.append(utils.time_cpu() - tm)
+                if self.info_requested(Info.fvalue):
+                    f.append(sum(transport.call("f", z)) + penalty.f(z))
+
+                if primal < self.eps and dual < self.eps \
+                        and i >= self.min_iter:
+
+                    if self.info_requested(Info.converged):
+                        self.info_set(Info.converged, True)
+
+                    break
+        finally:
+            transport.close()
+
+        self.num_iter = i
+
+        if self.info_requested(Info.num_iter):
+            self.info_set(Info.num_iter, i)
+        if self.info_requested(Info.time):
+            self.info_set(Info.time, t)
+        if self.info_requested(Info.fvalue):
+            self.info_set(Info.fvalue, f)
+        if self.info_requested(Info.ok):
+            self.info_set(Info.ok, True)
+
+        return z
+
+
+class LocalTransport(object):
+    """Runs all workers in this process, one after the other.
+
+    A transport has three methods: start(workers), that sets up the workers;
+    call(method, *args), that calls the given method with the given
+    arguments on all workers and returns the list of their results; and
+    close(), that shuts the workers down. Other transports, e.g. over MPI,
+    only need to implement these three methods.
+    """
+    def __init__(self):
+
+        self._workers = None
+
+    def start(self, workers):
+
+        self._workers = list(workers)
+
+    def call(self, method, *args):
+
+        return [getattr(worker, method)(*args) for worker in self._workers]
+
+    def close(self):
+
+        self._workers = None
+
+
+class ProcessTransport(object):
+    """Runs every worker in a separate process, and passes the messages
+    through pipes.
+
+    The workers are given to the processes when they are started, so shards
+    that are callables are only loaded in the processes that own them.
+    """
+    def __init__(self):
+
+        self._processes = None
+        self._connections = None
+
+    def start(self, workers):
+
+        self._processes = []
+        self._connections = []
+        for worker in workers:
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve,
+                                              args=(worker, child))
+            process.daemon = True
+            process.start()
+            child.close()
+
+            self._processes.append(process)
+            self._connections.append(parent)
+
+    def call(self, method, *args):
+
+        for connection in self._connections:
+            connection.send((method, args))
+
+        results = [connection.recv() for connection in self._connections]
+        for result in results:
+            if isinstance(result, _RemoteError):
+                raise RuntimeError("A worker failed:\n" + result.message)
+
+        return results
+
+    def close(self):
+
+        if self._connections is None:
+            return
+
+        for connection in self._connections:
+            try:
+                connection.send(None)
+                connection.close()
+            except (IOError, EOFError):
+                pass
+        for process in self._processes:
+            process.join()
+
+        self._processes = None
+        self._connections = None
+
+
+class _RemoteError(object):
+
+    def __init__(self, message):
+
+        self.message = message
+
+
+def _serve(worker, connection):
+    """Calls the methods of the worker that are received on the connection,
+    and sends back the results, until None is received.
+    """
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        method, args = message
+        try:
+            result = getattr(worker, method)(*args)
+        except Exception:
+            result = _RemoteError(traceback.format_exc())
+        connection.send(result)
+
+    connection.close()
+
+
+class _ConsensusWorker(object):
+    """The local state of a shard in ConsensusADMM.
+    """
+    def __init__(self, shard, rho, eps, max_iter):
+
+        self.shard = shard
+        self.rho = rho
+        self.eps = eps
+        self.max_iter = max_iter
+
+        self._loss = None
+        self._solver = None
+        self._Xty = None
+        self._x = None
+        self._u = None
+
+    def loss(self):
+
+        if self._loss is None:
+            import parsimony.functions.combinedfunctions as combinedfunctions
+            self._loss = combinedfunctions.shard_function(self.shard)
+
+        return self._loss
+
+    def reset(self, beta):
+
+        self._x = None
+        self._u = np.zeros(beta.shape)
+
+    def update(self, z):
+        """Updates u_k and x_k, and returns x_k and x_k + u_k.
+        """
+        if self._x is not None:
+            self._u += self._x - z
+
+        self._x = self._solve(z - self._u)
+
+        return self._x, self._x + self._u
+
+    def f(self, beta):
+
+        return self.loss().f(beta)
+
+    def _solve(self, v):
+        """Returns argmin_x loss(x) + (rho / 2) * ||x - v||²_2.
+        """
+        import parsimony.functions.losses as losses
+
+        loss = self.loss()
+        if type(loss) is losses.LinearRegression:
+            return self._solve_squared(loss, v)
+
+        x = v.copy() if self._x is None else self._x.copy()
+        if isinstance(loss, properties.Hessian):
+            return self._solve_newton(loss, v, x)
+        else:
+            return self._solve_gradient(loss, v, x)
+
+    def _solve_squared(self, loss, v):
+        """Solves (X'X / c + rho.I).x = X'y / c + rho.v, with c = n_k if the
+        loss is the mean loss.
+        """
+        X = loss.X
+        c = float(X.shape[0]) if loss.mean else 1.0
+
+        if self._solver is None:
+            self._solver = maths.RidgeSolver(X, self.rho, c=1.0 / c)
+            self._Xty = np.dot(X.T, loss.y) / c
+
+        return self._solver.solve(self._Xty + self.rho * v)
+
+    def _solve_newton(self, loss, v, x):
+        """Newton's method with backtracking, started at x.
+        """
+        rho = self.rho
+
+        def phi(x):
+            return loss.f(x) + (rho / 2.0) * maths.norm(x - v) ** 2.0
+
+        f = phi(x)
+        for i in xrange(self.max_iter):
+            grad = loss.grad(x) + rho * (x - v)
+            if maths.norm(grad) < self.eps:
+                break
+
+            H = loss.hessian(x)
+            H.flat[::H.shape[0] + 1] += rho
+            d = -np.linalg.solve(H, grad)
+
+            a = 1.0
+            decrease = np.dot(grad.T, d)[0, 0]
+            for j in xrange(30):
+                x_new = x + a * d
+                f_new = phi(x_new)
+                if f_new <= f + 1e-4 * a * decrease:
+                    break
+                a *= 0.5
+            x, f = x_new, f_new
+
+        return x
+
+    def _solve_gradient(self, loss, v, x):
+        """Accelerated gradient descent, started at x.
+        """
+        step = 1.0 / (loss.L() + self.rho)
+
+        x_old = x
+        for i in xrange(1, self.max_iter + 1):
+            y = x + ((i - 2.0) / (i + 1.0)) * (x - x_old)
+            x_old = x
+            x = y - step * (loss.grad(y) + self.rho * (y - v))
+            if maths.norm(x - y) < self.eps * step:
+                break
+
+        return x
+
+
+def _prox(penalty, w, factor, eps, max_iter, state):
+    """The proximal operator of the penalty, prox_{factor * penalty}(w).
+
+    The iterative methods keep their solutions in the dict state, and start
+    from them the next time.
+
+    A CombinedFunction is both Gradient and ProximalOperator, but its proximal
+    operator only accounts for its non-smooth part, so its smooth part is
+    handled by FISTA. Other penalties that have a proximal operator, e.g. L1
+    or L2Squared, use it directly.
+    """
+    if _is_zero(penalty):
+        return w
+
+    elif isinstance(penalty, nesterov_properties.NesterovFunction) \
+            and penalty.get_mu() <= 0.0:
+        return _nesterov_prox(penalty, w, factor, eps, max_iter, state)
+
+    elif isinstance(penalty, CombinedFunction):
+        return _smooth_prox(penalty, w, factor, eps, max_iter, state)
+
+    elif isinstance(penalty, properties.ProximalOperator):
+        return penalty.prox(w, factor)
+
+    else:
+        return _smooth_prox(penalty, w, factor, eps, max_iter, state)
+
+
+def _is_zero(penalty):
+    """Whether the value of the penalty is identically zero.
+    """
+    if isinstance(penalty, ZeroFunction):
+        return True
+
+    elif isinstance(penalty, CombinedFunction):
+        return all([_is_zero(f) for f in penalty._f + penalty._p
+                                          + penalty._prox])
+
+    elif isinstance(penalty, properties.AtomicFunction) \
+            and isinstance(penalty, properties.Penalty) \
+            and hasattr(penalty, "l"):
+        return np.all(np.asarray(penalty.l) == 0.0)
+
+    return False
+
+
+def _nesterov_prox(penalty, w, factor, eps, max_iter, state):
+    """The exact proximal operator of a Nesterov function,
+
+        l * max_{alpha in K} alpha'A.w,
+
+    computed by FISTA on the dual problem
+
+        min_{alpha in K} 0.5 * ||w - factor * l * A'alpha||²_2,
+
+    after which prox(w) = w - factor * l * A'alpha.
+    """
+    c = factor * penalty.l
+    if c <= 0.0:
+        return w
+
+    start = penalty.penalty_start
+    w_ = w[start:, :]
+
+    A = penalty.A()
+    step = 1.0 / (c * penalty.lambda_max())
+
+    alpha = state.get("alpha")
+    if alpha is None:
+        alpha = penalty.project([np.zeros((A_i.shape[0], 1)) for A_i in A])
+    alpha_old = alpha
+
+    z = w_
+    for i in xrange(1, max_iter + 1):
+        beta = [alpha[j] + ((i - 2.0) / (i + 1.0)) * (alpha[j] - alpha_old[j])
+                for j in xrange(len(A))]
+        r = w_ - c * penalty.Aa(beta)
+        alpha_old = alpha
+        alpha = penalty.project([beta[j] + step * A[j].dot(r)
+                                 for j in xrange(len(A))])
+
+        z_old = z
+        z = w_ - c * penalty.Aa(alpha)
+        if maths.norm(z - z_old) < eps:
+            break
+
+    state["alpha"] = alpha
+
+    return np.vstack((w[:start, :], z))
+
+
+def _smooth_prox(penalty, w, factor, eps, max_iter, state):
+    """The proximal operator of a penalty with a gradient, or of a
+    CombinedFunction with a gradient and a proximal operator, computed by
+    FISTA on
+
+        penalty(z) + (1 / (2 * factor)) * ||z - w||²_2.
+    """
+    if isinstance(penalty, properties.LipschitzContinuousGradient):
+        L = penalty.L()
+    else:
+        L = 1.0 / penalty.step(w)
+    step = 1.0 / (L + 1.0 / factor)
+
+    z = z_old = state.get("z", w)
+    for i in xrange(1, max_iter + 1):
+        y = z + ((i - 2.0) / (i + 1.0)) * (z - z_old)
+        z_old = z
+        z = y - step * (penalty.grad(y) + (y - w) / factor)
+        if isinstance(penalty, CombinedFunction):
+            z = penalty.prox(z, step)
+
+        if maths.norm(z - y) < eps * step:
+            break
+
+    state["z"] = z
+
+    return z
@@ -17,6 +17,8 @@ Copyright (c) 2013-2014, CEA/DSV/I2BM/Neurospin. All rights reserved.
 @email:   lofstedt.tommy@gmail.com
 @license: BSD 3-clause.
 """
+import numpy as np
+
 try:
     from . import bases  # Only works when imported as a package.
 except ValueError:
@@ -25,9 +27,11 @@ import parsimony.utils as utils
 import parsimony.utils.maths as maths
 import parsimony.utils.consts as consts
 from parsimony.algorithms.utils import Info
+from parsimony.algorithms.utils import BacktrackingLineSearch
 import parsimony.functions.properties as properties
+import parsimony.functions.nesterov.properties as nesterov_properties
 
-__all__ = ["GradientDescent"]
+__all__ = ["GradientDescent", "NewtonCG"]
 
 
 class GradientDescent(bases.ExplicitAlgorithm,
@@ -49,6 +53,32 @@ class GradientDescent(bases.ExplicitAlgorithm,
     min_iter : Non-negative integer less than or equal to max_iter. Minimum
             number of iterations that must be performed. Default is 1.
 
+    method : String. The kind of steps to take. One of
+
+                "gradient": Steps of length function.step along the negative
+                        gradient.
+
+                "nesterov": Nesterov's accelerated gradient method, with the
+                        momentum restarted whenever it points in a direction
+                        of ascent.
+
+                "bb": Barzilai-Borwein steps, s's / s'y, where s is the
+                        change in beta and y the change in the gradient in
+                        the previous iteration. The step is never shorter
+                        than function.step.
+
+            Default is "gradient".
+
+    line_search : Boolean. Whether to find the step length by backtracking,
+            using BacktrackingLineSearch with the SufficientDescentCondition
+            (the Armijo condition), from twice the previous step length (or
+            from the Barzilai-Borwein step). For Nesterov's method, the
+            constant of the condition is 0.5, so that the step fulfills the
+            descent lemma. If the line search fails, the step given by
+            function.step is used. For functions with smoothing, i.e.
+            NesterovFunctions with a method fmu, the condition is checked on
+            the smoothed function. Default is False.
+
     Examples
     --------
     >>> from parsimony.algorithms.gradient import GradientDescent
@@ -63,6 +93,14 @@ class GradientDescent(bases.ExplicitAlgorithm,
     >>> beta2 = np.dot(np.linalg.pinv(X), y)
     >>> np.linalg.norm(beta1 - beta2)
     0.0003121557632556645
+    >>>
+    >>> gd = GradientDescent(max_iter=10000, method="nesterov",
+    ...                      line_search=True)
+    >>> beta3 = gd.run(function, np.random.rand(50, 1))
+    >>> np.linalg.norm(beta3 - beta2) < 1e-4
+    True
+    >>> gd.num_iter < 1000
+    True
     """
     INTERFACES = [properties.Function,
                   properties.Gradient,
@@ -75,13 +113,20 @@ class GradientDescent(bases.ExplicitAlgorithm,
                      Info.converged]
 
     def __init__(self, eps=consts.TOLERANCE,
-                 info=[], max_iter=20000, min_iter=1):
+                 info=[], max_iter=20000, min_iter=1,
+                 method="gradient", line_search=False):
         super(GradientDescent, self).__init__(info=info,
                                               max_iter=max_iter,
                                               min_iter=min_iter)
 
         self.eps = eps
 
+        if method not in ("gradient", "nesterov", "bb"):
+            raise ValueError('method must be "gradient", "nesterov" or '
+                             '"bb".')
+        self.method = method
+        self.line_search = bool(line_search)
+
     @bases.force_reset
     @bases.check_compatibility
     def run(self, function, beta):
@@ -96,9 +141,18 @@ class GradientDescent(bases.ExplicitAlgorithm,
         if self.info_requested(Info.ok):
             self.info_set(Info.ok, False)
 
-        step = function.step(beta)
+        if self.line_search:
+            line_search = BacktrackingLineSearch(max_iter=30)
+            if isinstance(function, nesterov_properties.NesterovFunction) \
+                    and hasattr(function, "fmu"):
+                objective = _SmoothedFunction(function)
+            else:
+                objective = function
+            c = 0.5 if self.method == "nesterov" else 1e-4
 
         betanew = betaold = beta
+        grad_old = None
+        step = None
 
         if self.info_requested(Info.time):
             t = []
@@ -107,22 +161,52 @@ class GradientDescent(bases.ExplicitAlgorithm,
         if self.info_requested(Info.converged):
             self.info_set(Info.converged, False)
 
+        k = 0  # The momentum counter, reset when the momentum is restarted.
         for i in xrange(1, self.max_iter + 1):
 
             if self.info_requested(Info.time):
                 tm = utils.time_cpu()
 
-            step = function.step(betanew)
+            if self.method == "nesterov":
+                k += 1
+                z = betanew + ((k - 2.0) / (k + 1.0)) * (betanew - betaold)
+            else:
+                z = betanew
+            grad = function.grad(z)
+
+            min_step = function.step(z)
+            if self.method == "bb" and grad_old is not None:
+                s = betanew - betaold
+                sy = np.vdot(s, grad - grad_old)
+                if sy > 0.0:
+                    step = max(min_step, np.vdot(s, s) / sy)
+                else:
+                    step = min_step
+            elif self.line_search and step is not None:
+                step = max(min_step, 2.0 * step)
+            else:
+                step = min_step
+
+            if self.line_search and step > min_step:
+                step = line_search.run(objective, z, -grad, rho=0.5, a=step,
+                                       c=c)
+                step = max(min_step, step)
 
             betaold = betanew
-            betanew = betaold - step * function.grad(betaold)
+            grad_old = grad
+            betanew = z - step * grad
+
+            if self.method == "nesterov" \
+                    and np.vdot(z - betanew, betanew - betaold) > 0.0:
+                k = 1
+                betaold = betanew
 
             if self.info_requested(Info.time):
                 t.append(utils.time_cpu() - tm)
             if self.info_requested(Info.fvalue):
                 f.append(function.f(betanew))
 
-            if maths.norm(betanew - betaold) < self.eps \
+            if maths.norm(betanew - z) < self.eps \
                     and i >= self.min_iter:
 
                 if self.info_requested(Info.converged):
@@ -130,6 +214,8 @@ class GradientDescent(bases.ExplicitAlgorithm,
 
                 break
 
+        self.num_iter = i
+
         if self.info_requested(Info.num_iter):
             self.info_set(Info.num_iter, i)
         if self.info_requested(Info.time):
@@ -141,6 +227,218 @@ class GradientDescent(bases.ExplicitAlgorithm,
 
         return betanew
 
+
+class _SmoothedFunction(properties.Function,
+                        properties.Gradient):
+    """The smoothed function, whose value is fmu, of a Nesterov function.
+
+    Used for the line search, which must check the function whose gradient
+    is used.
+    """
+    def __init__(self, function):
+
+        self.function = function
+
+    def f(self, x):
+
+        return self.function.fmu(x)
+
+    def grad(self, x):
+
+        return self.function.grad(x)
+
+
+class NewtonCG(bases.ExplicitAlgorithm,
+               bases.IterativeAlgorithm,
+               bases.InformationAlgorithm):
+    """The truncated Newton (Newton-CG) algorithm.
+
+    The Newton system H.d = -grad is solved approximately by the conjugate
+    gradient method, using only Hessian-vector products. The Hessian is thus
+    never formed; for e.g. logistic regression every product, X'D(X.v),
+    costs two matrix-vector products with X. For logistic regression, this is
+    iteratively reweighted least squares (IRLS) with the weighted least
+    squares problems solved by conjugate gradients.
+
+    The conjugate gradient iterations stop when the relative residual is
+    below min(0.5, sqrt(|grad|)), which gives superlinear local convergence,
+    or when negative curvature is encountered. The step is globalised by a
+    backtracking line search on the sufficient descent (Armijo) condition.
+
+    Parameters
+    ----------
+    eps : Positive float. Tolerance for the stopping criterion, the norm of the
+            gradient.
+
+    info : List or tuple of utils.consts.Info. What, if any, extra run
+            information should be stored. Default is an empty list, which means
+            that no run information is computed nor returned.
+
+    max_iter : Non-negative integer. Maximum allowed number of (Newton)
+            iterations. Default is 100.
+
+    min_iter : Non-negative integer less than or equal to max_iter. Minimum
+            number of iterations that must be performed. Default is 1.
+
+    max_cg_iter : Positive integer. The maximum number of conjugate gradient
+            iterations in every Newton iteration. Default is None, which means
+            that the dimension of the problem is used.
+
+    Examples
+    --------
+    >>> from parsimony.algorithms.gradient import NewtonCG
+    >>> from parsimony.algorithms.gradient import GradientDescent
+    >>> from parsimony.algorithms.utils import Info
+    >>> from parsimony.functions.losses import RidgeLogisticRegression
+    >>> import numpy as np
+    >>> np.random.seed(42)
+    >>> X = np.random.randn(200, 50)
+    >>> y = np.random.randint(0, 2, (200, 1))
+    >>> function = RidgeLogisticRegression(X, y, k=0.1, mean=True)
+    >>> newton = NewtonCG(info=[Info.num_iter])
+    >>> beta1 = newton.run(function, np.zeros((50, 1)))
+    >>> newton.info_get(Info.num_iter) < 10
+    True
+    >>> np.linalg.norm(function.grad(beta1)) < newton.eps
+    True
+    >>> gd = GradientDescent(max_iter=20000)
+    >>> beta2 = gd.run(function, np.zeros((50, 1)))
+    >>> np.linalg.norm(beta1 - beta2) < 5e-6
+    True
+    """
+    INTERFACES = [properties.Function,
+                  properties.Gradient,
+                  properties.Hessian]
+
+    INFO_PROVIDED = [Info.ok,
+                     Info.num_iter,
+                     Info.time,
+                     Info.fvalue,
+                     Info.converged]
+
+    def __init__(self, eps=consts.TOLERANCE,
+                 info=[], max_iter=100, min_iter=1, max_cg_iter=None):
+        super(NewtonCG, self).__init__(info=info,
+                                       max_iter=max_iter,
+                                       min_iter=min_iter)
+
+        self.eps = eps
+        self.max_cg_iter = max_cg_iter
+
+    @bases.force_reset
+    @bases.check_compatibility
+    def run(self, function, beta):
+        """Find the minimiser of the given function, starting at beta.
+
+        Parameters
+        ----------
+        function : Function. The function to minimise.
+
+        beta : Numpy array. The start vector.
+        """
+        if self.info_requested(Info.ok):
+            self.info_set(Info.ok, False)
+
+        if self.info_requested(Info.time):
+            t = []
+        if self.info_requested(Info.fvalue):
+            f = []
+        if self.info_requested(Info.converged):
+            self.info_set(Info.converged, False)
+
+        if self.max_cg_iter is None:
+            max_cg_iter = beta.shape[0]
+        else:
+            max_cg_iter = max(1, int(self.max_cg_iter))
+
+        line_search = BacktrackingLineSearch(max_iter=30)
+
+        grad = function.grad(beta)
+        norm_grad = maths.norm(grad)
+        for i in xrange(1, self.max_iter + 1):
+
+            if self.info_requested(Info.time):
+                tm = utils.time_cpu()
+
+            tol = min(0.5, np.sqrt(norm_grad)) * norm_grad
+            d = _truncated_cg(function, beta, grad, tol, max_cg_iter)
+
+            a = line_search.run(function, beta, d, rho=0.5, a=1.0, c=1e-4)
+            if a <= 0.0:
+                # Not a descent direction. Fall back to the gradient.
+                d = -grad
+                a = line_search.run(function, beta, d, rho=0.5, a=1.0,
+                                    c=1e-4)
+
+            beta = beta + a * d
+
+            grad = function.grad(beta)
+            norm_grad = maths.norm(grad)
+
+            if self.info_requested(Info.time):
+                t.append(utils.time_cpu() - tm)
+            if self.info_requested(Info.fvalue):
+                f.append(function.f(beta))
+
+            if norm_grad < self.eps and i >= self.min_iter:
+
+                if self.info_requested(Info.converged):
+                    self.info_set(Info.converged, True)
+
+                break
+
+            if a <= 0.0:  # No progress is possible.
+                break
+
+        self.num_iter = i
+
+        if self.info_requested(Info.num_iter):
+            self.info_set(Info.num_iter, i)
+        if self.info_requested(Info.time):
+            self.info_set(Info.time, t)
+        if self.info_requested(Info.fvalue):
+            self.info_set(Info.fvalue, f)
+        if self.info_requested(Info.ok):
+            self.info_set(Info.ok, True)
+
+        return beta
+
+
+def _truncated_cg(function, beta, grad, tol, max_iter):
+    """Approximately solves H.d = -grad with conjugate gradients, where H is
+    the Hessian of function at beta.
+
+    Stops when |H.d + grad| < tol, after max_iter iterations, or when a
+    direction of non-positive curvature is found. The returned direction is
+    always a descent direction.
+    """
+    d = np.zeros(grad.shape)
+    r = -grad
+    p = r.copy()
+    rr = np.dot(r.T, r)[0, 0]
+    for j in xrange(max_iter):
+        Hp = function.hessian(beta, p)
+        pHp = np.dot(p.T, Hp)[0, 0]
+        if pHp <= consts.FLOAT_EPSILON * rr:
+            if j == 0:
+                d = p  # Steepest descent.
+            break
+
+        alpha = rr / pHp
+        d += alpha * p
+        r -= alpha * Hp
+
+        rr_old = rr
+        rr = np.dot(r.T, r)[0, 0]
+        if np.sqrt(rr) < tol:
+            break
+
+        p *= rr / rr_old
+        p += r
+
+    return d
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
\ No newline at end of file
@@ -16,12 +16,16 @@ Copyright (c) 2013-2014, CEA/DSV/I2BM/Neurospin. All rights reserved.
 @email:   lofstedt.tommy@gmail.com
 @license: BSD 3-clause.
 """
+import copy
+import multiprocessing
+import multiprocessing.pool
+
 import numpy as np
 
 try:
     from . import bases  # Only works when imported as a package.
 except ValueError:
-    import parsimony.algorithms.bases as bases  # When run as a program.import parsimony.utils.maths as maths
+    import parsimony.algorithms.bases as bases  # When run as a program.
 import parsimony.utils.consts as consts
 from parsimony.algorithms.utils import Info
 import parsimony.utils.maths as maths
@@ -30,7 +34,7 @@ import parsimony.functions.multiblock.properties as multiblock_properties
 import parsimony.functions.multiblock.losses as mb_losses
 from parsimony.algorithms.proximal import FISTA
 
-__all__ = ["MultiblockFISTA"]
+__all__ = ["MultiblockFISTA", "MultiblockCONESTA"]
 
 
 #class GeneralisedMultiblockISTA(ExplicitAlgorithm):
@@ -77,6 +81,18 @@ __all__ = ["MultiblockFISTA"]
 #        return w
 
 
+def _run_block(args):
+    """Runs the inner algorithm on one block.
+
+    Defined at module level so that it can be sent to a process pool.
+    """
+    algorithm, function, w = args
+
+    w = algorithm.run(function, w)
+
+    return w, algorithm
+
+
 class MultiblockFISTA(bases.ExplicitAlgorithm,
                       bases.IterativeAlgorithm,
                       bases.InformationAlgorithm):
@@ -98,6 +114,49 @@ class MultiblockFISTA(bases.ExplicitAlgorithm,
 
     min_iter : Non-negative integer less than or equal to max_iter. Minimum
             number of iterations that must be performed. Default is 1.
+
+    jacobi : Boolean. Whether to update all blocks simultaneously, from the
+            weight vectors of the previous outer iteration (Jacobi), or one
+            after the other, using the most recent weight vectors
+            (Gauss-Seidel). Default is False, the Gauss-Seidel order.
+
+    num_workers : Positive integer. The number of blocks to update in
+            parallel when jacobi is True. Default is 1, update the blocks one
+            at a time.
+
+    use_processes : Boolean. Whether to use a pool of processes instead of a
+            pool of threads when num_workers > 1. Threads are usually
+            preferable, since the function need not be copied to the workers
+            and numpy releases the GIL in the linear algebra. The threads
+            share the function, whose caches are therefore filled before they
+            start. Default is False.
+
+    logger : logging.Logger. Progress information is logged to this logger.
+            Default is None, which means that nothing is logged.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import parsimony.functions.multiblock.losses as mb_losses
+    >>> import parsimony.functions.penalties as penalties
+    >>> from parsimony.algorithms.multiblock import MultiblockFISTA
+    >>> np.random.seed(42)
+    >>>
+    >>> X = [np.random.rand(10, 5), np.random.rand(10, 4),
+    ...      np.random.rand(10, 3)]
+    >>> function = mb_losses.CombinedMultiblockFunction(X)
+    >>> for i in range(3):
+    ...     for j in range(3):
+    ...         if i != j:
+    ...             cov = mb_losses.LatentVariableCovariance([X[i], X[j]])
+    ...             function.add_function(cov, i, j)
+    ...     function.add_constraint(penalties.L2(c=1.0), i)
+    >>> w = [np.random.rand(5, 1), np.random.rand(4, 1), np.random.rand(3, 1)]
+    >>> gs = MultiblockFISTA(outer_iter=50).run(function, list(w))
+    >>> jacobi = MultiblockFISTA(outer_iter=50, jacobi=True, num_workers=3)
+    >>> wj = jacobi.run(function, list(w))
+    >>> np.allclose([function.f(gs)], [function.f(wj)])
+    True
     """
     INTERFACES = [multiblock_properties.MultiblockFunction,
                   multiblock_properties.MultiblockGradient,
@@ -112,7 +171,9 @@ class MultiblockFISTA(bases.ExplicitAlgorithm,
 
     def __init__(self, info=[], outer_iter=20,
                  eps=consts.TOLERANCE,
-                 max_iter=consts.MAX_ITER, min_iter=1):
+                 max_iter=consts.MAX_ITER, min_iter=1,
+                 jacobi=False, num_workers=1, use_processes=False,
+                 logger=None):
 
         super(MultiblockFISTA, self).__init__(info=info,
                                               max_iter=max_iter,
@@ -121,26 +182,23 @@ class MultiblockFISTA(bases.ExplicitAlgorithm,
         self.outer_iter = outer_iter
         self.eps = float(eps)
 
-#        from parsimony.algorithms.primaldual import NaiveCONESTA
+        self.jacobi = bool(jacobi)
+        self.num_workers = max(1, int(num_workers))
+        self.use_processes = bool(use_processes)
+        self.logger = logger
+
         # Copy the allowed info keys for FISTA.
         self.fista_info = list()
         for nfo in self.info_copy():
             if nfo in FISTA.INFO_PROVIDED:
                 self.fista_info.append(nfo)
-#        if not self.fista_info.allows(Info.num_iter):
-#            self.fista_info.add_key(Info.num_iter)
         if Info.converged not in self.fista_info:
             self.fista_info.append(Info.converged)
 
-#        self.algorithm = FISTA(info=self.fista_info,
-#                               eps=self.eps,
-#                               max_iter=self.max_iter,
-#                               min_iter=self.min_iter)
-#        self.algorithm = algorithms.StaticCONESTA(mu_start=1.0,
-#                                                  info=self.info,
-#                                                  eps=self.eps,
-#                                                  max_iter=self.max_iter,
-#                                                  min_iter=self.min_iter)
+        self.algorithm = FISTA(info=self.fista_info,
+                               eps=self.eps,
+                               max_iter=self.max_iter,
+                               min_iter=self.min_iter)
 
     @bases.force_reset
     @bases.check_compatibility
@@ -155,102 +213,51 @@ class MultiblockFISTA(bases.ExplicitAlgorithm,
         if self.info_requested(Info.converged):
             self.info_set(Info.converged, False)
 
-        self.algorithm = FISTA(info=self.fista_info,
-                               eps=self.eps,
-                               max_iter=self.max_iter,
-                               min_iter=self.min_iter)
-
-        print "len(w):", len(w)
-        print "max_iter:", self.algorithm.max_iter
-
-        num_iter = [0] * len(w)
-#        w_old = [0] * len(w)
-
-#        it = 0
-#        while True:
-        for it in xrange(1, self.outer_iter + 1):
-
-            all_converged = True
-
-            for i in xrange(len(w)):
-                print "it: %d, i: %d" % (it, i)
-
-#                for j in xrange(len(w)):
-#                    w_old[j] = w[j]
-
-                if i == 0:
-                    pass
-                if i == 1:
-                    pass
-                if i == 2:
-                    pass
+        # The inner algorithm may have been changed with set_params.
+        self.algorithm.set_params(eps=self.eps, max_iter=self.max_iter,
+                                  min_iter=self.min_iter)
 
-                func = mb_losses.MultiblockFunctionWrapper(function, w, i)
-#                self.fista_info.clear()
-#                self.algorithm.set_params(max_iter=self.max_iter - num_iter[i])
-#                w[i] = self.algorithm.run(func, w_old[i])
-                w[i] = self.algorithm.run(func, w[i])
+        _log(self.logger, "len(w): %d, max_iter: %d", len(w), self.max_iter)
 
-                num_iter[i] += self.algorithm.num_iter
+        # The wrappers and inner algorithms are created once, and reused in
+        # all outer iterations.
+        funcs = [mb_losses.MultiblockFunctionWrapper(function, w, i)
+                 for i in xrange(len(w))]
+        algorithms = _block_algorithms(self.algorithm, len(w), self.jacobi)
+        pool = _pool(self.jacobi, self.num_workers, self.use_processes)
+        _fill_caches(function, w, pool)
 
-                if self.algorithm.info_requested(Info.time):
-                    tval = self.algorithm.info_get(Info.time)
-                if self.algorithm.info_requested(Info.fvalue):
-                    fval = self.algorithm.info_get(Info.fvalue)
-
-#                if Info.converged in self.fista_info:
-#                    if not self.fista_info[Info.converged] \
-#                            or self.fista_info[Info.num_iter] > 1:
-#                        all_converged = False
+        num_iter = [0] * len(w)
+        try:
+            for it in xrange(1, self.outer_iter + 1):
 
-#                if maths.norm(w_old[i] - w[i]) < self.eps:
-#                    converged = True
-#                    break
+                stalled = _update_blocks(algorithms, funcs, w, self.jacobi,
+                                         pool)
 
-                if self.info_requested(Info.time):
-                    t = t + tval
-                if self.info_requested(Info.fvalue):
-                    f = f + fval
+                for i in xrange(len(w)):
+                    algorithm = algorithms[i]
+                    num_iter[i] += algorithm.num_iter
 
-                print "l0 :", maths.norm0(w[i]), \
-                    ", l1 :", maths.norm1(w[i]), \
-                    ", l2²:", maths.norm(w[i]) ** 2.0
+                    if self.info_requested(Info.time):
+                        t = t + algorithm.info_get(Info.time)
+                    if self.info_requested(Info.fvalue):
+                        f = f + algorithm.info_get(Info.fvalue)
 
-            if self.algorithm.info_requested(Info.fvalue):
-                print "f:", fval[-1]
+                    _log(self.logger, "it: %d, i: %d, l0: %d, l1: %g, "
+                                      "l2²: %g", it, i, maths.norm0(w[i]),
+                         maths.norm1(w[i]), maths.norm(w[i]) ** 2.0)
 
-            for i in xrange(len(w)):
+                if _converged(function, w, stalled, self.eps, self.min_iter):
+                    _log(self.logger, "All converged!")
 
-                # Take one ISTA step for use in the stopping criterion.
-                step = function.step(w, i)
-                w_tilde = function.prox(w[:i] +
-                                        [w[i] - step * function.grad(w, i)] +
-                                        w[i + 1:], i, step)
+                    if self.info_requested(Info.converged):
+                        self.info_set(Info.converged, True)
 
-#                func = mb_losses.MultiblockFunctionWrapper(function, w, i)
-#                step2 = func.step(w[i])
-#                w_tilde2 = func.prox(w[i] - step2 * func.grad(w[i]), step2)
-#
-#                print "diff:", maths.norm(w_tilde - w_tilde2)
-
-#                print "err:", maths.norm(w[i] - w_tilde) * (1.0 / step)
-                if maths.norm(w[i] - w_tilde) > step * self.eps:
-                    all_converged = False
                     break
-
-            if all_converged:
-                print "All converged!"
-
-                if self.info_requested(Info.converged):
-                    self.info_set(Info.converged, True)
-
-                break
-
-#            # If all blocks have used max_iter iterations, stop.
-#            if np.all(np.asarray(num_iter) >= self.max_iter):
-#                break
-
-#            it += 1
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
         if self.info_requested(Info.num_iter):
             self.info_set(Info.num_iter, num_iter)
@@ -285,6 +292,22 @@ class MultiblockCONESTA(bases.ExplicitAlgorithm,
 
     min_iter : Non-negative integer. Number of required iterations. Default
             is 1.
+
+    jacobi : Boolean. Whether to update all blocks simultaneously, from the
+            weight vectors of the previous outer iteration (Jacobi), or one
+            after the other, using the most recent weight vectors
+            (Gauss-Seidel). Default is False, the Gauss-Seidel order.
+
+    num_workers : Positive integer. The number of blocks to update in
+            parallel when jacobi is True. Default is 1, update the blocks one
+            at a time.
+
+    use_processes : Boolean. Whether to use a pool of processes instead of a
+            pool of threads when num_workers > 1. The threads share the
+            function, whose smoothing is never changed. Default is False.
+
+    logger : logging.Logger. Progress information is logged to this logger.
+            Default is None, which means that nothing is logged.
     """
     INTERFACES = [multiblock_properties.MultiblockFunction,
                   multiblock_properties.MultiblockGradient,
@@ -300,7 +323,9 @@ class MultiblockCONESTA(bases.ExplicitAlgorithm,
     def __init__(self, mu_start=None, mu_min=consts.TOLERANCE,
                  tau=0.5, outer_iter=20,
                  info=[], eps=consts.TOLERANCE,
-                 max_iter=consts.MAX_ITER, min_iter=1):
+                 max_iter=consts.MAX_ITER, min_iter=1,
+                 jacobi=False, num_workers=1, use_processes=False,
+                 logger=None):
 
         super(MultiblockCONESTA, self).__init__(info=info,
                                                 max_iter=max_iter,
@@ -309,15 +334,17 @@ class MultiblockCONESTA(bases.ExplicitAlgorithm,
         self.outer_iter = outer_iter
         self.eps = eps
 
+        self.jacobi = bool(jacobi)
+        self.num_workers = max(1, int(num_workers))
+        self.use_processes = bool(use_processes)
+        self.logger = logger
+
         # Copy the allowed info keys for FISTA.
-        from parsimony.algorithms.proximal import FISTA
         from parsimony.algorithms.primaldual import NaiveCONESTA
         alg_info = []
         for nfo in self.info_copy():
             if nfo in FISTA.INFO_PROVIDED:
                 alg_info.append(nfo)
-#        if not self.alg_info.allows(consts.Info.num_iter):
-#            self.alg_info.add_key(consts.Info.num_iter)
         if Info.converged not in alg_info:
             alg_info.append(Info.converged)
 
@@ -338,8 +365,6 @@ class MultiblockCONESTA(bases.ExplicitAlgorithm,
     @bases.check_compatibility
     def run(self, function, w):
 
-#        self.info.clear()
-
         if self.info_requested(Info.ok):
             self.info_set(Info.ok, False)
         if self.info_requested(Info.time):
@@ -349,84 +374,68 @@ class MultiblockCONESTA(bases.ExplicitAlgorithm,
         if self.info_requested(Info.converged):
             self.info_set(Info.converged, False)
 
-        print "len(w):", len(w)
-        print "max_iter:", self.max_iter
+        _log(self.logger, "len(w): %d, max_iter: %d", len(w), self.max_iter)
+
+        # The wrappers and inner algorithms are created once, and reused in
+        # all outer iterations.
+        funcs = []
+        fista_blocks = []
+        conesta_blocks = []
+        for i in xrange(len(w)):
+            if function.has_nesterov_function(i):
+                _log(self.logger, "Block %d has a Nesterov function!", i)
+                funcs.append(mb_losses.MultiblockNesterovFunctionWrapper(
+                                                               function, w, i))
+                conesta_blocks.append(i)
+            else:
+                funcs.append(mb_losses.MultiblockFunctionWrapper(function,
+                                                                 w, i))
+                fista_blocks.append(i)
+        fistas = _block_algorithms(self.fista, len(w), self.jacobi)
+        conestas = _block_algorithms(self.conesta, len(w), self.jacobi)
+        algorithms = [conestas[i] if i in conesta_blocks else fistas[i]
+                      for i in xrange(len(w))]
+
+        pool = _pool(self.jacobi, self.num_workers, self.use_processes)
+        _fill_caches(function, w, pool)
 
         num_iter = [0] * len(w)
+        try:
+            for it in xrange(1, self.outer_iter + 1):
 
-        for it in xrange(1, self.outer_iter + 1):
-
-            all_converged = True
-
-            for i in xrange(len(w)):
-                print "it: %d, i: %d" % (it, i)
-
-                if function.has_nesterov_function(i):
-                    print "Block %d has a Nesterov function!" % (i,)
-                    func = mb_losses.MultiblockNesterovFunctionWrapper(
-                                                               function, w, i)
-                    algorithm = self.conesta
-                else:
-                    func = mb_losses.MultiblockFunctionWrapper(function, w, i)
-                    algorithm = self.fista
-
-#                self.alg_info.clear()
-#                self.algorithm.set_params(max_iter=self.max_iter - num_iter[i])
-#                w[i] = self.algorithm.run(func, w_old[i])
-                if i == 1:
-                    pass
-                w[i] = algorithm.run(func, w[i])
-
-                if algorithm.info_requested(Info.num_iter):
-                    num_iter[i] += algorithm.info_get(Info.num_iter)
-                if algorithm.info_requested(Info.time):
-                    tval = algorithm.info_get(Info.time)
-                if algorithm.info_requested(Info.fvalue):
-                    fval = algorithm.info_get(Info.fvalue)
-
-                if self.info_requested(Info.time):
-                    t = t + tval
-                if self.info_requested(Info.fvalue):
-                    f = f + fval
-
-                print "l0 :", maths.norm0(w[i]), \
-                    ", l1 :", maths.norm1(w[i]), \
-                    ", l2²:", maths.norm(w[i]) ** 2.0
-
-            print "f:", fval[-1]
-
-            for i in xrange(len(w)):
-
-                # Take one ISTA step for use in the stopping criterion.
-                step = function.step(w, i)
-                w_tilde = function.prox(w[:i] +
-                                        [w[i] - step * function.grad(w, i)] +
-                                        w[i + 1:], i, step)
-
-#                func = mb_losses.MultiblockFunctionWrapper(function, w, i)
-#                step2 = func.step(w[i])
-#                w_tilde2 = func.prox(w[i] - step2 * func.grad(w[i]), step2)
-#
-#                print "diff:", maths.norm(w_tilde - w_tilde2)
+                stalled = _update_blocks(algorithms, funcs, w, self.jacobi,
+                                         pool)
+                # The stopping criterion of CONESTA is not an ISTA step from
+                # the start vector, so these blocks are always checked.
+                for i in conesta_blocks:
+                    stalled[i] = None
 
-                print "err:", maths.norm(w[i] - w_tilde) * (1.0 / step)
-                if (1.0 / step) * maths.norm(w[i] - w_tilde) > self.eps:
-                    all_converged = False
-                    break
+                for i in xrange(len(w)):
+                    algorithm = algorithms[i]
+                    if algorithm.info_requested(Info.num_iter):
+                        num_iter[i] += algorithm.info_get(Info.num_iter)
 
-            if all_converged:
-                print "All converged!"
+                    if self.info_requested(Info.time):
+                        t = t + algorithm.info_get(Info.time)
+                    if self.info_requested(Info.fvalue):
+                        fval = algorithm.info_get(Info.fvalue)
+                        f = f + fval
 
-                if self.info_requested(Info.converged):
-                    self.info_set(Info.converged, True)
+                    _log(self.logger, "it: %d, i: %d, l0: %d, l1: %g, "
+                                      "l2²: %g", it, i, maths.norm0(w[i]),
+                         maths.norm1(w[i]), maths.norm(w[i]) ** 2.0)
 
-                break
+                if _converged(function, w, stalled, self.eps, self.min_iter):
+                    _log(self.logger, "All converged!")
 
-#            # If all blocks have used max_iter iterations, stop.
-#            if np.all(np.asarray(num_iter) >= self.max_iter):
-#                break
+                    if self.info_requested(Info.converged):
+                        self.info_set(Info.converged, True)
 
-#            it += 1
+                    break
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
         if self.info_requested(Info.num_iter):
             self.info_set(Info.num_iter, num_iter)
@@ -439,6 +448,129 @@ class MultiblockCONESTA(bases.ExplicitAlgorithm,
 
         return w
 
+
+def _log(logger, msg, *args):
+
+    if logger is not None:
+        logger.info(msg, *args)
+
+
+def _block_algorithms(algorithm, num_blocks, jacobi):
+    """Returns the inner algorithm to use for each block.
+
+    The blocks share the algorithm when they are updated one after the other,
+    but need their own copies when they are updated simultaneously, since the
+    algorithms store information about their runs.
+    """
+    if jacobi:
+        return [copy.deepcopy(algorithm) for i in xrange(num_blocks)]
+    else:
+        return [algorithm] * num_blocks
+
+
+def _pool(jacobi, num_workers, use_processes):
+
+    if not jacobi or num_workers <= 1:
+        return None
+    elif use_processes:
+        return multiprocessing.Pool(num_workers)
+    else:
+        return multiprocessing.pool.ThreadPool(num_workers)
+
+
+def _fill_caches(function, w, pool):
+    """Fills the lazily computed caches of the function (e.g. the
+    cross-products of the blocks) before the threads of a pool share it.
+    """
+    if isinstance(pool, multiprocessing.pool.ThreadPool):
+        function.f(w)
+
+
+def _update_blocks(algorithms, funcs, w, jacobi, pool):
+    """Updates all blocks once, in place in w.
+
+    Returns, for each block, whether the inner algorithm stopped in its first
+    iteration, i.e. whether the block was already at a fixed point of the
+    ISTA step. This is None if it is unknown.
+
+    In the Gauss-Seidel order, only the last block was run with the final
+    weight vectors of all other blocks, so for the other blocks a stop in the
+    first iteration is only reported as unknown.
+    """
+    num_blocks = len(w)
+
+    if jacobi:
+        # All blocks are updated from the same, previous, weight vectors.
+        w_old = list(w)
+        for func in funcs:
+            func.w = w_old
+
+        tasks = [(algorithms[i], funcs[i], w_old[i])
+                 for i in xrange(num_blocks)]
+        if pool is None:
+            results = map(_run_block, tasks)
+        else:
+            results = pool.map(_run_block, tasks)
+
+        for i in xrange(num_blocks):
+            w[i], algorithm = results[i]
+            # Process pools return copies of the algorithms.
+            if algorithm is not algorithms[i]:
+                algorithms[i] = algorithm
+
+            funcs[i].w = w
+
+    else:
+        stalled = [False] * num_blocks
+        for i in xrange(num_blocks):
+            # The wrappers refer to w, and thus see the updated blocks.
+            w[i] = algorithms[i].run(funcs[i], w[i])
+            stalled[i] = _stalled(algorithms[i])
+            # The following blocks may still move this block's fixed point.
+            if i < num_blocks - 1 and stalled[i]:
+                stalled[i] = None
+
+        return stalled
+
+    return [_stalled(algorithm) for algorithm in algorithms]
+
+
+def _stalled(algorithm):
+
+    if not algorithm.info_requested(Info.converged):
+        return None
+
+    return algorithm.num_iter <= 1 and algorithm.info_get(Info.converged)
+
+
+def _converged(function, w, stalled, eps, min_iter):
+    """Checks whether all blocks are at a fixed point of the ISTA step.
+
+    A block whose inner algorithm stopped in the first iteration, at the
+    final weight vectors of the other blocks, already passed this test, and
+    a block whose inner algorithm needed more than one iteration did not, so
+    the gradient is only recomputed for the remaining blocks (if any).
+    """
+    if min_iter <= 1:
+        for i in xrange(len(w)):
+            if stalled[i] is False:
+                return False
+
+    for i in xrange(len(w)):
+        if min_iter <= 1 and stalled[i]:
+            continue
+
+        # Take one ISTA step for use in the stopping criterion.
+        step = function.step(w, i)
+        w_tilde = function.prox(w[:i] +
+                                [w[i] - step * function.grad(w, i)] +
+                                w[i + 1:], i, step)
+
+        if maths.norm(w[i] - w_tilde) > step * eps:
+            return False
+
+    return True
+
 if __name__ == "__main__":
     import doctest
-    doctest.testmod()
\ No newline at end of file
+    doctest.testmod()
@@ -27,7 +27,8 @@ import parsimony.utils.consts as consts
 import parsimony.utils.start_vectors as start_vectors
 import parsimony.functions.penalties as penalties
 
-__all__ = ["FastSVD", "FastSparseSVD", "FastSVDProduct", "PLSR"]
+__all__ = ["FastSVD", "FastSparseSVD", "FastSVDProduct", "PLSR",
+           "SparsePLSR", "BlockPLSR", "SparseBlockPLSR"]
 
 # TODO: Add information about the run.
 
@@ -498,6 +499,246 @@ class SparsePLSR(bases.ImplicitAlgorithm,
         return w_new, c
 
 
+class BlockPLSR(bases.ImplicitAlgorithm,
+                bases.IterativeAlgorithm):
+    """A kernel NIPALS implementation for PLS regression, that computes all K
+    components in one call.
+
+    The cross-product S = X'Y is computed once, with a matrix-matrix product.
+    The NIPALS iterations of every component are then performed on the
+    deflated cross-product, S_k = X_k'Y, and cost O(pq) instead of
+    O(n(p + q)). Instead of X, S is deflated, by a rank-one update, as in the
+    improved kernel algorithm of Dayal and MacGregor (1997).
+
+    The weight vectors are the same as those of PLSR with a deflated X, i.e.
+    as computed one at a time by PLSRegression. The number of non-zero
+    components is thus limited by the rank of X, and not by min(p, q).
+
+    Parameters
+    ----------
+    max_iter : Non-negative integer. Maximum allowed number of iterations for
+            every component. Default is 200.
+
+    eps : Positive float. The tolerance used in the stopping criterion.
+
+    Examples
+    --------
+    >>> from parsimony.algorithms.nipals import BlockPLSR, PLSR
+    >>> import numpy as np
+    >>> np.random.seed(42)
+    >>>
+    >>> X = np.random.rand(10, 10)
+    >>> Y = np.random.rand(10, 5)
+    >>> plsr = BlockPLSR()
+    >>> W, C = plsr.run([X, Y], 3)
+    >>> W.shape, C.shape
+    ((10, 3), (5, 3))
+    >>> w, c = PLSR().run([X, Y])
+    >>> np.linalg.norm(W[:, [0]] - w) < 5e-10
+    True
+    >>> np.allclose(np.dot(W.T, W), np.eye(3))
+    True
+    """
+    def __init__(self, max_iter=200, eps=consts.TOLERANCE, **kwargs):
+
+        super(BlockPLSR, self).__init__(max_iter=max_iter, **kwargs)
+
+        self.eps = max(consts.TOLERANCE, float(eps))
+
+    def run(self, XY, K, W=None):
+        """A kernel NIPALS implementation for PLS regression.
+
+        Parameters
+        ----------
+        XY : List of two numpy arrays. XY[0] is n-by-p and XY[1] is n-by-q. The
+                independent and dependent variables.
+
+        K : Positive integer. The number of components to compute.
+
+        W : Numpy array, p-by-K. The start vectors. Optional; default is to
+                use, as PLSR, the column of X_k'Y that corresponds to the
+                column of Y with the largest norm.
+
+        Returns
+        -------
+        W : Numpy array, p-by-K. The weight vectors of X.
+
+        C : Numpy array, q-by-K. The weight vectors of Y.
+        """
+        X = XY[0]
+        Y = XY[1]
+
+        S = np.dot(X.T, Y)
+        p, q = S.shape
+        K = max(1, int(K))
+        maxi = np.argmax(np.sum(Y ** 2.0, axis=0))
+
+        W_ = np.zeros((p, K))
+        C_ = np.zeros((q, K))
+        R = np.zeros((p, K))  # Weights of the undeflated X, t_k = X.r_k.
+        P = np.zeros((p, K))
+        self.num_iter = 0
+        for k in range(K):
+
+            if W is not None:
+                w = W[:, [k]]
+            else:
+                w = S[:, [maxi]]
+            normw = maths.norm(w)
+            if normw < consts.TOLERANCE:
+                break  # X_k'Y is zero, and so are all following components.
+            w = self._component(S, w / normw)
+
+            r = w - np.dot(R[:, :k], np.dot(P[:, :k].T, w))
+            t = np.dot(X, r)
+            tt = np.dot(t.T, t)[0, 0]
+            if tt < consts.TOLERANCE:
+                break
+            p_k = np.dot(X.T, t) / tt
+            c = np.dot(S.T, w) / tt  # Y't / t't, since S = X_k'Y.
+
+            W_[:, [k]] = w
+            C_[:, [k]] = self._output_c(c)
+            R[:, [k]] = r
+            P[:, [k]] = p_k
+
+            # X_{k+1}'Y = X_k'Y - p_k.t'Y.
+            S = S - np.dot(p_k, np.dot(t.T, Y))
+
+        return W_, C_
+
+    def _component(self, S, w_new):
+        """The NIPALS iterations of one component, with c = S'w and w = S.c.
+        """
+        for i in range(self.max_iter):
+            w = w_new
+
+            c = np.dot(S.T, w)
+            w_new = np.dot(S, c)
+            normw = maths.norm(w_new)
+            if normw > 10.0 * consts.FLOAT_EPSILON:
+                w_new /= normw
+
+            if maths.norm(w_new - w) < maths.norm(w) * self.eps:
+                break
+
+        self.num_iter += i + 1
+
+        return w_new
+
+    def _output_c(self, c):
+
+        return c
+
+
+class SparseBlockPLSR(BlockPLSR):
+    """A kernel NIPALS implementation for sparse PLS regression, that computes
+    all K components in one call.
+
+    The NIPALS iterations of SparsePLSR are performed on the deflated
+    cross-product, S_k = X_k'Y, as in BlockPLSR. The weight vectors are thus
+    the same as those of SparsePLSR with a deflated X.
+
+    Parameters
+    ----------
+    l : List or tuple of two non-negative floats. The Lagrange multipliers, or
+            regularisation constants, for the X and Y blocks, respectively.
+
+    penalise_y : Bool. Whether or not to penalise the Y block as well.
+
+    max_iter : Non-negative integer. Maximum allowed number of iterations for
+            every component. Default is 200.
+
+    eps : Positive float. The tolerance used in the stopping criterion.
+
+    Examples
+    --------
+    >>> from parsimony.algorithms.nipals import SparseBlockPLSR, SparsePLSR
+    >>> import numpy as np
+    >>> np.random.seed(0)
+    >>>
+    >>> X = np.random.randn(50, 30)
+    >>> Y = np.dot(X[:, :8], np.random.randn(8, 6)) + np.random.randn(50, 6)
+    >>> plsr = SparseBlockPLSR(l=[30.0, 0.0])
+    >>> W, C = plsr.run([X, Y], 3)
+    >>> np.sum(W == 0.0, axis=0)
+    array([14, 20, 24])
+    >>> w, c = SparsePLSR(l=[30.0, 0.0]).run([X, Y])
+    >>> np.linalg.norm(W[:, [0]] - w) < 5e-10
+    True
+    """
+    def __init__(self, l=[0.0, 0.0], penalise_y=True, max_iter=200,
+                 eps=consts.TOLERANCE, **kwargs):
+
+        super(SparseBlockPLSR, self).__init__(max_iter=max_iter, eps=eps,
+                                              **kwargs)
+
+        self.l = [max(0.0, float(l[0])),
+                  max(0.0, float(l[1]))]
+
+        self.penalise_y = bool(penalise_y)
+
+    def run(self, XY, K, W=None):
+        """A kernel NIPALS implementation for sparse PLS regression.
+
+        Parameters
+        ----------
+        XY : List of two numpy arrays. XY[0] is n-by-p and XY[1] is n-by-q. The
+                independent and dependent variables.
+
+        K : Positive integer. The number of components to compute.
+
+        W : Numpy array, p-by-K. The start vectors. Optional; default is to
+                use, as SparsePLSR, the column of X_k'Y that corresponds to
+                the column of Y with the largest norm.
+
+        Returns
+        -------
+        W : Numpy array, p-by-K. The weight vectors of X.
+
+        C : Numpy array, q-by-K. The normalised weight vectors of Y.
+        """
+        return super(SparseBlockPLSR, self).run(XY, K, W=W)
+
+    def _component(self, S, w_new):
+        """The NIPALS iterations of SparsePLSR for one component, with
+        c = S'w and w = S.c.
+        """
+        l1_1 = penalties.L1(l=self.l[0])
+        l1_2 = penalties.L1(l=self.l[1])
+
+        for i in range(self.max_iter):
+            w = w_new
+
+            c = np.dot(S.T, w)
+            if self.penalise_y:
+                c = l1_2.prox(c)
+                normc = maths.norm(c)
+                if normc > consts.TOLERANCE:
+                    c /= normc
+
+            w_new = np.dot(S, c)
+            w_new = l1_1.prox(w_new)
+            normw = maths.norm(w_new)
+            if normw > consts.TOLERANCE:
+                w_new /= normw
+
+            if maths.norm(w_new - w) < self.eps * maths.norm(w):
+                break
+
+        self.num_iter += i + 1
+
+        return w_new
+
+    def _output_c(self, c):
+
+        normc = maths.norm(c)
+        if normc > consts.TOLERANCE:
+            c = c / normc
+
+        return c
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
\ No newline at end of file
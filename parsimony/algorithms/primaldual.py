@@ -18,6 +18,9 @@ Copyright (c) 2013-2014, CEA/DSV/I2BM/Neurospin. All rights reserved.
 @license: BSD 3-clause.
 """
 import numpy as np
+import scipy.linalg
+import scipy.sparse as sparse
+import scipy.sparse.linalg as sparse_linalg
 
 try:
     from . import bases  # Only works when imported as a package.
@@ -26,13 +29,15 @@ except ValueError:
 import parsimony.utils as utils
 import parsimony.utils.maths as maths
 import parsimony.utils.consts as consts
-from parsimony.algorithms.utils import Info
+from parsimony.algorithms.utils import Info, ContinuationSchedule
 import parsimony.functions.properties as properties
+import parsimony.functions.losses as losses
 import parsimony.functions.nesterov.properties as nesterov_properties
+from parsimony.functions.combinedfunctions import FixedMuFunction
 from proximal import FISTA
 
 __all__ = ["CONESTA", "StaticCONESTA", "DynamicCONESTA", "NaiveCONESTA",
-           "ExcessiveGapMethod"]
+           "ExcessiveGapMethod", "ChambollePock", "ADMM"]
 
 
 class CONESTA(bases.ExplicitAlgorithm,
@@ -41,6 +46,16 @@ class CONESTA(bases.ExplicitAlgorithm,
     """COntinuation with NEsterov smoothing in a Soft-Thresholding Algorithm,
     or CONESTA for short.
 
+    The function must have a method continuation_constants(), from which a
+    ContinuationSchedule is computed once per run. The step sizes and the
+    values of mu and eps are then computed without changing the function.
+
+    The smoothing parameter is passed explicitly to the function, through a
+    FixedMuFunction, so the mu of the function is never changed. The same
+    function may therefore be minimised concurrently, e.g. for different
+    start vectors, by several threads, if its loss may be evaluated
+    concurrently (see FixedMuFunction).
+
     Parameters
     ----------
     mu_start : Non-negative float. An optional initial value of mu.
@@ -64,6 +79,16 @@ class CONESTA(bases.ExplicitAlgorithm,
 
     min_iter : Non-negative integer less than or equal to max_iter. Minimum
             number of iterations that must be performed. Default is 1.
+
+    backtrack : Boolean. Whether the inner FISTA searches for the step size.
+            See FISTA. Default is False.
+
+    restart : None or string. The adaptive restart of the momentum of the
+            inner FISTA, None, "gradient" or "function". See FISTA. Default is
+            None.
+
+    strongly_convex : Boolean. Whether the inner FISTA uses the momentum for
+            strongly convex functions. See FISTA. Default is False.
     """
     INTERFACES = [nesterov_properties.NesterovFunction,
                   properties.Gradient,
@@ -84,7 +109,8 @@ class CONESTA(bases.ExplicitAlgorithm,
                  tau=0.5, dynamic=False,
 
                  eps=consts.TOLERANCE,
-                 info=[], max_iter=10000, min_iter=1):
+                 info=[], max_iter=10000, min_iter=1,
+                 backtrack=False, restart=None, strongly_convex=False):
 
         super(CONESTA, self).__init__(info=info,
                                       max_iter=max_iter,
@@ -111,6 +137,10 @@ class CONESTA(bases.ExplicitAlgorithm,
 
         self.eps = eps
 
+        self.backtrack = backtrack
+        self.restart = restart
+        self.strongly_convex = strongly_convex
+
     @bases.force_reset
     @bases.check_compatibility
     def run(self, function, beta):
@@ -125,23 +155,28 @@ class CONESTA(bases.ExplicitAlgorithm,
         # Create the inner algorithm.
         algorithm = FISTA(eps=self.eps,
                           max_iter=self.max_iter, min_iter=self.min_iter,
-                          info=fista_info)
+                          info=fista_info,
+                          backtrack=self.backtrack,
+                          restart=self.restart,
+                          strongly_convex=self.strongly_convex)
 
         if self.info_requested(Info.ok):
             self.info_set(Info.ok, False)
 
+        schedule = ContinuationSchedule(*function.continuation_constants())
+
         if self.mu_start is None:
             mu = [function.estimate_mu(beta)]
         else:
             mu = [self.mu_start]
 
-        function.set_mu(self.mu_min)
-        tmin = function.step(beta)
-        function.set_mu(mu[0])
+        # A local copy, so that the algorithm is not changed by the run.
+        mu_min = self.mu_min
+        tmin = schedule.step(mu_min)
 
-        max_eps = function.eps_max(mu[0])
+        max_eps = schedule.eps_max(mu[0])
 
-        G = min(max_eps, function.eps_opt(mu[0]))
+        G = min(max_eps, schedule.eps_opt(mu[0]))
 
         if self.info_requested(Info.time):
             t = []
@@ -156,8 +191,8 @@ class CONESTA(bases.ExplicitAlgorithm,
         while True:
             stop = False
 
-            tnew = function.step(beta)
-            eps_plus = min(max_eps, function.eps_opt(mu[-1]))
+            tnew = schedule.step(mu[-1])
+            eps_plus = min(max_eps, schedule.eps_opt(mu[-1]))
 #            print "current iterations: ", self.num_iter, \
 #                    ", iterations left: ", self.max_iter - self.num_iter
             algorithm.set_params(step=tnew, eps=eps_plus,
@@ -165,7 +200,7 @@ class CONESTA(bases.ExplicitAlgorithm,
                                  conesta_stop=None)
 #                                      conesta_stop=[self.mu_min])
 #            self.fista_info.clear()
-            beta = algorithm.run(function, beta)
+            beta = algorithm.run(FixedMuFunction(function, mu[-1]), beta)
             #print "CONESTA loop", i, "FISTA=",self.fista_info[Info.num_iter], "TOT iter:", self.num_iter
 
             self.num_iter += algorithm.num_iter
@@ -175,13 +210,13 @@ class CONESTA(bases.ExplicitAlgorithm,
             if Info.fvalue in algorithm.info:
                 fval = algorithm.info_get(Info.fvalue)
 
-            self.mu_min = min(self.mu_min, mu[-1])
+            mu_min = min(mu_min, mu[-1])
             tmin = min(tmin, tnew)
-            old_mu = function.set_mu(self.mu_min)
-            # Take one ISTA step for use in the stopping criterion.
-            beta_tilde = function.prox(beta - tmin * function.grad(beta),
+            # Take one ISTA step, with mu = mu_min, for use in the stopping
+            # criterion.
+            beta_tilde = function.prox(beta - tmin * function.grad(beta,
+                                                                   mu=mu_min),
                                        tmin)
-            function.set_mu(old_mu)
 
             if (1.0 / tmin) * maths.norm(beta - beta_tilde) < self.eps:
 
@@ -224,13 +259,12 @@ class CONESTA(bases.ExplicitAlgorithm,
             if (G <= consts.TOLERANCE and mu[-1] <= consts.TOLERANCE) or stop:
                 break
 
-            mu_new = min(mu[-1], function.mu_opt(G))
-            self.mu_min = min(self.mu_min, mu_new)
+            mu_new = min(mu[-1], schedule.mu_opt(G))
+            mu_min = min(mu_min, mu_new)
             if self.info_requested(Info.mu):
-                mu = mu + [max(self.mu_min, mu_new)] * len(fval)
+                mu = mu + [max(mu_min, mu_new)] * len(fval)
             else:
-                mu.append(max(self.mu_min, mu_new))
-            function.set_mu(mu_new)
+                mu.append(max(mu_min, mu_new))
 
             i = i + 1
 
@@ -358,9 +392,10 @@ class NaiveCONESTA(bases.ExplicitAlgorithm,
         # We use 2x as in Chen et al. (2012).
         eps = 2.0 * function.eps_max(mu)
 
-        function.set_mu(self.mu_min)
-        tmin = function.step(beta)
-        function.set_mu(mu)
+        # The smoothing parameter is passed explicitly, the mu of the function
+        # is never changed.
+        tmin = function.step(beta, mu=self.mu_min)
+        mu_k = mu
 
         if self.info_requested(Info.mu):
             mu = [mu]
@@ -374,11 +409,11 @@ class NaiveCONESTA(bases.ExplicitAlgorithm,
 
         i = 0
         while True:
-            tnew = function.step(beta)
+            tnew = function.step(beta, mu=mu_k)
             self.algorithm.set_params(step=tnew, eps=eps,
                                       max_iter=self.max_iter - self.num_iter)
 #            self.fista_info.clear()
-            beta = self.algorithm.run(function, beta)
+            beta = self.algorithm.run(FixedMuFunction(function, mu_k), beta)
 
             self.num_iter += self.algorithm.num_iter
 
@@ -392,11 +427,11 @@ class NaiveCONESTA(bases.ExplicitAlgorithm,
             if self.info_requested(Info.fvalue):
                 f = f + fval
 
-            old_mu = function.set_mu(self.mu_min)
-            # Take one ISTA step for use in the stopping criterion.
-            beta_tilde = function.prox(beta - tmin * function.grad(beta),
+            # Take one ISTA step, with mu = mu_min, for use in the stopping
+            # criterion.
+            beta_tilde = function.prox(beta - tmin * function.grad(beta,
+                                                            mu=self.mu_min),
                                        tmin)
-            function.set_mu(old_mu)
 
             if (1.0 / tmin) * maths.norm(beta - beta_tilde) < self.eps:
 
@@ -413,16 +448,13 @@ class NaiveCONESTA(bases.ExplicitAlgorithm,
 #            if eps <= consts.TOLERANCE:
 #                break
 
+            mu_k = max(self.mu_min, self.tau * mu_k)
             if self.info_requested(Info.mu):
-                mu_new = max(self.mu_min, self.tau * mu[-1])
-                mu = mu + [mu_new] * len(fval)
-
+                mu = mu + [mu_k] * len(fval)
             else:
-                mu_new = max(self.mu_min, self.tau * mu)
-                mu = mu_new
+                mu = mu_k
 
-            print "eps:", eps, ", mu:", mu_new
-            function.set_mu(mu_new)
+            print "eps:", eps, ", mu:", mu_k
 
             i = i + 1
 
@@ -514,7 +546,6 @@ class ExcessiveGapMethod(bases.ExplicitAlgorithm,
         if L < consts.TOLERANCE:
             L = consts.TOLERANCE
         mu = [2.0 * L]
-        function.set_mu(mu)
         if beta is not None:
             beta0 = beta
         else:
@@ -538,8 +569,7 @@ class ExcessiveGapMethod(bases.ExplicitAlgorithm,
 
             tau = 2.0 / (float(k) + 3.0)
 
-            function.set_mu(mu[k])
-            alpha_hat = function.alpha(beta)
+            alpha_hat = function.alpha(beta, mu=mu[k])
             for i in xrange(len(alpha_hat)):
                 u[i] = (1.0 - tau) * alpha[i] + tau * alpha_hat[i]
 
@@ -553,10 +583,7 @@ class ExcessiveGapMethod(bases.ExplicitAlgorithm,
             if self.info_requested(Info.time):
                 t.append(utils.time_cpu() - tm)
             if self.info_requested(Info.fvalue):
-                mu_old = function.get_mu()
-                function.set_mu(0.0)
                 f.append(function.f(beta))
-                function.set_mu(mu_old)
             if self.info_requested(Info.bound):
 #                bound.append(2.0 * function.M() * mu[0] \
 #                        / ((float(k) + 1.0) * (float(k) + 2.0)))
@@ -591,6 +618,621 @@ class ExcessiveGapMethod(bases.ExplicitAlgorithm,
 
         return beta
 
+
+class ChambollePock(bases.ExplicitAlgorithm,
+                    bases.IterativeAlgorithm,
+                    bases.InformationAlgorithm):
+    """A primal-dual splitting method (Chambolle-Pock, with the extension of
+    Condat and Vu to a smooth term) for the non-smoothed problem
+
+        min. g(beta) + h(beta) + s(beta),
+
+    where g is a smooth loss, h has a proximal operator (e.g. L1) and
+
+        s(beta) = max_{alpha in K} alpha'K.beta
+
+    is a Nesterov function, e.g. TotalVariation or GroupLassoOverlap, with
+    K = l.A. The function must have a method split() that returns the three
+    terms (see e.g. LinearRegressionL1L2TV.split), and the loss must be a
+    RidgeRegression, since the dual function is computed in closed form.
+
+    No smoothing is used. Every iteration takes one proximal gradient step on
+    beta and one projected step on alpha,
+
+        beta+ = prox_{T.h}(beta - T.(grad(g(beta)) + K'alpha)),
+        alpha+ = proj_K(alpha + S.K.(2.beta+ - beta)),
+
+    with diagonal step sizes, T and S, computed from the absolute row and
+    column sums of K (Pock and Chambolle, 2011), and the Lipschitz constant of
+    grad(g). The step of alpha is constant within the groups of the
+    projection, so that the projection is still the Euclidean projection.
+
+    The duality gap is computed for the current iterates and for the ergodic
+    (running mean) iterates. The algorithm stops when either of them is less
+    than eps, and returns the corresponding beta. The dual function is
+    computed through the method betahat of the function (from the interface
+    "DualFunction"), which solves a problem without the Nesterov function.
+    A gap that is negative, beyond rounding errors, means that the dual
+    function is wrong, and is never taken as convergence.
+    This costs much more than an iteration, so the gap is computed after
+    gap_every iterations, and then with intervals that grow by a quarter of
+    the number of iterations.
+
+    Parameters
+    ----------
+    eps : Positive float. Tolerance for the stopping criterion, the duality
+            gap.
+
+    info : List or tuple of utils.consts.Info. What, if any, extra run
+            information should be stored. Default is an empty list, which means
+            that no run information is computed nor returned.
+
+    max_iter : Non-negative integer. Maximum allowed number of iterations.
+
+    min_iter : Non-negative integer less than or equal to max_iter. Minimum
+            number of iterations that must be performed. Default is 1.
+
+    gap_every : Positive integer. The smallest number of iterations between
+            the computations of the duality gap. Default is 10.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import parsimony.functions as functions
+    >>> import parsimony.functions.nesterov.tv as tv
+    >>> from parsimony.algorithms.primaldual import ChambollePock
+    >>> from parsimony.algorithms.utils import Info
+    >>>
+    >>> np.random.seed(42)
+    >>> X = np.random.rand(50, 20)
+    >>> y = np.random.rand(50, 1)
+    >>> A, _ = tv.A_from_shape((4, 5))
+    >>> function = functions.LinearRegressionL1L2TV(X, y, 0.1, 0.05, 0.1, A=A)
+    >>> cp = ChambollePock(eps=1e-6, max_iter=10000,
+    ...                    info=[Info.converged, Info.gap])
+    >>> beta = cp.run(function, np.zeros((20, 1)))
+    >>> cp.info_get(Info.converged)
+    True
+    >>> cp.info_get(Info.gap)[-1] < 1e-6
+    True
+    """
+    INTERFACES = [nesterov_properties.NesterovFunction,
+                  properties.ProximalOperator,
+                  properties.DualFunction]
+
+    INFO_PROVIDED = [Info.ok,
+                     Info.num_iter,
+                     Info.time,
+                     Info.fvalue,
+                     Info.gap,
+                     Info.converged]
+
+    def __init__(self, eps=consts.TOLERANCE,
+                 info=[], max_iter=10000, min_iter=1, gap_every=10):
+
+        super(ChambollePock, self).__init__(info=info,
+                                            max_iter=max_iter,
+                                            min_iter=min_iter)
+
+        self.eps = eps
+        self.gap_every = max(1, int(gap_every))
+
+    @bases.force_reset
+    @bases.check_compatibility
+    def run(self, function, beta):
+        """Find the minimiser of the given function, starting at beta.
+
+        Parameters
+        ----------
+        function : Function. The function to minimise. Must have a method
+                split().
+
+        beta : Numpy array. The start vector.
+        """
+        if self.info_requested(Info.ok):
+            self.info_set(Info.ok, False)
+
+        loss, penalty, nesterov = function.split()
+        if not isinstance(loss, losses.RidgeRegression):
+            raise ValueError("The loss must be a RidgeRegression.")
+
+        start = nesterov.penalty_start
+        K = [nesterov.l * A_i for A_i in nesterov.A()]
+
+        tau, sigma = _primal_dual_steps(nesterov, K, loss.L(), start,
+                                        beta.shape[0])
+
+        def Kt(alpha):  # K'.alpha, including the unpenalised variables.
+            Kta = nesterov.l * nesterov.Aa(alpha)
+            if start > 0:
+                Kta = np.vstack((np.zeros((start, Kta.shape[1])), Kta))
+            return Kta
+
+        alpha = nesterov.project([np.zeros((K_i.shape[0], beta.shape[1]))
+                                  for K_i in K])
+        beta_mean = np.zeros(beta.shape)
+        alpha_mean = [np.zeros(a.shape) for a in alpha]
+
+        if self.info_requested(Info.time):
+            t = []
+        if self.info_requested(Info.fvalue):
+            f = []
+        if self.info_requested(Info.gap):
+            gap = []
+        if self.info_requested(Info.converged):
+            self.info_set(Info.converged, False)
+
+        next_gap = self.gap_every
+        for i in xrange(1, max(self.min_iter, self.max_iter) + 1):
+
+            if self.info_requested(Info.time):
+                tm = utils.time_cpu()
+
+            betanew = penalty.prox(beta - tau * (loss.grad(beta)
+                                                 + Kt(alpha)),
+                                   tau)
+            beta_bar = 2.0 * betanew[start:, :] - beta[start:, :]
+            alpha = nesterov.project([alpha[j] + sigma[j] * K[j].dot(beta_bar)
+                                      for j in xrange(len(K))])
+            beta = betanew
+
+            # The running means, i.e. the ergodic iterates.
+            beta_mean += (beta - beta_mean) / float(i)
+            for j in xrange(len(alpha)):
+                alpha_mean[j] += (alpha[j] - alpha_mean[j]) / float(i)
+
+            if self.info_requested(Info.time):
+                t.append(utils.time_cpu() - tm)
+            if self.info_requested(Info.fvalue):
+                f.append(function.f(beta))
+
+            if i >= next_gap and i >= self.min_iter:
+                next_gap = i + max(self.gap_every, i // 4)
+
+                G = _split_gap(function, beta, alpha)
+                G_mean = _split_gap(function, beta_mean, alpha_mean)
+                if G_mean < G:
+                    G, beta_best = G_mean, beta_mean
+                else:
+                    beta_best = beta
+
+                if self.info_requested(Info.gap):
+                    gap.append(G)
+
+                if G < self.eps:
+                    beta = beta_best
+
+                    if self.info_requested(Info.converged):
+                        self.info_set(Info.converged, True)
+
+                    break
+
+        self.num_iter = i
+
+        if self.info_requested(Info.num_iter):
+            self.info_set(Info.num_iter, i)
+        if self.info_requested(Info.time):
+            self.info_set(Info.time, t)
+        if self.info_requested(Info.fvalue):
+            self.info_set(Info.fvalue, f)
+        if self.info_requested(Info.gap):
+            self.info_set(Info.gap, gap)
+        if self.info_requested(Info.ok):
+            self.info_set(Info.ok, True)
+
+        return beta
+
+
+class ADMM(bases.ExplicitAlgorithm,
+           bases.IterativeAlgorithm,
+           bases.InformationAlgorithm):
+    """The alternating direction method of multipliers (ADMM) for linear
+    regression with L1, L2 and a non-smoothed Nesterov penalty, e.g. total
+    variation,
+
+        min. (1 / 2n).||X.beta - y||²_2 + (k / 2).||beta||²_2
+             + l.||z_1||_1 + g.sum_i ||z_2,i||_2
+        s.t. z_1 = beta, z_2 = A.beta,
+
+    where z_2,i are the groups of the Nesterov function, e.g. the gradient at
+    every pixel for TotalVariation. The function must have a method split()
+    that returns the three terms (see e.g. LinearRegressionL1L2TV.split), and
+    the loss must be a RidgeRegression.
+
+    Every iteration solves the linear system
+
+        (X'X / n + k.I + rho.(I + A'A)).beta = X'y / n
+                                               + rho.(z_1 - u_1)
+                                               + rho.A'(z_2 - u_2),
+
+    applies the proximal operator of L1 to beta + u_1, and soft-thresholds
+    the groups of A.beta + u_2 (the proximal operator of the Nesterov
+    function, computed from its projection through Moreau's identity).
+
+    The system matrix only changes with rho, so it is factorised once, and
+    again only when rho is changed. If n >= p, the dense p-by-p matrix is
+    factorised by Cholesky. Otherwise, the sparse matrix k.I + rho.(I + A'A)
+    is factorised, and the solution is computed using the Woodbury matrix
+    identity with a dense n-by-n Cholesky factor. When both n and p are
+    larger than max_factor, the system is instead solved by the conjugate
+    gradient method, preconditioned by the diagonal and warm-started from the
+    previous beta.
+
+    The parameter rho is adapted by residual balancing (Boyd et al., 2011):
+    it is increased or decreased by a factor two when the primal residual is
+    ten times larger or smaller than the dual residual. The algorithm stops
+    when both residuals are less than eps.
+
+    Parameters
+    ----------
+    rho : Positive float. The initial penalty parameter of the augmented
+            Lagrangian. Default is 1.0.
+
+    adapt_rho : Boolean. Whether or not to adapt rho. Default is True.
+
+    solver : String. How to solve the linear systems. One of "cholesky",
+            "cg" and "auto". Default is "auto", which means "cholesky" if
+            min(n, p) <= max_factor, and "cg" otherwise.
+
+    max_factor : Positive integer. The largest dense matrix that is
+            factorised when solver is "auto". Default is 3000.
+
+    eps : Positive float. Tolerance for the stopping criterion.
+
+    info : List or tuple of utils.consts.Info. What, if any, extra run
+            information should be stored. Default is an empty list, which means
+            that no run information is computed nor returned.
+
+    max_iter : Non-negative integer. Maximum allowed number of iterations.
+
+    min_iter : Non-negative integer less than or equal to max_iter. Minimum
+            number of iterations that must be performed. Default is 1.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import parsimony.functions as functions
+    >>> import parsimony.functions.nesterov.tv as tv
+    >>> from parsimony.algorithms.primaldual import ADMM, ChambollePock
+    >>>
+    >>> np.random.seed(42)
+    >>> X = np.random.rand(50, 20)
+    >>> y = np.random.rand(50, 1)
+    >>> A, _ = tv.A_from_shape((4, 5))
+    >>> function = functions.LinearRegressionL1L2TV(X, y, 0.1, 0.05, 0.1, A=A)
+    >>> beta_admm = ADMM(eps=1e-8, max_iter=10000).run(function,
+    ...                                                np.zeros((20, 1)))
+    >>> beta_cp = ChambollePock(eps=1e-8, max_iter=10000).run(function,
+    ...                                                       np.zeros((20, 1)))
+    >>> abs(function.f(beta_admm) - function.f(beta_cp)) < 1e-6
+    True
+    """
+    INTERFACES = [nesterov_properties.NesterovFunction,
+                  properties.ProximalOperator]
+
+    INFO_PROVIDED = [Info.ok,
+                     Info.num_iter,
+                     Info.time,
+                     Info.fvalue,
+                     Info.converged]
+
+    def __init__(self, rho=1.0, adapt_rho=True, solver="auto",
+                 max_factor=3000, eps=consts.TOLERANCE,
+                 info=[], max_iter=10000, min_iter=1):
+
+        super(ADMM, self).__init__(info=info,
+                                   max_iter=max_iter,
+                                   min_iter=min_iter)
+
+        if solver not in ("auto", "cholesky", "cg"):
+            raise ValueError('solver must be one of "auto", "cholesky" '
+                             'and "cg".')
+
+        self.rho = max(consts.FLOAT_EPSILON, float(rho))
+        self.adapt_rho = bool(adapt_rho)
+        self.solver = solver
+        self.max_factor = max(1, int(max_factor))
+        self.eps = eps
+
+    @bases.force_reset
+    @bases.check_compatibility
+    def run(self, function, beta):
+        """Find the minimiser of the given function, starting at beta.
+
+        Parameters
+        ----------
+        function : Function. The function to minimise. Must have a method
+                split().
+
+        beta : Numpy array. The start vector.
+        """
+        if self.info_requested(Info.ok):
+            self.info_set(Info.ok, False)
+
+        loss, penalty, nesterov = function.split()
+        if not isinstance(loss, losses.RidgeRegression):
+            raise ValueError("The loss must be a RidgeRegression.")
+
+        X = loss.X
+        n, p = X.shape
+        start = nesterov.penalty_start
+
+        # The operators of the Nesterov function, including the unpenalised
+        # variables.
+        A = [sparse.hstack((sparse.csr_matrix((A_i.shape[0], start)), A_i),
+                           format="csr") if start > 0 else A_i.tocsr()
+             for A_i in nesterov.A()]
+        At = [A_i.T.tocsr() for A_i in A]
+
+        c = 1.0 / float(n) if loss.mean else 1.0
+        k = np.zeros((p, 1))
+        k[loss.penalty_start:, :] = loss.k
+
+        solver = self.solver
+        if solver == "auto":
+            solver = "cholesky" if min(n, p) <= self.max_factor else "cg"
+        system = _ADMMSystem(X, c, k, A, solver, self.eps)
+
+        rho = self.rho
+        cXty = c * np.dot(X.T, loss.y)
+        z1 = beta.copy()
+        z2 = [A_i.dot(beta) for A_i in A]
+        u1 = np.zeros(beta.shape)
+        u2 = [np.zeros(z2_i.shape) for z2_i in z2]
+
+        if self.info_requested(Info.time):
+            t = []
+        if self.info_requested(Info.fvalue):
+            f = []
+        if self.info_requested(Info.converged):
+            self.info_set(Info.converged, False)
+
+        for i in xrange(1, max(self.min_iter, self.max_iter) + 1):
+
+            if self.info_requested(Info.time):
+                tm = utils.time_cpu()
+
+            b = z1 - u1
+            for j in xrange(len(A)):
+                b += At[j].dot(z2[j] - u2[j])
+            beta = system.solve(cXty + rho * b, rho, beta)
+
+            Abeta = [A_i.dot(beta) for A_i in A]
+            z1_old, z2_old = z1, z2
+            z1 = penalty.prox(beta + u1, 1.0 / rho)
+            z2 = _group_shrink(nesterov,
+                               [Abeta[j] + u2[j] for j in xrange(len(A))],
+                               nesterov.l / rho)
+
+            r1 = beta - z1
+            r2 = [Abeta[j] - z2[j] for j in xrange(len(A))]
+            u1 = u1 + r1
+            u2 = [u2[j] + r2[j] for j in xrange(len(A))]
+
+            s = z1 - z1_old
+            for j in xrange(len(A)):
+                s += At[j].dot(z2[j] - z2_old[j])
+
+            primal = np.sqrt(maths.norm(r1) ** 2.0
+                             + sum([maths.norm(r) ** 2.0 for r in r2]))
+            dual = rho * maths.norm(s)
+
+            if self.info_requested(Info.time):
+                t.append(utils.time_cpu() - tm)
+            if self.info_requested(Info.fvalue):
+                f.append(function.f(z1))
+
+            if primal < self.eps and dual < self.eps \
+                    and i >= self.min_iter:
+
+                if self.info_requested(Info.converged):
+                    self.info_set(Info.converged, True)
+
+                break
+
+            if self.adapt_rho:
+                if primal > 10.0 * dual:
+                    scale = 2.0
+                elif dual > 10.0 * primal:
+                    scale = 0.5
+                else:
+                    scale = 1.0
+
+                if scale != 1.0:
+                    # The scaled dual variables follow rho.
+                    rho *= scale
+                    u1 = u1 / scale
+                    u2 = [u2_i / scale for u2_i in u2]
+
+        self.num_iter = i
+
+        if self.info_requested(Info.num_iter):
+            self.info_set(Info.num_iter, i)
+        if self.info_requested(Info.time):
+            self.info_set(Info.time, t)
+        if self.info_requested(Info.fvalue):
+            self.info_set(Info.fvalue, f)
+        if self.info_requested(Info.ok):
+            self.info_set(Info.ok, True)
+
+        return z1
+
+
+def _primal_dual_steps(nesterov, K, Lg, start, p):
+    """The diagonal step sizes of ChambollePock.
+
+    The steps sigma_i = 1 / sum_j |K_ij| and tau_j = 1 / sum_i |K_ij| fulfill
+    T^-1 >= K'SK (Pock and Chambolle, 2011). Adding Lg to 1 / tau_j leaves a
+    margin of Lg > Lg / 2, as required with a smooth term (Condat, 2013).
+    Since the rows of the dual variable are projected in groups, sigma is
+    taken as the smallest step of every group.
+    """
+    import parsimony.functions.nesterov.tv as tv
+    import parsimony.functions.nesterov.gl as gl
+
+    abs_K = [abs(K_i) for K_i in K]
+    row_sums = [np.asarray(K_i.sum(axis=1)).reshape(-1, 1) for K_i in abs_K]
+    col_sums = np.zeros((p, 1))
+    for K_i in abs_K:
+        col_sums[start:, :] += np.asarray(K_i.sum(axis=0)).reshape(-1, 1)
+
+    if isinstance(nesterov, tv.TotalVariation):
+        # A group is the same row of all the components of the gradient.
+        max_sums = np.max(np.hstack(row_sums), axis=1).reshape(-1, 1)
+        max_sums = [max_sums] * len(K)
+    elif isinstance(nesterov, gl.GroupLassoOverlap):
+        # A group is all rows of one matrix.
+        max_sums = [np.max(r) if r.size > 0 else 0.0 for r in row_sums]
+    else:
+        max_sums = [max([np.max(r) for r in row_sums if r.size > 0])] \
+                   * len(K)
+
+    sigma = [1.0 / np.maximum(m, consts.FLOAT_EPSILON) for m in max_sums]
+    tau = 1.0 / np.maximum(col_sums + Lg, consts.FLOAT_EPSILON)
+
+    return tau, sigma
+
+
+def _split_gap(function, beta, alpha):
+    """The duality gap of the non-smoothed problem, at the primal point beta
+    and the dual point alpha.
+
+    Negative gaps within rounding errors are returned as zero, and other
+    negative gaps as infinity, so that they are never taken as convergence.
+    """
+    loss, penalty, nesterov = function.split()
+    beta_hat = function.betahat(alpha, beta)
+
+    P = function.f(beta)
+    D = loss.f(beta_hat) \
+      + penalty.f(beta_hat) \
+      + nesterov.phi(alpha, beta_hat, mu=0.0)
+
+    gap = P - D
+    if gap < 0.0:
+        if gap > -100.0 * consts.FLOAT_EPSILON * max(1.0, abs(P)):
+            gap = 0.0
+        else:
+            gap = np.inf
+
+    return gap
+
+
+def _group_shrink(nesterov, v, factor):
+    """Soft-thresholds the groups of the Nesterov function, i.e. computes the
+    proximal operator of factor.sum_i ||v_i||_2, by Moreau's identity
+
+        prox(v) = v - factor.proj_K(v / factor).
+    """
+    proj = nesterov.project([v_i / factor for v_i in v])
+
+    return [v[j] - factor * proj[j] for j in xrange(len(v))]
+
+
+class _ADMMSystem(object):
+    """Solves (c.X'X + diag(k) + rho.(I + A'A)).x = b for ADMM.
+
+    The factorisation is computed on the first solve, and again only when rho
+    has changed.
+    """
+    def __init__(self, X, c, k, A, solver, eps):
+
+        self.X = X
+        self.c = c
+        self.k = k
+        self.solver = solver
+        self.eps = eps
+
+        AtA = A[0].T.dot(A[0])
+        for A_i in A[1:]:
+            AtA = AtA + A_i.T.dot(A_i)
+        self.AtA = AtA.tocsr()
+
+        self._rho = None
+        self._XtX = None
+        self._Xdiag = None
+        self._factor = None
+
+    def _D(self, rho):
+        """The sparse matrix diag(k) + rho.(I + A'A).
+        """
+        p = self.k.shape[0]
+
+        return sparse.diags(self.k.ravel() + rho, 0, shape=(p, p)) \
+            + rho * self.AtA
+
+    def _factorise(self, rho):
+
+        n, p = self.X.shape
+        if n >= p:
+            if self._XtX is None:
+                self._XtX = np.dot(self.X.T, self.X)
+            M = self.c * self._XtX + self._D(rho).toarray()
+            self._factor = scipy.linalg.cho_factor(M)
+        else:
+            lu = sparse_linalg.splu(self._D(rho).tocsc())
+            W = lu.solve(np.asarray(self.X.T, order="F"))
+            C = np.dot(self.X, W)
+            C.flat[::n + 1] += 1.0 / self.c
+            self._factor = (lu, W, scipy.linalg.cho_factor(C))
+
+        self._rho = rho
+
+    def solve(self, b, rho, x0):
+        """Returns the solution of the system for the given rho.
+
+        Parameters
+        ----------
+        b : Numpy array (p-by-m). The right-hand sides.
+
+        rho : Positive float. The penalty parameter.
+
+        x0 : Numpy array (p-by-m). The start vector of the conjugate gradient
+                method.
+        """
+        if self.solver == "cg":
+            return self._cg(b, rho, x0)
+
+        if self._rho != rho:
+            self._factorise(rho)
+
+        n, p = self.X.shape
+        if n >= p:
+            return scipy.linalg.cho_solve(self._factor, b)
+        else:
+            lu, W, C = self._factor
+            x = lu.solve(b)
+            return x - np.dot(W, scipy.linalg.cho_solve(C, np.dot(self.X, x)))
+
+    def _cg(self, b, rho, x0):
+
+        X, c, k = self.X, self.c, self.k
+        p = X.shape[1]
+        D = self._D(rho).tocsr()
+
+        def matvec(x):
+            x = x.reshape(-1, 1)
+            return (c * np.dot(X.T, np.dot(X, x)) + D.dot(x)).ravel()
+
+        op = sparse_linalg.LinearOperator((p, p), matvec=matvec,
+                                          dtype=np.float64)
+
+        # The Jacobi preconditioner.
+        if self._Xdiag is None:
+            self._Xdiag = np.sum(X ** 2.0, axis=0)
+        diag = c * self._Xdiag + D.diagonal()
+        precond = sparse_linalg.LinearOperator((p, p),
+                                               matvec=lambda x: x / diag,
+                                               dtype=np.float64)
+
+        x = np.zeros(b.shape)
+        for j in xrange(b.shape[1]):
+            x[:, j], _ = sparse_linalg.cg(op, b[:, j], x0=x0[:, j],
+                                          tol=self.eps, M=precond)
+
+        return x
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
\ No newline at end of file
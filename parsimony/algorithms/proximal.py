@@ -16,6 +16,8 @@ Copyright (c) 2013-2014, CEA/DSV/I2BM/Neurospin. All rights reserved.
 @email:   lofstedt.tommy@gmail.com
 @license: BSD 3-clause.
 """
+import copy
+
 import numpy as np
 
 try:
@@ -26,9 +28,11 @@ import parsimony.utils as utils
 import parsimony.utils.maths as maths
 import parsimony.utils.consts as consts
 from parsimony.algorithms.utils import Info
+from parsimony.algorithms.utils import BacktrackingLineSearch
 import parsimony.functions.properties as properties
+from parsimony.functions.combinedfunctions import CombinedFunction
 
-__all__ = ["ISTA", "FISTA",
+__all__ = ["ISTA", "FISTA", "MultiFISTA", "ProximalNewton",
 
 #           "ProjectionADMM",
            "DykstrasProjectionAlgorithm",
@@ -188,6 +192,32 @@ class FISTA(bases.ExplicitAlgorithm,
     min_iter : Non-negative integer less than or equal to max_iter. Minimum
             number of iterations that must be performed. Default is 1.
 
+    backtrack : Boolean. Whether to search for the step size, using the local
+            Lipschitz constant of the gradient, instead of using the global
+            step given by function.step. The step is doubled after every
+            iteration in which it was accepted directly, and halved until
+
+                (grad(x) - grad(z))'(x - z) <= ||x - z||²_2 / (2 * step),
+
+            where z is the extrapolated point and x the new iterate. Since the
+            smooth part is convex, this implies the sufficient decrease of the
+            quadratic upper bound. The step is never shorter than
+            function.step. Default is False.
+
+    restart : None or string. Adaptive restart of the momentum. If "gradient",
+            the momentum is restarted when it points in a direction of ascent,
+            i.e. when (z - x)'(x - x_old) > 0. If "function", the momentum is
+            restarted when the function value, or the smoothed function value
+            if the function has a method fmu, increases. Default is None, no
+            restarts.
+
+    strongly_convex : Boolean. Whether to use the constant momentum
+
+                (1 - sqrt(m * step)) / (1 + sqrt(m * step)),
+
+            where m is the strong convexity parameter, if the function is
+            StronglyConvex with a positive parameter. Default is False.
+
     Example
     -------
     >>> from parsimony.algorithms.proximal import FISTA
@@ -236,7 +266,8 @@ class FISTA(bases.ExplicitAlgorithm,
 
     def __init__(self, eps=consts.TOLERANCE,
                  info=[], max_iter=10000, min_iter=1,
-                 conesta_stop=None):
+                 conesta_stop=None, backtrack=False, restart=None,
+                 strongly_convex=False):
 
         super(FISTA, self).__init__(info=info,
                                     max_iter=max_iter,
@@ -244,6 +275,13 @@ class FISTA(bases.ExplicitAlgorithm,
         self.eps = eps
         self.conesta_stop = conesta_stop
 
+        if restart not in (None, "gradient", "function"):
+            raise ValueError('restart must be None, "gradient" or '
+                             '"function".')
+        self.backtrack = bool(backtrack)
+        self.restart = restart
+        self.strongly_convex = bool(strongly_convex)
+
     @bases.force_reset
     @bases.check_compatibility
     def run(self, function, beta):
@@ -262,6 +300,17 @@ class FISTA(bases.ExplicitAlgorithm,
 
         z = betanew = betaold = beta
 
+        # The strong convexity parameter, if the constant momentum is used.
+        m = 0.0
+        if self.strongly_convex \
+                and isinstance(function, properties.StronglyConvex):
+            m = max(0.0, function.parameter())
+
+        if self.restart == "function":
+            # The smoothed function, if any, is the one being minimised.
+            fmu = getattr(function, "fmu", function.f)
+            fnew = fmu(betanew)
+
         if self.info_requested(Info.time):
             t = []
         if self.info_requested(Info.fvalue):
@@ -269,18 +318,39 @@ class FISTA(bases.ExplicitAlgorithm,
         if self.info_requested(Info.converged):
             self.info_set(Info.converged, False)
 
+        step = None
+        grow = False
+        k = 0  # The momentum counter, reset when the momentum is restarted.
         for i in xrange(1, max(self.min_iter, self.max_iter) + 1):
 
             if self.info_requested(Info.time):
                 tm = utils.time_cpu()
 
-            z = betanew + ((i - 2.0) / (i + 1.0)) * (betanew - betaold)
-
-            step = function.step(z)
+            k += 1
+            if m > 0.0 and step is not None:
+                sqrt_q = np.sqrt(min(1.0, m * step))
+                momentum = (1.0 - sqrt_q) / (1.0 + sqrt_q)
+            else:
+                momentum = (k - 2.0) / (k + 1.0)
+            z = betanew + momentum * (betanew - betaold)
 
             betaold = betanew
-            betanew = function.prox(z - step * function.grad(z),
-                                    step)
+            if self.backtrack:
+                betanew, step, grow = self._backtrack(function, z, step, grow)
+            else:
+                step = function.step(z)
+                betanew = function.prox(z - step * function.grad(z),
+                                        step)
+
+            if self.restart == "gradient":
+                if np.vdot(z - betanew, betanew - betaold) > 0.0:
+                    k = 1
+                    betaold = betanew
+            elif self.restart == "function":
+                fold, fnew = fnew, fmu(betanew)
+                if fnew > fold:
+                    k = 1
+                    betaold = betanew
 
             if self.info_requested(Info.time):
                 t.append(utils.time_cpu() - tm)
@@ -290,15 +360,13 @@ class FISTA(bases.ExplicitAlgorithm,
             if self.conesta_stop is not None:
                 mu_min = self.conesta_stop[0]
 #                print "mu_min:", mu_min
-                mu_old = function.set_mu(mu_min)
-#                print "mu_old:", mu_old
-                stop_step = function.step(betanew)
+                stop_step = function.step(betanew, mu=mu_min)
 #                print "step  :", step
-                # Take one ISTA step for use in the stopping criterion.
+                # Take one ISTA step, with mu = mu_min, for use in the
+                # stopping criterion.
                 stop_z = function.prox(betanew - stop_step \
-                                                    * function.grad(betanew),
+                                      * function.grad(betanew, mu=mu_min),
                                   stop_step)
-                function.set_mu(mu_old)
 #                print "err   :", maths.norm(betanew - z)
 #                print "sc err:", (1.0 / step) * maths.norm(betanew - z)
 #                print "eps   :", self.eps
@@ -343,6 +411,425 @@ class FISTA(bases.ExplicitAlgorithm,
 
         return betanew
 
+    def _backtrack(self, function, z, step, grow):
+        """Takes one proximal gradient step from z, with a step size found by
+        backtracking from the previous step.
+
+        Returns the new point, the step size used and whether the step size
+        was accepted directly, in which case it is increased next time.
+        """
+        min_step = function.step(z)
+        if step is None:
+            step = min_step
+        elif grow:
+            step = max(min_step, 2.0 * step)
+        else:
+            step = max(min_step, step)
+
+        grad = function.grad(z)
+        first = True
+        while True:
+            x = function.prox(z - step * grad, step)
+            if step <= min_step:
+                break
+
+            d = x - z
+            if np.vdot(function.grad(x) - grad, d) \
+                    <= np.vdot(d, d) / (2.0 * step):
+                break
+
+            step = max(min_step, 0.5 * step)
+            first = False
+
+        return x, step, first
+
+
+def _column_function(function, columns):
+    """Returns a copy of a CombinedFunction of p-by-m variables that applies
+    to the given columns only, i.e. that has the regularisation constants of
+    those columns.
+    """
+    def restrict(f):
+        # Penalties with one regularisation constant per column have l with
+        # shape (1, m).
+        l = getattr(f, "l", None)
+        if isinstance(l, np.ndarray) and l.ndim == 2:
+            f = copy.copy(f)
+            f.l = l[:, columns]
+        return f
+
+    restricted = copy.copy(function)
+    restricted._f = [restrict(f) for f in function._f]
+    restricted._p = [restrict(p) for p in function._p]
+    restricted._prox = [restrict(prox) for prox in function._prox]
+    restricted._c = [restrict(c) for c in function._c]
+
+    return restricted
+
+
+class MultiFISTA(bases.ExplicitAlgorithm,
+                 bases.IterativeAlgorithm,
+                 bases.InformationAlgorithm):
+    """FISTA for many problems at once, e.g. for a grid of regularisation
+    constants.
+
+    The variable is a p-by-m matrix, where every column is a separate
+    problem, and the functions have one regularisation constant for every
+    column (e.g. L1(l=ls), with ls an array with m elements). The gradients
+    of all columns are computed together, e.g. as X'(X.B - y.1'), with a
+    single matrix-matrix product, which is much faster than m matrix-vector
+    products. Step sizes may differ between columns, if function.step returns
+    an array with shape (1, m).
+
+    Every column has its own momentum and stopping criterion. Columns that
+    have converged are no longer updated, and if the function is a
+    CombinedFunction, the gradients and proximal operators are only computed
+    for the columns that have not converged.
+
+    Parameters
+    ----------
+    eps : Positive float. Tolerance for the stopping criterion of every
+            column.
+
+    info : List or tuple of utils.consts.Info. What, if any, extra run
+            information should be stored. Default is an empty list, which means
+            that no run information is computed nor returned. Info.converged
+            is True if all columns converged.
+
+    max_iter : Non-negative integer. Maximum allowed number of iterations.
+
+    min_iter : Non-negative integer less than or equal to max_iter. Minimum
+            number of iterations that must be performed. Default is 1.
+
+    Attributes
+    ----------
+    num_iter_columns : Numpy array with m elements. The number of iterations
+            performed for every column in the last run.
+
+    Example
+    -------
+    >>> from parsimony.algorithms.proximal import FISTA, MultiFISTA
+    >>> from parsimony.functions import CombinedFunction
+    >>> import parsimony.functions.losses as losses
+    >>> import parsimony.functions.penalties as penalties
+    >>> import numpy as np
+    >>>
+    >>> np.random.seed(42)
+    >>> X = np.random.rand(100, 50)
+    >>> y = np.random.rand(100, 1)
+    >>> ls = np.linspace(0.001, 0.1, 10)
+    >>> function = CombinedFunction()
+    >>> function.add_function(losses.LinearRegression(X, y))
+    >>> function.add_penalty(penalties.L2Squared(l=0.1 * ls))
+    >>> function.add_prox(penalties.L1(l=ls))
+    >>> B = MultiFISTA(max_iter=10000).run(function, np.zeros((50, 10)))
+    >>> B.shape
+    (50, 10)
+    >>>
+    >>> function = CombinedFunction()
+    >>> function.add_function(losses.LinearRegression(X, y))
+    >>> function.add_penalty(penalties.L2Squared(l=0.1 * ls[4]))
+    >>> function.add_prox(penalties.L1(l=ls[4]))
+    >>> beta = FISTA(max_iter=10000).run(function, np.zeros((50, 1)))
+    >>> np.linalg.norm(B[:, [4]] - beta) < 5e-10
+    True
+    """
+    INTERFACES = [properties.Function,
+                  properties.Gradient,
+                  properties.StepSize,
+                  properties.ProximalOperator]
+
+    INFO_PROVIDED = [Info.ok,
+                     Info.num_iter,
+                     Info.time,
+                     Info.fvalue,
+                     Info.converged]
+
+    def __init__(self, eps=consts.TOLERANCE,
+                 info=[], max_iter=10000, min_iter=1):
+
+        super(MultiFISTA, self).__init__(info=info,
+                                         max_iter=max_iter,
+                                         min_iter=min_iter)
+        self.eps = eps
+        self.num_iter_columns = None
+
+    @bases.force_reset
+    @bases.check_compatibility
+    def run(self, function, beta):
+        """Find the minimisers of the given function, starting at beta.
+
+        Parameters
+        ----------
+        function : Function. The function to minimise.
+
+        beta : Numpy array (p-by-m). The start vectors.
+        """
+        if self.info_requested(Info.ok):
+            self.info_set(Info.ok, False)
+
+        m = beta.shape[1]
+        active = np.ones(m, dtype=bool)
+        num_iter = np.zeros(m, dtype=int)
+
+        betanew = betaold = beta
+        # The columns that are computed, and the function restricted to them.
+        columns = np.arange(m)
+        active_function = function
+        restrictable = isinstance(function, CombinedFunction)
+
+        if self.info_requested(Info.time):
+            t = []
+        if self.info_requested(Info.fvalue):
+            f = []
+        if self.info_requested(Info.converged):
+            self.info_set(Info.converged, False)
+
+        for i in xrange(1, max(self.min_iter, self.max_iter) + 1):
+
+            if self.info_requested(Info.time):
+                tm = utils.time_cpu()
+
+            restricted = len(columns) < m
+            if restricted:
+                z = betanew[:, columns] + ((i - 2.0) / (i + 1.0)) \
+                    * (betanew[:, columns] - betaold[:, columns])
+            else:
+                z = betanew + ((i - 2.0) / (i + 1.0)) * (betanew - betaold)
+
+            step = active_function.step(z)
+
+            betaold = betanew
+            betanew = active_function.prox(z - step * active_function.grad(z),
+                                           step)
+            # Converged columns are kept as they are.
+            if restricted:
+                betanew_ = betanew
+                betanew = betaold.copy()
+                betanew[:, columns] = betanew_
+            else:
+                betanew[:, ~active] = betaold[:, ~active]
+
+            if self.info_requested(Info.time):
+                t.append(utils.time_cpu() - tm)
+            if self.info_requested(Info.fvalue):
+                f.append(function.f(betanew))
+
+            num_iter[active] = i
+
+            err = np.sqrt(np.sum((betanew[:, columns] - z) ** 2.0, axis=0))
+            step = np.ravel(step)
+            if np.all(step > 0.0):
+                err /= step
+            if i >= self.min_iter:
+                converged = err < self.eps
+                active[columns[converged]] = False
+                if restrictable and np.any(converged) and np.any(active):
+                    columns = np.flatnonzero(active)
+                    active_function = _column_function(function, columns)
+
+            if not np.any(active):
+
+                if self.info_requested(Info.converged):
+                    self.info_set(Info.converged, True)
+
+                break
+
+        self.num_iter = i
+        self.num_iter_columns = num_iter
+
+        if self.info_requested(Info.num_iter):
+            self.info_set(Info.num_iter, i)
+        if self.info_requested(Info.time):
+            self.info_set(Info.time, t)
+        if self.info_requested(Info.fvalue):
+            self.info_set(Info.fvalue, f)
+        if self.info_requested(Info.ok):
+            self.info_set(Info.ok, True)
+
+        return betanew
+
+
+class ProximalNewton(bases.ExplicitAlgorithm,
+                     bases.IterativeAlgorithm,
+                     bases.InformationAlgorithm):
+    """The proximal Newton algorithm.
+
+    Minimises f(x) + h(x), where f is smooth with a Hessian and h has a
+    proximal operator (e.g. an L1 penalty). In every iteration, the quadratic
+    model
+
+        f(x) + grad(f(x))'d + (1 / 2).d'H(x)d + h(x + d)
+
+    is minimised approximately over d by FISTA, using only Hessian-vector
+    products, and a backtracking line search along d is used for
+    globalisation. The inner problems are solved to a relative accuracy of
+    min(0.5, sqrt(|G|)), where G is the proximal gradient map at x, which
+    gives superlinear local convergence. If the line search fails, a proximal
+    gradient step is taken instead.
+
+    The algorithm stops when the norm of the proximal gradient map,
+    |x - prox(x - t.grad(f(x)), t)| / t, is less than eps.
+
+    Parameters
+    ----------
+    eps : Positive float. Tolerance for the stopping criterion.
+
+    info : List or tuple of utils.consts.Info. What, if any, extra run
+            information should be stored. Default is an empty list, which means
+            that no run information is computed nor returned.
+
+    max_iter : Non-negative integer. Maximum allowed number of (outer)
+            iterations. Default is 100.
+
+    min_iter : Non-negative integer less than or equal to max_iter. Minimum
+            number of iterations that must be performed. Default is 1.
+
+    max_inner_iter : Positive integer. Maximum allowed number of FISTA
+            iterations on every quadratic model. Default is 500.
+
+    Example
+    -------
+    >>> from parsimony.algorithms.proximal import ProximalNewton, FISTA
+    >>> from parsimony.algorithms.utils import Info
+    >>> from parsimony.functions import CombinedFunction
+    >>> from parsimony.functions.losses import RidgeLogisticRegression
+    >>> from parsimony.functions.penalties import L1
+    >>> import numpy as np
+    >>>
+    >>> np.random.seed(42)
+    >>> X = np.random.randn(200, 50)
+    >>> y = np.random.randint(0, 2, (200, 1))
+    >>> function = CombinedFunction()
+    >>> function.add_function(RidgeLogisticRegression(X, y, k=0.01))
+    >>> function.add_prox(L1(l=0.05))
+    >>> newton = ProximalNewton(info=[Info.num_iter])
+    >>> beta1 = newton.run(function, np.zeros((50, 1)))
+    >>> newton.info_get(Info.num_iter) < 20
+    True
+    >>> fista = FISTA(max_iter=20000)
+    >>> beta2 = fista.run(function, np.zeros((50, 1)))
+    >>> np.linalg.norm(beta1 - beta2) < 5e-6
+    True
+    >>> np.sum(beta1 != 0.0) == np.sum(beta2 != 0.0)
+    True
+    """
+    INTERFACES = [properties.Function,
+                  properties.Gradient,
+                  properties.Hessian,
+                  properties.StepSize,
+                  properties.ProximalOperator]
+
+    INFO_PROVIDED = [Info.ok,
+                     Info.num_iter,
+                     Info.time,
+                     Info.fvalue,
+                     Info.converged]
+
+    def __init__(self, eps=consts.TOLERANCE,
+                 info=[], max_iter=100, min_iter=1, max_inner_iter=500):
+
+        super(ProximalNewton, self).__init__(info=info,
+                                             max_iter=max_iter,
+                                             min_iter=min_iter)
+        self.eps = eps
+        self.max_inner_iter = max(1, int(max_inner_iter))
+
+    @bases.force_reset
+    @bases.check_compatibility
+    def run(self, function, beta):
+        """Find the minimiser of the given function, starting at beta.
+
+        Parameters
+        ----------
+        function : Function. The function to minimise.
+
+        beta : Numpy array. The start vector.
+        """
+        if self.info_requested(Info.ok):
+            self.info_set(Info.ok, False)
+
+        if self.info_requested(Info.time):
+            t = []
+        if self.info_requested(Info.fvalue):
+            f = []
+        if self.info_requested(Info.converged):
+            self.info_set(Info.converged, False)
+
+        line_search = BacktrackingLineSearch(max_iter=30)
+
+        grad = function.grad(beta)
+        step = function.step(beta)
+        # The proximal gradient step and map.
+        beta_pg = function.prox(beta - step * grad, step)
+        norm_G = maths.norm(beta - beta_pg) / step
+        for i in xrange(1, self.max_iter + 1):
+
+            if self.info_requested(Info.time):
+                tm = utils.time_cpu()
+
+            tol = min(0.5, np.sqrt(norm_G)) * norm_G
+            z = self._solve_model(function, beta, grad, step, beta_pg, tol)
+
+            d = z - beta
+            dHd = np.dot(d.T, function.hessian(beta, d))[0, 0]
+            # For the exact minimiser of the model, the decrease predicted by
+            # the model, grad'd + h(beta + d) - h(beta), is at most -d'Hd.
+            a = line_search.run(function, beta, d, rho=0.5, a=1.0,
+                                c=1e-4, delta=-dHd)
+            if a > 0.0:
+                beta = beta + a * d
+            else:
+                beta = beta_pg
+
+            grad = function.grad(beta)
+            step = function.step(beta)
+            beta_pg = function.prox(beta - step * grad, step)
+            norm_G = maths.norm(beta - beta_pg) / step
+
+            if self.info_requested(Info.time):
+                t.append(utils.time_cpu() - tm)
+            if self.info_requested(Info.fvalue):
+                f.append(function.f(beta))
+
+            if norm_G < self.eps and i >= self.min_iter:
+
+                if self.info_requested(Info.converged):
+                    self.info_set(Info.converged, True)
+
+                break
+
+        self.num_iter = i
+
+        if self.info_requested(Info.num_iter):
+            self.info_set(Info.num_iter, i)
+        if self.info_requested(Info.time):
+            self.info_set(Info.time, t)
+        if self.info_requested(Info.fvalue):
+            self.info_set(Info.fvalue, f)
+        if self.info_requested(Info.ok):
+            self.info_set(Info.ok, True)
+
+        return beta
+
+    def _solve_model(self, function, beta, grad, step, z, tol):
+        """Minimises the quadratic model at beta by FISTA, starting from the
+        proximal gradient step z, until the proximal gradient map of the model
+        is less than tol.
+        """
+        zold = z
+        for j in xrange(2, self.max_inner_iter + 1):
+            y = z + ((j - 2.0) / (j + 1.0)) * (z - zold)
+            grad_m = grad + function.hessian(beta, y - beta)
+
+            zold = z
+            z = function.prox(y - step * grad_m, step)
+
+            if maths.norm(z - y) / step < tol:
+                break
+
+        return z
+
 
 #class ProjectionADMM(bases.ExplicitAlgorithm):
 #    """ The Alternating direction method of multipliers, where the functions
@@ -497,19 +984,57 @@ class ParallelDykstrasProjectionAlgorithm(bases.ExplicitAlgorithm):
 
     The functions have projection operators (ProjectionOperator.proj) onto the
     respective convex sets.
+
+    The projections are independent of each other in every iteration, and are
+    computed concurrently in a pool of threads if num_workers > 1. Threads
+    suffice, since numpy releases the GIL in most of the computations.
+
+    Parameters
+    ----------
+    eps : Positive float. Tolerance for the stopping criterion.
+
+    max_iter : Non-negative integer. Maximum allowed number of iterations.
+
+    min_iter : Non-negative integer less than or equal to max_iter. Minimum
+            number of iterations that must be performed. Default is 1.
+
+    num_workers : Positive integer. The number of projections to compute
+            concurrently. Default is 1, compute them one after the other.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import parsimony.functions.penalties as penalties
+    >>> from parsimony.algorithms.proximal import \\
+    ...         ParallelDykstrasProjectionAlgorithm
+    >>>
+    >>> np.random.seed(42)
+    >>> x = 3.0 * np.random.randn(20, 1)
+    >>> functions = [penalties.L1(c=3.0), penalties.L2(c=1.5)]
+    >>> algorithm = ParallelDykstrasProjectionAlgorithm(eps=1e-10,
+    ...                                                 max_iter=10000)
+    >>> y = algorithm.run(functions, x)
+    >>> [f.f(y) < 5e-8 for f in functions]
+    [True, True]
+    >>> algorithm = ParallelDykstrasProjectionAlgorithm(eps=1e-10,
+    ...                                                 max_iter=10000,
+    ...                                                 num_workers=2)
+    >>> np.linalg.norm(algorithm.run(functions, x) - y) < 5e-15
+    True
     """
     INTERFACES = [properties.Function,
                   properties.ProjectionOperator]
 
     def __init__(self, output=False,
                  eps=consts.TOLERANCE,
-                 max_iter=100, min_iter=1):
+                 max_iter=100, min_iter=1, num_workers=1):
                  # TODO: Investigate what is a good default value here!
 
         self.output = output
         self.eps = eps
         self.max_iter = max_iter
         self.min_iter = min_iter
+        self.num_workers = max(1, int(num_workers))
 
     def run(self, functions, x, weights=None):
         """Finds the projection onto the intersection of two sets.
@@ -532,30 +1057,17 @@ class ParallelDykstrasProjectionAlgorithm(bases.ExplicitAlgorithm):
         if weights is None:
             weights = [1.0 / float(num)] * num
 
-        x_new = x_old = x
-        p = [0.0] * len(functions)
-        z = [0.0] * len(functions)
-        for i in xrange(num):
-            z[i] = np.copy(x)
-
-        for i in xrange(1, self.max_iter + 1):
-
-            for i in xrange(num):
-                p[i] = functions[i].proj(z[i])
+        def project(j, z_j):
+            return functions[j].proj(z_j)
 
-            # TODO: Does the weights really matter when the function is the
-            # indicator function?
-            x_old = x_new
-            x_new = np.zeros(x_old.shape)
-            for i in xrange(num):
-                x_new += weights[i] * p[i]
-
-            for i in xrange(num):
-                z[i] = x + z[i] - p[i]
-
-            if maths.norm(x_new - x_old) / maths.norm(x_old) < self.eps \
-                    and i >= self.min_iter:
-                break
+        pool = _thread_pool(self.num_workers, num)
+        try:
+            x_new = _parallel_dykstra(project, x, weights, self.eps,
+                                      self.max_iter, self.min_iter, pool)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
         return x_new
 
@@ -570,6 +1082,23 @@ class ParallelDykstrasProximalAlgorithm(bases.ExplicitAlgorithm):
 
     The functions have projection operators (ProjectionOperator.proj) onto the
     respective convex sets or proximal operators (ProximalOperator.prox).
+
+    The proximal operators and projections are independent of each other in
+    every iteration, and are computed concurrently in a pool of threads if
+    num_workers > 1.
+
+    Parameters
+    ----------
+    eps : Positive float. Tolerance for the stopping criterion.
+
+    max_iter : Non-negative integer. Maximum allowed number of iterations.
+
+    min_iter : Non-negative integer less than or equal to max_iter. Minimum
+            number of iterations that must be performed. Default is 1.
+
+    num_workers : Positive integer. The number of proximal operators and
+            projections to compute concurrently. Default is 1, compute them
+            one after the other.
     """
     INTERFACES = [properties.Function,
                   properties.OR(properties.ProjectionOperator,
@@ -577,13 +1106,14 @@ class ParallelDykstrasProximalAlgorithm(bases.ExplicitAlgorithm):
 
     def __init__(self, output=False,
                  eps=consts.TOLERANCE,
-                 max_iter=100, min_iter=1):
+                 max_iter=100, min_iter=1, num_workers=1):
                  # TODO: Investigate what is a good default value here!
 
         self.output = output
         self.eps = eps
         self.max_iter = max_iter
         self.min_iter = min_iter
+        self.num_workers = max(1, int(num_workers))
 
     def run(self, x, prox=[], proj=[], factor=1.0, weights=None):
         """Finds the projection onto the intersection of two sets.
@@ -613,48 +1143,110 @@ class ParallelDykstrasProximalAlgorithm(bases.ExplicitAlgorithm):
 
         num_prox = len(prox)
         num_proj = len(proj)
-#        num = num_proj + num_prox
+        num = num_prox + num_proj
 
         if weights is None:
-            weights = [1. / float(num_prox + num_proj)] * (num_prox + num_proj)
+            weights = [1. / float(num)] * num
 
-        x_new = x_old = x
-        p = [0.0] * (num_prox + num_proj)
-        z = [0.0] * (num_prox + num_proj)
-        for i in xrange(num_prox + num_proj):
-            z[i] = np.copy(x)
+        def prox_or_proj(j, z_j):
+            if j < num_prox:
+                return prox[j].prox(z_j, factor)
+            else:
+                return proj[j - num_prox].proj(z_j)
+
+        def feasible(p):
+            for j in xrange(num_proj):
+                if proj[j].f(p[num_prox + j]) > 0.0:
+                    return False
+            return True
+
+        pool = _thread_pool(self.num_workers, num)
+        try:
+            x_new = _parallel_dykstra(prox_or_proj, x, weights, self.eps,
+                                      self.max_iter, self.min_iter, pool,
+                                      feasible=feasible)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
-        for i in xrange(1, self.max_iter + 1):
+        return x_new
 
-            for i in xrange(num_prox):
-                p[i] = prox[i].prox(z[i], factor)
-            for i in xrange(num_proj):
-                p[num_prox + i] = proj[i].proj(z[num_prox + i])
-#                if proj[i].f(p[i]) > 0.2:
-#                if abs(proj[i].c - 1.0) < 0.001:
-#                    print "före :", proj[i].f(z[num_prox + i]), np.linalg.norm(z[num_prox + i])
-#                    print "efter:", proj[i].f(p[i]), np.linalg.norm(p[i])
 
-            x_old = x_new
-            x_new = np.zeros(x_old.shape)
-            for i in xrange(num_prox + num_proj):
-                x_new += weights[i] * p[i]
+def _thread_pool(num_workers, num_tasks):
+    """Returns a pool of threads, or None if the tasks should be run one after
+    the other.
+    """
+    num_workers = min(num_workers, num_tasks)
+    if num_workers <= 1:
+        return None
 
-            if maths.norm(x_new - x_old) / maths.norm(x_old) < self.eps \
-                    and i >= self.min_iter:
+    import multiprocessing.pool
+    return multiprocessing.pool.ThreadPool(num_workers)
 
-                all_feasible = True
-                for i in xrange(num_proj):
-                    if proj[i].f(p[num_prox + i]) > 0.0:
-                        all_feasible = False
 
-                if all_feasible:
-                    break
+def _parallel_dykstra(operator, x, weights, eps, max_iter, min_iter, pool,
+                      feasible=None):
+    """The parallel Dykstra-like iteration
 
-            for i in xrange(num_prox + num_proj):
-                z[i] = x_new + z[i] - p[i]
+        p_j = operator(j, z_j),
+        x_new = sum_j weights_j * p_j,
+        z_j = x_new + z_j - p_j,
+
+    with z_j = x initially, until |x_new - x_old| / |x_old| < eps and, if
+    given, feasible(p) is True.
+
+    All buffers are allocated once. The norm of x_old is the norm of x_new
+    from the previous iteration, so only two norms are computed per
+    iteration.
+    """
+    num = len(weights)
+    tasks = range(num)
+
+    z = [np.copy(x) for j in xrange(num)]
+    p = [None] * num
+    # The operators may change their arguments in place (e.g. L2.proj), so
+    # they are given copies of z_j.
+    args = [np.empty_like(x) for j in xrange(num)]
+
+    x_old = np.copy(x)
+    x_new = np.empty_like(x_old)
+    buff = np.empty_like(x_old)
+    norm_old = maths.norm(x_old)
+
+    def apply(j):
+        np.copyto(args[j], z[j])
+        return operator(j, args[j])
+
+    for i in xrange(1, max_iter + 1):
+
+        if pool is None:
+            p = map(apply, tasks)
+        else:
+            p = pool.map(apply, tasks)
+
+        # x_new = sum_j weights_j * p_j, computed in place.
+        np.multiply(p[0], weights[0], out=x_new)
+        for j in xrange(1, num):
+            np.multiply(p[j], weights[j], out=buff)
+            x_new += buff
+
+        np.subtract(x_new, x_old, out=buff)
+        norm_new = maths.norm(x_new)
+        converged = maths.norm(buff) < eps * norm_old and i >= min_iter
+        if converged and (feasible is None or feasible(p)):
+            return x_new
+
+        for j in xrange(num):
+            z[j] -= p[j]
+            z[j] += x_new
+
+        x_old, x_new = x_new, x_old
+        norm_old = norm_new
+
+    # The latest average is x_old after the last swap.
+    return x_old
 
-        return x_new
 
 if __name__ == "__main__":
     import doctest
@@ -28,7 +28,9 @@ import parsimony.functions.properties as properties
 __all__ = ["Info",
 
            "Bisection", "NewtonRaphson",
-           "BacktrackingLineSearch"]
+           "BacktrackingLineSearch",
+
+           "ContinuationSchedule"]
 
 
 # TODO: This class should be replaced with Enum.
@@ -470,6 +472,97 @@ class BacktrackingLineSearch(bases.ExplicitAlgorithm):
             a = a * rho
 
 
+class ContinuationSchedule(object):
+    """The continuation of CONESTA, with constants computed once per fit.
+
+    For a function
+
+        f(beta) = g(beta) + gamma * s_mu(beta) + h(beta),
+
+    where the gradient of g is Lipschitz continuous with constant Lg, and s_mu
+    is a Nesterov function with linear operator A, the optimal mu for a given
+    precision, the optimal precision for a given mu and the step size are
+    closed-form expressions of Lg and
+
+        gM = gamma * M,
+        gA2 = gamma * ||A||²_2,
+
+    where M = max_{alpha in K} 0.5*|alpha|²_2. None of these depend on mu,
+    so the schedule never changes the state of the function.
+
+    Parameters
+    ----------
+    gM : Non-negative float. The regularisation constant, gamma, times M.
+
+    gA2 : Non-negative float. The regularisation constant, gamma, times the
+            largest eigenvalue of A'A, i.e. the Lipschitz constant of the
+            gradient of gamma * s_mu with mu = 1.
+
+    Lg : Non-negative float. The Lipschitz constant of the gradient of g.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import parsimony.functions as functions
+    >>> import parsimony.functions.nesterov.tv as tv
+    >>> from parsimony.algorithms.utils import ContinuationSchedule
+    >>>
+    >>> np.random.seed(42)
+    >>> X = np.random.rand(20, 10)
+    >>> y = np.random.rand(20, 1)
+    >>> A, _ = tv.A_from_shape((10,))
+    >>> function = functions.LinearRegressionL1L2TV(X, y, 0.1, 0.1, 0.1, A=A,
+    ...                                             mu=0.01)
+    >>> schedule = ContinuationSchedule(*function.continuation_constants())
+    >>> abs(schedule.step(0.01) - function.step(y)) < 5e-15
+    True
+    >>> abs(schedule.mu_opt(schedule.eps_opt(0.01)) - 0.01) < 5e-15
+    True
+    """
+    def __init__(self, gM, gA2, Lg):
+
+        self.gM = float(gM)
+        self.gA2 = float(gA2)
+        self.Lg = float(Lg)
+
+    def mu_opt(self, eps):
+        """The optimal value of mu given epsilon.
+        """
+        gM, gA2, Lg = self.gM, self.gA2, self.Lg
+
+        return (-gM * gA2 + np.sqrt((gM * gA2) ** 2.0
+             + gM * Lg * gA2 * eps)) \
+             / (gM * Lg)
+
+    def eps_opt(self, mu):
+        """The optimal value of epsilon given mu.
+        """
+        gM, gA2, Lg = self.gM, self.gA2, self.Lg
+
+        return (2.0 * gM * gA2 * mu
+             + gM * Lg * mu ** 2.0) \
+             / gA2
+
+    def eps_max(self, mu):
+        """The maximum value of epsilon given mu.
+        """
+        return float(mu) * self.gM
+
+    def mu_max(self, eps):
+        """The maximum value of mu given epsilon.
+        """
+        return float(eps) / self.gM
+
+    def step(self, mu):
+        """The step size, 1 / L, for the function smoothed with mu.
+        """
+        L = self.Lg
+        if self.gA2 > 0.0:
+            L += self.gA2 / mu
+
+        return 1.0 / L
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
\ No newline at end of file
@@ -11,9 +11,11 @@ Copyright (c) 2013-2014, CEA/DSV/I2BM/Neurospin. All rights reserved.
 @license: BSD 3-clause.
 """
 import abc
+import copy
 import warnings
 
 import numpy as np
+import scipy.sparse as sparse
 
 import parsimony.utils.consts as consts
 import parsimony.utils.maths as maths
@@ -43,8 +45,11 @@ __all__ = ["BaseEstimator",
            "LogisticRegression",
            "LogisticRegressionL1L2TV",
            "LogisticRegressionL1L2GL",
+           "MultinomialLogisticRegressionL1L2TV",
 
-           "LinearRegressionL2SmoothedL1TV"]
+           "LinearRegressionL2SmoothedL1TV",
+
+           "ModelBank", "CompactModel"]
 
 
 class BaseEstimator(object):
@@ -131,6 +136,16 @@ class RegressionEstimator(BaseEstimator):
         """
         return np.dot(check_arrays(X), self.beta)
 
+    def compact(self, eps=0.0):
+        """Returns a CompactModel with the non-zero coefficients of beta.
+
+        Parameters
+        ----------
+        eps : Non-negative float. Coefficients with absolute values less than
+                or equal to eps are considered zero. Default is 0.0.
+        """
+        return CompactModel.from_estimator(self, eps=eps)
+
     @abc.abstractmethod
     def score(self, X, y):
         """Return the score of the estimator.
@@ -191,7 +206,7 @@ class LogisticRegressionEstimator(BaseEstimator):
     def predict_probability(self, X):
         X = check_arrays(X)
         logit = np.dot(X, self.beta)
-        prob = 1.0 / (1.0 + np.exp(-logit))
+        prob = maths.logistic(logit)
 
         return prob
 
@@ -203,6 +218,16 @@ class LogisticRegressionEstimator(BaseEstimator):
 
         return rate
 
+    def compact(self, eps=0.0):
+        """Returns a CompactModel with the non-zero coefficients of beta.
+
+        Parameters
+        ----------
+        eps : Non-negative float. Coefficients with absolute values less than
+                or equal to eps are considered zero. Default is 0.0.
+        """
+        return CompactModel.from_estimator(self, eps=eps)
+
 
 class LinearRegression(RegressionEstimator):
     """Linear regression:
@@ -773,22 +798,36 @@ class LinearRegressionL1L2TV(RegressionEstimator):
                 "A": self.A, "mu": self.mu,
                 "penalty_start": self.penalty_start, "mean": self.mean}
 
-    def fit(self, X, y, beta=None):
-        """Fit the estimator to the data.
+    def build_function(self, X, y):
+        """Returns the function minimised by fit, for the given data.
         """
         X, y = check_arrays(X, y)
 
-        function = functions.LinearRegressionL1L2TV(X, y,
+        return functions.LinearRegressionL1L2TV(X, y,
                                               self.l2, self.l1, self.tv,
                                               A=self.A,
                                               penalty_start=self.penalty_start,
                                               mean=self.mean)
+
+    def fit(self, X, y, beta=None):
+        """Fit the estimator to the data.
+        """
+        X, y = check_arrays(X, y)
+
+        function = self.build_function(X, y)
+
+        return self.fit_function(function, beta=beta)
+
+    def fit_function(self, function, beta=None):
+        """Fit the estimator by minimising a function returned by
+        build_function.
+        """
         self.algorithm.check_compatibility(function,
                                            self.algorithm.INTERFACES)
 
         # TODO: Should we use a seed here so that we get deterministic results?
         if beta is None:
-            beta = self.start_vector.get_vector(X.shape[1])
+            beta = self.start_vector.get_vector(function.X.shape[1])
 
         if self.mu is None:
             self.mu = function.estimate_mu(beta)
@@ -1470,8 +1509,8 @@ class LogisticRegressionL1L2TV(LogisticRegressionEstimator):
                 "A": self.A, "mu": self.mu, "class_weight": self.class_weight,
                 "penalty_start": self.penalty_start, "mean": self.mean}
 
-    def fit(self, X, y, beta=None, sample_weight=None):
-        """Fit the estimator to the data.
+    def build_function(self, X, y, sample_weight=None):
+        """Returns the function minimised by fit, for the given data.
         """
         X, y = check_arrays(X, check_labels(y))
         if sample_weight is None:
@@ -1479,19 +1518,32 @@ class LogisticRegressionL1L2TV(LogisticRegressionEstimator):
         y, sample_weight = check_arrays(y, sample_weight)
             #sample_weight = sample_weight.ravel()
 
-        function = functions.LogisticRegressionL1L2TV(X, y,
+        return functions.LogisticRegressionL1L2TV(X, y,
                                               self.l2, self.l1, self.tv,
                                               A=self.A,
                                               weights=sample_weight,
                                               penalty_start=self.penalty_start,
                                               mean=self.mean)
 
+    def fit(self, X, y, beta=None, sample_weight=None):
+        """Fit the estimator to the data.
+        """
+        X, y = check_arrays(X, check_labels(y))
+
+        function = self.build_function(X, y, sample_weight=sample_weight)
+
+        return self.fit_function(function, beta=beta)
+
+    def fit_function(self, function, beta=None):
+        """Fit the estimator by minimising a function returned by
+        build_function.
+        """
         self.algorithm.check_compatibility(function,
                                            self.algorithm.INTERFACES)
 
         # TODO: Should we use a seed here so that we get deterministic results?
         if beta is None:
-            beta = self.start_vector.get_vector(X.shape[1])
+            beta = self.start_vector.get_vector(function.X.shape[1])
 
         if self.mu is None:
             self.mu = function.estimate_mu(beta)
@@ -1677,6 +1729,202 @@ class LogisticRegressionL1L2GL(LogisticRegressionEstimator):
         return self
 
 
+class MultinomialLogisticRegressionL1L2TV(LogisticRegressionEstimator):
+    """Multinomial (softmax) logistic regression with L1, L2 and TV penalties:
+
+        f(beta) = - loglik/n_samples
+                  + l1 * Sum_k ||beta_k||_1
+                  + (l2 / 2) * Sum_k ||beta_k||²_2
+                  + tv * Sum_k TV(beta_k)
+    where
+        loglik = Sum wi * Sum_k yik * log(pik),
+
+        pik = p(y=k|xi, beta) = exp(xi'*beta_k) / Sum_j exp(xi'*beta_j),
+
+        wi = weight of sample i,
+
+    and beta_k is the k:th column of the p-by-K coefficient matrix beta.
+
+    All K classes are fitted jointly. The penalties share their linear
+    operators and Lipschitz constants between the classes, and there is a
+    single continuation schedule, instead of one for each of K one-vs-rest
+    models.
+
+    Parameters
+    ----------
+    l1 : Non-negative float. The L1 regularization parameter.
+
+    l2 : Non-negative float. The L2 regularization parameter.
+
+    tv : Non-negative float. The total variation regularization parameter.
+
+    A : Numpy or (usually) scipy.sparse array. The linear operator for the
+            smoothed total variation Nesterov function. A must be given.
+
+    mu : Non-negative float. The regularisation constant for the smoothing.
+
+    algorithm : ExplicitAlgorithm. The algorithm that should be applied.
+            Should be one of:
+                1. StaticCONESTA(...)
+                2. FISTA(...)
+                3. ISTA(...)
+
+            Default is StaticCONESTA(...).
+
+    algorithm_params : A dict. The dictionary algorithm_params contains
+            parameters that should be set in the algorithm. Passing
+            algorithm=StaticCONESTA(**params) is equivalent to passing
+            algorithm=StaticCONESTA() and algorithm_params=params. Default is
+            an empty dictionary.
+
+    class_weight : Dict, 'auto' or None. If 'auto', class weights will be
+            given inverse proportional to the frequency of the class in
+            the data. If a dictionary is given, keys are classes and values
+            are corresponding class weights. If None is given, the class
+            weights will be uniform.
+
+    penalty_start : Non-negative integer. The number of columns, variables
+            etc., to be exempt from penalisation. Equivalently, the first
+            index to be penalised. Default is 0, all columns are included.
+
+    mean : Boolean. Whether to compute the mean loss or not. Default is True,
+            the mean loss.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import parsimony.estimators as estimators
+    >>> import parsimony.algorithms.primaldual as primaldual
+    >>> import parsimony.functions.nesterov.tv as total_variation
+    >>> shape = (1, 4, 4)
+    >>> n = 60
+    >>> p = shape[0] * shape[1] * shape[2]
+    >>>
+    >>> np.random.seed(42)
+    >>> y = np.random.randint(0, 3, (n, 1))
+    >>> X = np.random.randn(n, p)
+    >>> X[:, :3] += 2.0 * (y == np.arange(3))
+    >>> A, n_compacts = total_variation.A_from_shape(shape)
+    >>> lr = estimators.MultinomialLogisticRegressionL1L2TV(0.01, 0.1, 0.01, A,
+    ...                      algorithm=primaldual.StaticCONESTA(max_iter=1000))
+    >>> lr = lr.fit(X, y)
+    >>> lr.beta.shape
+    (16, 3)
+    >>> lr.predict(X).shape
+    (60, 1)
+    >>> lr.score(X, y) > 0.8
+    True
+    """
+    def __init__(self, l1, l2, tv,
+                 A=None, mu=consts.TOLERANCE,
+                 algorithm=None, algorithm_params=dict(),
+                 class_weight=None,
+                 penalty_start=0,
+                 mean=True):
+
+        if algorithm is None:
+            algorithm = primaldual.StaticCONESTA(**algorithm_params)
+        else:
+            algorithm.set_params(**algorithm_params)
+
+        super(MultinomialLogisticRegressionL1L2TV, self).__init__(
+                                                     algorithm=algorithm,
+                                                     class_weight=class_weight)
+
+        self.l1 = float(l1)
+        self.l2 = float(l2)
+        self.tv = float(tv)
+
+        if isinstance(algorithm, primaldual.CONESTA) \
+                and self.tv < consts.TOLERANCE:
+            warnings.warn("The TV parameter should be positive.")
+
+        if A is None:
+            raise TypeError("A may not be None.")
+        self.A = A
+
+        try:
+            self.mu = float(mu)
+        except (ValueError, TypeError):
+            self.mu = None
+
+        self.penalty_start = int(penalty_start)
+        self.mean = bool(mean)
+
+    def get_params(self):
+        """Return a dictionary containing all the estimator's parameters.
+        """
+        return {"l1": self.l1, "l2": self.l2, "tv": self.tv,
+                "A": self.A, "mu": self.mu, "class_weight": self.class_weight,
+                "penalty_start": self.penalty_start, "mean": self.mean}
+
+    def fit(self, X, y, beta=None, sample_weight=None):
+        """Fit the estimator to the data.
+
+        Parameters
+        ----------
+        X : Numpy array (n-by-p). The samples.
+
+        y : Numpy array (n-by-1). The class labels. There may be any number
+                of classes.
+
+        beta : Numpy array (p-by-K). The start matrix. Optional.
+
+        sample_weight : Numpy array (n-by-1). The sample weights. Optional.
+        """
+        X, y = check_arrays(X, y)
+        if sample_weight is None:
+            sample_weight = class_weight_to_sample_weight(self.class_weight, y)
+        y, sample_weight = check_arrays(y, sample_weight)
+
+        self.classes = np.unique(y)
+        Y = (y == self.classes).astype(np.float64)
+
+        function = functions.MultinomialLogisticRegressionL1L2TV(X, Y,
+                                              self.l2, self.l1, self.tv,
+                                              A=self.A,
+                                              weights=sample_weight,
+                                              penalty_start=self.penalty_start,
+                                              mean=self.mean)
+
+        self.algorithm.check_compatibility(function,
+                                           self.algorithm.INTERFACES)
+
+        if beta is None:
+            beta = np.hstack([self.start_vector.get_vector(X.shape[1])
+                              for k in xrange(len(self.classes))])
+
+        if self.mu is None:
+            self.mu = function.estimate_mu(beta)
+        else:
+            self.mu = float(self.mu)
+
+        function.set_params(mu=self.mu)
+        self.beta = self.algorithm.run(function, beta)
+
+        return self
+
+    def predict(self, X):
+        """Return the most probable class for every sample in X.
+        """
+        prob = self.predict_probability(X)
+        y = self.classes[np.argmax(prob, axis=1)]
+
+        return y.reshape((-1, 1))
+
+    def predict_probability(self, X):
+        """Return the probability of every class (columns) for every sample
+        (rows) in X.
+        """
+        X = check_arrays(X)
+        logit = np.dot(X, self.beta)
+        logit -= np.max(logit, axis=1)[:, np.newaxis]
+        prob = np.exp(logit)
+        prob /= np.sum(prob, axis=1)[:, np.newaxis]
+
+        return prob
+
+
 class LinearRegressionL2SmoothedL1TV(RegressionEstimator):
     """Linear regression with L2 and simultaneously smoothed L1 and TV
     penalties:
@@ -1827,6 +2075,8 @@ class PLSRegression(RegressionEstimator):
             should be used. Should be one of:
                 1. PLSR()
                 2. MultiblockFISTA(...)
+                3. BlockPLSR(), computes all components at once, from the
+                   deflated cross-product X'Y.
 
             Default is PLSR(...).
 
@@ -1858,6 +2108,11 @@ class PLSRegression(RegressionEstimator):
     >>> error = plsr.fit(X, y).score(X, y)
     >>> print "error = ", error
     error =  0.0222345224457
+    >>>
+    >>> Y = np.random.rand(n, 4)
+    >>> plsr = estimators.PLSRegression(K=4, algorithm=nipals.BlockPLSR())
+    >>> plsr.fit(X, Y).beta.shape
+    (10, 4)
     """
 #    >>>
 #    >>> np.random.seed(42)
@@ -1898,6 +2153,9 @@ class PLSRegression(RegressionEstimator):
         """
         X, Y = check_arrays(X, Y)
 
+        if isinstance(self.algorithm, nipals.BlockPLSR):
+            return _fit_block_pls(self, self.algorithm, X, Y)
+
         n, p = X.shape
         _, q = Y.shape
 
@@ -2008,6 +2266,8 @@ class SparsePLSRegression(RegressionEstimator):
             should be used. Should be one of:
                 1. SparsePLSR()
                 2. MultiblockFISTA(...)
+                3. SparseBlockPLSR(), computes all components at once,
+                   from the deflated cross-product X'Y.
 
             Default is SparsePLSR(...).
 
@@ -2108,6 +2368,14 @@ class SparsePLSRegression(RegressionEstimator):
         """
         X, Y = check_arrays(X, Y)
 
+        if isinstance(self.algorithm, nipals.BlockPLSR):
+            algorithm = self.algorithm
+            if isinstance(algorithm, nipals.SparseBlockPLSR):
+                # The given algorithm is not changed.
+                algorithm = copy.deepcopy(algorithm)
+                algorithm.set_params(l=self.l)
+            return _fit_block_pls(self, algorithm, X, Y)
+
         n, p = X.shape
         _, q = Y.shape
 
@@ -2210,6 +2478,429 @@ class SparsePLSRegression(RegressionEstimator):
         return err
 
 
+class _LinearModel(object):
+    """Base class of fitted (logistic) regression models that predict with
+    X[:, support].B, i.e. only read the columns of X in the support.
+
+    Implementing classes must implement _coefficients and _logistic_models.
+    """
+    def _coefficients(self):
+        """Returns p, the support (None if all variables are used) and B, the
+        coefficients of the variables in the support, one column per model.
+        """
+        raise NotImplementedError('Abstract method "_coefficients" must be '
+                                  'specialised!')
+
+    def _logistic_models(self):
+        """Returns a boolean array that is True for the columns of B that are
+        logistic regression models.
+        """
+        raise NotImplementedError('Abstract method "_logistic_models" must '
+                                  'be specialised!')
+
+    def _linear(self, X):
+
+        p, support, B = self._coefficients()
+        if X.shape[1] != p:
+            raise ValueError("X must have %d columns." % (p,))
+
+        if support is not None:
+            if len(support) == 0:
+                return np.zeros((X.shape[0], B.shape[1]))
+            X = X[:, support]
+
+        if sparse.issparse(X):
+            return np.asarray(X.dot(B))
+        elif sparse.issparse(B):
+            return np.asarray(B.T.dot(np.asarray(X, dtype=np.float64).T).T)
+        else:
+            return np.dot(np.asarray(X, dtype=np.float64), B)
+
+    def predict(self, X):
+        """Returns the predictions, X.beta for regression models and the
+        predicted classes for logistic regression models.
+        """
+        Y = self._linear(X)
+
+        logistic = self._logistic_models()
+        if np.any(logistic):
+            # p(y = 1) < 0.5 <=> X.beta < 0.
+            Y[:, logistic] = Y[:, logistic] >= 0.0
+
+        return Y
+
+    def predict_probability(self, X):
+        """Returns the probabilities, p(y = 1). Only meaningful for logistic
+        regression models.
+        """
+        logit = self._linear(X)
+
+        return maths.logistic(logit)
+
+
+class ModelBank(_LinearModel):
+    """A bank of fitted regression and logistic regression models.
+
+    The coefficient vectors of all models are stacked into one p-by-m matrix,
+    B, so that the predictions of all m models are computed with a single
+    matrix-matrix product, X.B, instead of m matrix-vector products.
+
+    If the models are sparse, only the variables that are non-zero in at
+    least one model are used, i.e. X[:, support].B[support, :]. If the union
+    of the supports is large, but B is still sparse, B is stored as a sparse
+    matrix instead.
+
+    Parameters
+    ----------
+    estimators : List of fitted RegressionEstimator or
+            LogisticRegressionEstimator. The models of the bank. Their beta
+            must be p-by-1 vectors. More models may be added later.
+
+    sparse : Boolean. Whether or not to exploit sparse models. Default is True.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import parsimony.estimators as estimators
+    >>> import parsimony.algorithms.gradient as gradient
+    >>> np.random.seed(42)
+    >>> X = np.random.rand(50, 20)
+    >>> y = np.random.rand(50, 1)
+    >>> models = [estimators.Lasso(l, mean=False).fit(X, y)
+    ...           for l in [0.1, 0.5, 1.0, 2.0]]
+    >>> bank = estimators.ModelBank(models)
+    >>> bank.predict(X).shape
+    (50, 4)
+    >>> np.allclose(bank.score(X, y), [m.score(X, y) for m in models])
+    True
+    >>>
+    >>> y = np.random.randint(0, 2, (50, 1))
+    >>> models = [estimators.RidgeLogisticRegression(l,
+    ...                      algorithm=gradient.GradientDescent(max_iter=1000))
+    ...           for l in [0.1, 1.0, 10.0]]
+    >>> bank = estimators.ModelBank([m.fit(X, y) for m in models])
+    >>> np.all(bank.score(X, y) == [m.score(X, y) for m in models])
+    True
+    >>> np.allclose(bank.predict_probability(X)[:, [1]],
+    ...             models[1].predict_probability(X))
+    True
+    """
+    def __init__(self, estimators=[], sparse=True):
+
+        self.estimators = []
+        self.sparse = bool(sparse)
+
+        self.reset()
+
+        for estimator in estimators:
+            self.add(estimator)
+
+    def reset(self):
+        """Free the stacked coefficients, e.g. after refitting the models.
+        """
+        self._B = None
+        self._Bs = None
+        self._coef = None
+        self._support = None
+        self._logistic = None
+        self._mean = None
+
+    def add(self, estimator):
+        """Adds a fitted model to the bank.
+        """
+        if not isinstance(estimator, (RegressionEstimator,
+                                      LogisticRegressionEstimator)):
+            raise ValueError("Not a regression or logistic regression "
+                             "estimator.")
+        beta = getattr(estimator, "beta", None)
+        if beta is None:
+            raise ValueError("The estimator has not been fitted.")
+        if beta.ndim != 2 or beta.shape[1] != 1:
+            raise ValueError("Only models with a p-by-1 beta are supported.")
+        if len(self.estimators) > 0 \
+                and beta.shape[0] != self.estimators[0].beta.shape[0]:
+            raise ValueError("All models must have the same number of "
+                             "variables.")
+
+        self.estimators.append(estimator)
+        self.reset()
+
+    def beta(self):
+        """Returns the p-by-m matrix of stacked coefficient vectors.
+        """
+        self._stack()
+
+        return self._B
+
+    def predict(self, X):
+        """Returns the n-by-m matrix of predictions of all models.
+
+        Column j contains what estimators[j].predict(X) returns, i.e. X.beta
+        for regression models and the predicted classes for logistic
+        regression models.
+        """
+        return super(ModelBank, self).predict(check_arrays(X))
+
+    def predict_probability(self, X):
+        """Returns the n-by-m matrix of probabilities, p(y = 1), for all
+        models. Only meaningful for the logistic regression models.
+        """
+        return super(ModelBank, self).predict_probability(check_arrays(X))
+
+    def score(self, X, y):
+        """Returns the scores of all models in an array with m elements.
+
+        Element j is what estimators[j].score(X, y) returns: the (mean, if the
+        model has mean=True) squared error for regression models and the rate
+        of correct classification for logistic regression models.
+        """
+        X, y = check_arrays(X, y)
+        n = float(X.shape[0])
+
+        Y = self.predict(X)
+
+        scores = np.sum((Y - y) ** 2.0, axis=0)
+        scores[self._mean] /= n
+
+        logistic = self._logistic
+        if np.any(logistic):
+            scores[logistic] = np.mean(Y[:, logistic] == y, axis=0)
+
+        return scores
+
+    def _coefficients(self):
+
+        self._stack()
+
+        return self._B.shape[0], self._support, self._coef
+
+    def _logistic_models(self):
+
+        self._stack()
+
+        return self._logistic
+
+    def _stack(self):
+
+        if self._B is not None:
+            return
+        if len(self.estimators) == 0:
+            raise ValueError("The model bank is empty.")
+
+        B = np.hstack([estimator.beta for estimator in self.estimators])
+        self._B = B
+        self._coef = B
+        self._logistic = np.array([isinstance(estimator,
+                                              LogisticRegressionEstimator)
+                                   for estimator in self.estimators])
+        self._mean = np.array([getattr(estimator, "mean", True)
+                               for estimator in self.estimators],
+                              dtype=bool) & ~self._logistic
+
+        if self.sparse:
+            p, m = B.shape
+            nonzero = B != 0.0
+            support = np.flatnonzero(np.any(nonzero, axis=1))
+            if len(support) <= 0.5 * p:
+                self._support = support
+                self._coef = B[support, :]
+            elif np.sum(nonzero) <= 0.1 * p * m:
+                self._Bs = sparse.csc_matrix(B)
+                self._coef = self._Bs
+
+
+class CompactModel(_LinearModel):
+    """A fitted (logistic) regression model that only stores the support, the
+    indices of the non-zero coefficients, and their values.
+
+    Predictions only use the columns of X in the support, so their cost is
+    proportional to the size of the support and not to the number of
+    variables. X may be a Numpy array, a memory-mapped array (preferably
+    stored in column-major, Fortran, order, so that only the support columns
+    are read) or a scipy.sparse matrix (preferably csc).
+
+    The model is saved compactly in npz format with save and loaded with
+    load.
+
+    Parameters
+    ----------
+    support : Numpy array of integers. The indices of the non-zero
+            coefficients.
+
+    values : Numpy array. The values of the non-zero coefficients.
+
+    p : Positive integer. The total number of variables.
+
+    logistic : Boolean. Whether it is a logistic regression model or not.
+            Default is False.
+
+    mean : Boolean. Whether score computes the mean squared error or the
+            squared error of regression models. Default is True.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import parsimony.estimators as estimators
+    >>> np.random.seed(42)
+    >>> X = np.random.rand(50, 200)
+    >>> y = np.random.rand(50, 1)
+    >>> lasso = estimators.Lasso(0.5, mean=False).fit(X, y)
+    >>> model = lasso.compact()
+    >>> len(model.support) < 200
+    True
+    >>> np.allclose(model.predict(X), lasso.predict(X))
+    True
+    >>> np.allclose(model.score(X, y), lasso.score(X, y))
+    True
+    >>> np.all(model.beta() == lasso.beta)
+    True
+    """
+    def __init__(self, support, values, p, logistic=False, mean=True):
+
+        self.support = np.asarray(support, dtype=np.int64).ravel()
+        self.values = np.asarray(values, dtype=np.float64).reshape((-1, 1))
+        if self.support.shape[0] != self.values.shape[0]:
+            raise ValueError("The support and the values must have the same "
+                             "number of elements.")
+        self.p = int(p)
+        self.logistic = bool(logistic)
+        self.mean = bool(mean)
+
+    @staticmethod
+    def from_estimator(estimator, eps=0.0):
+        """Creates a CompactModel from a fitted estimator.
+
+        Parameters
+        ----------
+        estimator : RegressionEstimator or LogisticRegressionEstimator. A
+                fitted estimator with a p-by-1 beta.
+
+        eps : Non-negative float. Coefficients with absolute values less than
+                or equal to eps are considered zero. Default is 0.0.
+        """
+        beta = getattr(estimator, "beta", None)
+        if beta is None:
+            raise ValueError("The estimator has not been fitted.")
+        if beta.ndim != 2 or beta.shape[1] != 1:
+            raise ValueError("Only models with a p-by-1 beta are supported.")
+
+        support = np.flatnonzero(np.abs(beta[:, 0]) > eps)
+
+        return CompactModel(support, beta[support, :], beta.shape[0],
+                            logistic=isinstance(estimator,
+                                                LogisticRegressionEstimator),
+                            mean=getattr(estimator, "mean", True))
+
+    @staticmethod
+    def load(file):
+        """Loads a model saved with save.
+
+        Parameters
+        ----------
+        file : String or file. The file to load from.
+        """
+        data = np.load(file)
+        try:
+            model = CompactModel(data["support"], data["values"],
+                                 data["p"], logistic=data["logistic"],
+                                 mean=data["mean"])
+        finally:
+            data.close()
+
+        return model
+
+    def save(self, file):
+        """Saves the model in compressed npz format.
+
+        Parameters
+        ----------
+        file : String or file. The file to save to.
+
+        Examples
+        --------
+        >>> import numpy as np
+        >>> from tempfile import TemporaryFile
+        >>> from parsimony.estimators import CompactModel
+        >>> model = CompactModel([2, 7], [1.5, -0.5], 10)
+        >>> f = TemporaryFile()
+        >>> model.save(f)
+        >>> _ = f.seek(0)
+        >>> model_ = CompactModel.load(f)
+        >>> model_.support, model_.values.ravel(), model_.p
+        (array([2, 7]), array([ 1.5, -0.5]), 10)
+        """
+        np.savez_compressed(file, support=self.support, values=self.values,
+                            p=self.p, logistic=self.logistic, mean=self.mean)
+
+    def beta(self):
+        """Returns the dense p-by-1 coefficient vector.
+        """
+        beta = np.zeros((self.p, 1))
+        beta[self.support, :] = self.values
+
+        return beta
+
+    def _coefficients(self):
+
+        return self.p, self.support, self.values
+
+    def _logistic_models(self):
+
+        return np.array([self.logistic])
+
+    def score(self, X, y):
+        """Returns the (mean) squared error of regression models and the rate
+        of correct classification of logistic regression models.
+        """
+        y = check_arrays(y)
+        yhat = self.predict(X)
+
+        if self.logistic:
+            return np.mean(y == yhat)
+        else:
+            err = np.sum((yhat - y) ** 2.0)
+            if self.mean:
+                err /= float(X.shape[0])
+
+            return err
+
+
+def _fit_block_pls(estimator, algorithm, X, Y):
+    """Fits all components of a PLS estimator at once, with a block
+    algorithm, and sets the W, T, C, U, P, Ws and beta of the estimator.
+
+    The weight vectors are those of the deflated X. The scores t_k = X_k.w_k
+    are X.w_k minus its projection onto the previous scores, i.e. X.W
+    orthogonalised with Gram-Schmidt, and are thus computed from the QR
+    decomposition of X.W.
+    """
+    W, _ = algorithm.run([X, Y], estimator.K)
+
+    Q, R = np.linalg.qr(np.dot(X, W))
+    T = Q * np.diag(R)
+    tt = np.sum(T ** 2.0, axis=0)
+    tt[tt < consts.TOLERANCE] = 1.0
+    C = np.dot(Y.T, T) / tt
+
+    cc = np.sum(C ** 2.0, axis=0)
+    cc[cc < consts.TOLERANCE] = 1.0
+    U = np.dot(Y, C) / cc
+
+    P = np.dot(X.T, T) / tt
+
+    estimator.W = W
+    estimator.T = T
+    estimator.C = C
+    estimator.U = U
+    estimator.P = P
+
+    estimator.Ws = np.dot(W, np.linalg.pinv(np.dot(P.T, W)))
+
+    estimator.beta = np.dot(estimator.Ws, C.T)
+
+    return estimator
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
\ No newline at end of file
@@ -17,13 +17,18 @@ from .combinedfunctions import LinearRegressionL1L2TV
 from .combinedfunctions import LinearRegressionL1L2GL
 from .combinedfunctions import LogisticRegressionL1L2TV
 from .combinedfunctions import LogisticRegressionL1L2GL
+from .combinedfunctions import MultinomialLogisticRegressionL1L2TV
 from .combinedfunctions import LinearRegressionL2SmoothedL1TV
 from .combinedfunctions import PrincipalComponentAnalysisL1TV
+from .combinedfunctions import ShardedFunction
+from .combinedfunctions import FixedMuFunction
 
 __all__ = ["properties", "losses", "penalties",
 
            "CombinedFunction",
            "LinearRegressionL1L2TV", "LinearRegressionL1L2GL",
            "LogisticRegressionL1L2TV", "LogisticRegressionL1L2GL",
+           "MultinomialLogisticRegressionL1L2TV",
            "LinearRegressionL2SmoothedL1TV",
-           "PrincipalComponentAnalysisL1TV"]
\ No newline at end of file
+           "PrincipalComponentAnalysisL1TV",
+           "ShardedFunction", "FixedMuFunction"]
\ No newline at end of file
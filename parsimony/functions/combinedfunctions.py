@@ -25,20 +25,76 @@ from .nesterov.gl import GroupLassoOverlap
 from .penalties import L1, ZeroFunction
 from .losses import RidgeRegression
 from .losses import RidgeLogisticRegression
+from .losses import MultinomialLogisticRegression
 from .losses import LatentVariableVariance
 import parsimony.utils.consts as consts
+import parsimony.utils.maths as maths
 
 __all__ = ["CombinedFunction",
            "LinearRegressionL1L2TV", "LinearRegressionL1L2GL",
            "LogisticRegressionL1L2TV", "LogisticRegressionL1L2GL",
+           "MultinomialLogisticRegressionL1L2TV",
            "LinearRegressionL2SmoothedL1TV",
-           "PrincipalComponentAnalysisL1TV"]
+           "PrincipalComponentAnalysisL1TV",
+           "ShardedFunction", "FixedMuFunction"]
+
+
+def _smoothing_constant(penalty):
+    """The Lipschitz constant of the gradient of a Nesterov function with
+    mu = 1, computed without changing its mu.
+    """
+    if penalty.l < consts.TOLERANCE:
+        return 0.0
+
+    return penalty.l * penalty.lambda_max()
+
+
+def _closed_form_betahat(function):
+    """Whether the beta that minimises the dual function of a squared loss,
+    ridge, L1 and Nesterov function has a closed form, i.e. without L1 or an
+    unpenalised intercept.
+    """
+    return isinstance(function.rr, RidgeRegression) \
+        and function.rr.k > 0.0 \
+        and np.all(np.asarray(function.l1.l) <= 0.0) \
+        and function.penalty_start == 0
+
+
+def _ridge_betahat(function, Ata):
+    """The beta that minimises the dual function when it has a closed form,
+
+        (c.X'X + k.I).beta_hat = c.X'y - A'alpha,
+
+    with c = 1 / n if the loss is the mean squared loss, and c = 1 otherwise.
+    The Cholesky factor of the smaller system is kept by the function.
+    """
+    rr = function.rr
+    c = 1.0 / float(rr.X.shape[0]) if rr.mean else 1.0
+
+    if function._Xty is None:
+        function._Xty = np.dot(rr.X.T, rr.y)
+    solver = function._solver
+    if solver is None or solver.k != rr.k or solver.c != c:
+        solver = maths.RidgeSolver(rr.X, rr.k, c=c)
+        function._solver = solver
+
+    return solver.solve(c * function._Xty - Ata)
+
+
+def _schedule(function):
+    """The continuation schedule of the function.
+    """
+    from parsimony.algorithms.utils import ContinuationSchedule
+
+    return ContinuationSchedule(*function.continuation_constants())
+
 
 # TODO: Add penalty_start and mean to all of these!
 
 
 class CombinedFunction(properties.CompositeFunction,
                        properties.Gradient,
+                       properties.Hessian,
                        properties.ProximalOperator,
                        properties.ProjectionOperator,
                        properties.StepSize):
@@ -153,6 +209,35 @@ class CombinedFunction(properties.CompositeFunction,
 
         return grad
 
+    def hessian(self, x, vector=None):
+        """Hessian of the differentiable part of the function, or the product
+        of the Hessian and a vector if vector is given.
+
+        All loss functions and penalties must have Hessians.
+
+        From the interface "Hessian".
+        """
+        H = 0.0
+        for f in self._f + self._p:
+            if not isinstance(f, properties.Hessian):
+                raise ValueError("Not all functions have Hessians.")
+
+            H += f.hessian(x, vector)
+
+        return H
+
+    def hessian_inverse(self, x, vector=None):
+        """The (pseudo-)inverse of the Hessian of the differentiable part of
+        the function.
+
+        From the interface "Hessian".
+        """
+        Hinv = np.linalg.pinv(self.hessian(x))
+        if vector is None:
+            return Hinv
+        else:
+            return np.dot(Hinv, vector)
+
     def prox(self, x, factor=1.0):
         """The proximal operator of the non-differentiable part of the
         function.
@@ -193,7 +278,8 @@ class CombinedFunction(properties.CompositeFunction,
             for p in self._p:
                 L += p.L()
 
-        if all_lipschitz and L > 0.0:
+        # L has one value for every column if the penalties do.
+        if all_lipschitz and np.all(L > 0.0):
             step = 1.0 / L
         else:
             # If not all functions have Lipschitz continuous gradients, try
@@ -209,16 +295,19 @@ class CombinedFunction(properties.CompositeFunction,
         return step
 
 
-class LinearRegressionL1L2TV(properties.CompositeFunction,
-                             properties.Gradient,
-                             properties.LipschitzContinuousGradient,
-                             nesterov_properties.NesterovFunction,
-                             properties.ProximalOperator,
-                             properties.Continuation,
-                             properties.DualFunction,
-                             properties.StronglyConvex,
-                             properties.StepSize):
-    """Combination (sum) of LinearRegression, L1, L2 and TotalVariation.
+class _L1L2TV(properties.CompositeFunction,
+              properties.Gradient,
+              properties.LipschitzContinuousGradient,
+              nesterov_properties.NesterovFunction,
+              properties.ProximalOperator,
+              properties.Continuation,
+              properties.StronglyConvex,
+              properties.StepSize):
+    """Combination (sum) of a loss, L1, L2 and TotalVariation, without the
+    dual function.
+
+    The dual depends on the loss, so subclasses whose loss has one add the
+    DualFunction interface themselves.
     """
     def __init__(self, X, y, k, l, g, A=None, mu=0.0, penalty_start=0,
                  mean=True):
@@ -271,15 +360,31 @@ class LinearRegressionL1L2TV(properties.CompositeFunction,
         self.tv.reset()
 
         self._Xty = None
-        self._invXXkI = None
-        self._XtinvXXtkI = None
+        self._solver = None
+
+    def set_response(self, y):
+        """Replaces the response vector, but keeps everything that only
+        depends on X and A, e.g. the Lipschitz constants.
+
+        Used when the same problem is solved for many responses, e.g. in
+        permutation tests.
+
+        Parameters
+        ----------
+        y : Numpy array (n-by-1). The new response vector. May also be an
+                n-by-m matrix, with one response for every column of beta.
+        """
+        self.y = y
+        self.rr.y = y
+
+        self._Xty = None
 
     def set_params(self, **kwargs):
 
         mu = kwargs.pop("mu", self.get_mu())
         self.set_mu(mu)
 
-        super(LinearRegressionL1L2TV, self).set_params(**kwargs)
+        super(_L1L2TV, self).set_params(**kwargs)
 
     def get_mu(self):
         """Returns the regularisation constant for the smoothing.
@@ -319,28 +424,42 @@ class LinearRegressionL1L2TV(properties.CompositeFunction,
              + self.l1.f(beta) \
              + self.tv.fmu(beta, mu)
 
-    def phi(self, alpha, beta):
+    def phi(self, alpha, beta, mu=None):
         """ Function value with known alpha.
         """
         return self.rr.f(beta) \
              + self.l1.f(beta) \
-             + self.tv.phi(alpha, beta)
+             + self.tv.phi(alpha, beta, mu=mu)
 
-    def grad(self, beta):
+    def grad(self, beta, mu=None):
         """Gradient of the differentiable part of the function.
 
         From the interface "Gradient".
+
+        Parameters
+        ----------
+        beta : Numpy array. The point at which to evaluate the gradient.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
         """
         return self.rr.grad(beta) \
-             + self.tv.grad(beta)
+             + self.tv.grad(beta, mu=mu)
 
-    def L(self):
+    def L(self, mu=None):
         """Lipschitz constant of the gradient.
 
         From the interface "LipschitzContinuousGradient".
+
+        Parameters
+        ----------
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
         """
         return self.rr.L() \
-             + self.tv.L()
+             + self.tv.L(mu=mu)
 
     def prox(self, beta, factor=1.0):
         """The proximal operator of the non-differentiable part of the
@@ -367,43 +486,41 @@ class LinearRegressionL1L2TV(properties.CompositeFunction,
         """
         return self.tv.M()
 
-    def mu_opt(self, eps):
-        """The optimal value of mu given epsilon.
+    def continuation_constants(self):
+        """Returns the constants of the continuation, (gM, gA2, Lg), where
+        gM is gamma times M, gA2 is gamma times the largest eigenvalue of
+        A'A, and Lg is the Lipschitz constant of the loss.
 
-        From the interface "Continuation".
+        None of them depend on mu, and the state of the function is not
+        changed. See algorithms.utils.ContinuationSchedule.
         """
-        gM = self.tv.l * self.tv.M()
+        gM = self.tv.l * self.M()
+        gA2 = _smoothing_constant(self.tv)  # Gamma is in here!
+        Lg = self.rr.L()
 
-        # Mu is set to 1.0, because it is in fact not here "anymore". It is
-        # factored out in this solution.
-        old_mu = self.tv.set_mu(1.0)
-        gA2 = self.tv.L()  # Gamma is in here!
-        self.tv.set_mu(old_mu)
+        return gM, gA2, Lg
 
-        Lg = self.rr.L()
+    def split(self):
+        """Returns the terms of the function, (loss, penalty, nesterov), where
+        loss is the smooth loss, penalty has a proximal operator, and nesterov
+        is the non-smooth Nesterov function, used without smoothing by
+        primal-dual methods. See algorithms.primaldual.ChambollePock.
+        """
+        return self.rr, self.l1, self.tv
+
+    def mu_opt(self, eps):
+        """The optimal value of mu given epsilon.
 
-        return (-gM * gA2 + np.sqrt((gM * gA2) ** 2.0
-             + gM * Lg * gA2 * eps)) \
-             / (gM * Lg)
+        From the interface "Continuation".
+        """
+        return _schedule(self).mu_opt(eps)
 
     def eps_opt(self, mu):
         """The optimal value of epsilon given mu.
 
         From the interface "Continuation".
         """
-        gM = self.tv.l * self.tv.M()
-
-        # Mu is set to 1.0, because it is in fact not here "anymore". It is
-        # factored out in this solution.
-        old_mu = self.tv.set_mu(1.0)
-        gA2 = self.tv.L()  # Gamma is in here!
-        self.tv.set_mu(old_mu)
-
-        Lg = self.rr.L()
-
-        return (2.0 * gM * gA2 * mu
-             + gM * Lg * mu ** 2.0) \
-             / gA2
+        return _schedule(self).eps_opt(mu)
 
     def eps_max(self, mu):
         """The maximum value of epsilon.
@@ -418,9 +535,7 @@ class LinearRegressionL1L2TV(properties.CompositeFunction,
         -------
         eps : Positive float. The upper limit, the maximum, precision.
         """
-        gM = self.tv.l * self.tv.M()
-
-        return float(mu) * gM
+        return _schedule(self).eps_max(mu)
 
     def mu_max(self, eps):
         """The maximum value of mu.
@@ -436,10 +551,55 @@ class LinearRegressionL1L2TV(properties.CompositeFunction,
         mu : Positive float. The upper limit, the maximum, of the
                 regularisation constant of the smoothing.
         """
-        gM = self.tv.l * self.tv.M()
+        return _schedule(self).mu_max(eps)
+
+    def A(self):
+        """Linear operator of the Nesterov function.
+
+        From the interface "NesterovFunction".
+        """
+        return self.tv.A()
+
+    def Aa(self, alpha):
+        """Computes A^\T\alpha.
+
+        From the interface "NesterovFunction".
+        """
+        return self.tv.Aa(alpha)
+
+    def project(self, a):
+        """ Projection onto the compact space of the Nesterov function.
+
+        From the interface "NesterovFunction".
+        """
+        return self.tv.project(a)
+
+    def parameter(self):
+        """Returns the strongly convex parameter for the function.
+
+        From the interface "StronglyConvex".
+        """
+        return self.rr.k
+
+    def step(self, x, mu=None):
+        """The step size to use in descent methods.
+
+        From the interface "StepSize".
+
+        Parameters
+        ----------
+        x : Numpy array. The point at which to evaluate the step size.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
+        """
+        return 1.0 / self.L(mu=mu)
 
-        return float(eps) / gM
 
+class LinearRegressionL1L2TV(_L1L2TV, properties.DualFunction):
+    """Combination (sum) of LinearRegression, L1, L2 and TotalVariation.
+    """
     def betahat(self, alphak, betak,  # mu_min=consts.TOLERANCE,
                 eps=consts.TOLERANCE, max_iter=consts.MAX_ITER):
         """ Returns the beta that minimises the dual function. Used when we
@@ -455,33 +615,12 @@ class LinearRegressionL1L2TV(properties.CompositeFunction,
             Ata_tv = np.vstack((np.zeros((self.penalty_start, 1)),
                                 Ata_tv))
 
+        # Without L1, beta_hat is the solution of a ridge problem.
+        if _closed_form_betahat(self):
+            return _ridge_betahat(self, Ata_tv)
+
 #        Ata_l1 = self.l1.l * SmoothedL1.project([betak / mu_min])[0]
 #        v = (self._Xty - Ata_tv - Ata_l1)
-#
-#        shape = self.X.shape
-#
-#        if shape[0] > shape[1]:  # If n > p
-#
-#            # Ridge solution
-#            if self._invXXkI is None:
-#                XtXkI = np.dot(self.X.T, self.X)
-#                index = np.arange(min(XtXkI.shape))
-#                XtXkI[index, index] += self.rr.k
-#                self._invXXkI = np.linalg.inv(XtXkI)
-#
-#            beta_hat = np.dot(self._invXXkI, v)
-#
-#        else:  # If p > n
-#            # Ridge solution using the Woodbury matrix identity:
-#            if self._XtinvXXtkI is None:
-#                XXtkI = np.dot(self.X, self.X.T)
-#                index = np.arange(min(XXtkI.shape))
-#                XXtkI[index, index] += self.rr.k
-#                invXXtkI = np.linalg.inv(XXtkI)
-#                self._XtinvXXtkI = np.dot(self.X.T, invXXtkI)
-#
-#            beta_hat = (v - np.dot(self._XtinvXXtkI, np.dot(self.X, v))) \
-#                       / self.rr.k
 
         beta_hat = betak
 
@@ -535,64 +674,23 @@ class LinearRegressionL1L2TV(properties.CompositeFunction,
 #          + self.l1.f(beta_hat) \
 #          + self.tv.phi(alpha, beta_hat)
 
-        old_mu = self.get_mu()
-        self.set_mu(consts.TOLERANCE)
+        # The smoothing is passed explicitly, so the function is not changed.
+        mu = consts.TOLERANCE
 
-        alpha = self.tv.alpha(beta)
+        alpha = self.tv.alpha(beta, mu=mu)
 
         P = self.rr.f(beta) \
           + self.l1.f(beta) \
-          + self.tv.phi(alpha, beta)
+          + self.tv.phi(alpha, beta, mu=mu)
 
         beta_hat = self.betahat(alpha, beta, eps=eps, max_iter=max_iter)
 
         D = self.rr.f(beta_hat) \
           + self.l1.f(beta_hat) \
-          + self.tv.phi(alpha, beta_hat)
-
-        self.set_mu(old_mu)
+          + self.tv.phi(alpha, beta_hat, mu=mu)
 
         return P - D
 
-    def A(self):
-        """Linear operator of the Nesterov function.
-
-        From the interface "NesterovFunction".
-        """
-        return self.tv.A()
-
-    def Aa(self, alpha):
-        """Computes A^\T\alpha.
-
-        From the interface "NesterovFunction".
-        """
-        return self.tv.Aa(alpha)
-
-    def project(self, a):
-        """ Projection onto the compact space of the Nesterov function.
-
-        From the interface "NesterovFunction".
-        """
-        return self.tv.project(a)
-
-    def parameter(self):
-        """Returns the strongly convex parameter for the function.
-
-        From the interface "StronglyConvex".
-        """
-        return self.rr.k
-
-    def step(self, x):
-        """The step size to use in descent methods.
-
-        From the interface "StepSize".
-
-        Parameters
-        ----------
-        x : Numpy array. The point at which to evaluate the step size.
-        """
-        return 1.0 / self.L()
-
 
 class LinearRegressionL1L2GL(LinearRegressionL1L2TV):
     """Combination (sum) of RidgeRegression, L1 and Overlapping Group Lasso.
@@ -648,8 +746,7 @@ class LinearRegressionL1L2GL(LinearRegressionL1L2TV):
         self.gl.reset()
 
         self._Xty = None
-        self._invXXkI = None
-        self._XtinvXXtkI = None
+        self._solver = None
 
     def set_params(self, **kwargs):
 
@@ -697,28 +794,42 @@ class LinearRegressionL1L2GL(LinearRegressionL1L2TV):
              + self.l1.f(beta) \
              + self.gl.fmu(beta, mu)
 
-    def phi(self, alpha, beta):
+    def phi(self, alpha, beta, mu=None):
         """ Function value with known alpha.
         """
         return self.rr.f(beta) \
              + self.l1.f(beta) \
-             + self.gl.phi(alpha, beta)
+             + self.gl.phi(alpha, beta, mu=mu)
 
-    def grad(self, beta):
+    def grad(self, beta, mu=None):
         """Gradient of the differentiable part of the function.
 
         From the interface "Gradient".
+
+        Parameters
+        ----------
+        beta : Numpy array. The point at which to evaluate the gradient.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
         """
         return self.rr.grad(beta) \
-             + self.gl.grad(beta)
+             + self.gl.grad(beta, mu=mu)
 
-    def L(self):
+    def L(self, mu=None):
         """Lipschitz constant of the gradient.
 
         From the interface "LipschitzContinuousGradient".
+
+        Parameters
+        ----------
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
         """
         return self.rr.L() \
-             + self.gl.L()
+             + self.gl.L(mu=mu)
 
     def prox(self, beta, factor=1.0):
         """The proximal operator of the non-differentiable part of the
@@ -745,78 +856,27 @@ class LinearRegressionL1L2GL(LinearRegressionL1L2TV):
         """
         return self.gl.M()
 
-    def mu_opt(self, eps):
-        """The optimal value of mu given epsilon.
+    def continuation_constants(self):
+        """Returns the constants of the continuation, (gM, gA2, Lg), where
+        gM is gamma times M, gA2 is gamma times the largest eigenvalue of
+        A'A, and Lg is the Lipschitz constant of the loss.
 
-        From the interface "Continuation".
+        None of them depend on mu, and the state of the function is not
+        changed. See algorithms.utils.ContinuationSchedule.
         """
         gM = self.gl.l * self.gl.M()
-
-        # Mu is set to 1.0, because it is in fact not here "anymore". It is
-        # factored out in this solution.
-        old_mu = self.gl.set_mu(1.0)
-        gA2 = self.gl.L()  # Gamma is in here!
-        self.gl.set_mu(old_mu)
-
+        gA2 = _smoothing_constant(self.gl)  # Gamma is in here!
         Lg = self.rr.L()
 
-        return (-gM * gA2 + np.sqrt((gM * gA2) ** 2.0
-             + gM * Lg * gA2 * eps)) \
-             / (gM * Lg)
-
-    def eps_opt(self, mu):
-        """The optimal value of epsilon given mu.
-
-        From the interface "Continuation".
-        """
-        gM = self.gl.l * self.gl.M()
-
-        # Mu is set to 1.0, because it is in fact not here "anymore". It is
-        # factored out in this solution.
-        old_mu = self.gl.set_mu(1.0)
-        gA2 = self.gl.L()  # Gamma is in here!
-        self.gl.set_mu(old_mu)
-
-        Lg = self.rr.L()
-
-        return (2.0 * gM * gA2 * mu
-             + gM * Lg * mu ** 2.0) \
-             / gA2
-
-    def eps_max(self, mu):
-        """The maximum value of epsilon.
+        return gM, gA2, Lg
 
-        From the interface "Continuation".
-
-        Parameters
-        ----------
-        mu : Positive float. The regularisation constant of the smoothing.
-
-        Returns
-        -------
-        eps : Positive float. The upper limit, the maximum, precision.
-        """
-        gM = self.gl.l * self.gl.M()
-
-        return float(mu) * gM
-
-    def mu_max(self, eps):
-        """The maximum value of mu.
-
-        From the interface "Continuation".
-
-        Parameters
-        ----------
-        eps : Positive float. The maximum precision of the smoothing.
-
-        Returns
-        -------
-        mu : Positive float. The upper limit, the maximum, of the
-                regularisation constant of the smoothing.
+    def split(self):
+        """Returns the terms of the function, (loss, penalty, nesterov), where
+        loss is the smooth loss, penalty has a proximal operator, and nesterov
+        is the non-smooth Nesterov function, used without smoothing by
+        primal-dual methods. See algorithms.primaldual.ChambollePock.
         """
-        gM = self.gl.l * self.gl.M()
-
-        return float(eps) / gM
+        return self.rr, self.l1, self.gl
 
     def betahat(self, alphak, betak,  # mu_min=consts.TOLERANCE,
                 eps=consts.TOLERANCE, max_iter=consts.MAX_ITER):
@@ -838,6 +898,10 @@ class LinearRegressionL1L2GL(LinearRegressionL1L2TV):
             Ata_gl = np.vstack((np.zeros((self.penalty_start, 1)),
                                 Ata_gl))
 
+        # Without L1, beta_hat is the solution of a ridge problem.
+        if _closed_form_betahat(self):
+            return _ridge_betahat(self, Ata_gl)
+
 ##        Al1 = nesterov.l1.A_from_variables(self.X.shape[1],
 ##                                           penalty_start=self.penalty_start)
 ##        smoothed_l1 = nesterov.l1.L1(self.l1.l, A=Al1, mu=mu_min,
@@ -848,31 +912,6 @@ class LinearRegressionL1L2GL(LinearRegressionL1L2TV):
 #            Ata_l1 = np.vstack((np.zeros((self.penalty_start, 1)),
 #                                Ata_l1))
 #        v = (self._Xty - Ata_gl - Ata_l1)
-#
-#        shape = self.X.shape
-#
-#        if shape[0] > shape[1]:  # If n > p
-#
-#            # Ridge solution
-#            if self._invXXkI is None:
-#                XtXkI = np.dot(self.X.T, self.X)
-#                index = np.arange(min(XtXkI.shape))
-#                XtXkI[index, index] += self.rr.k
-#                self._invXXkI = np.linalg.inv(XtXkI)
-#
-#            beta_hat = np.dot(self._invXXkI, v)
-#
-#        else:  # If p > n
-#            # Ridge solution using the Woodbury matrix identity:
-#            if self._XtinvXXtkI is None:
-#                XXtkI = np.dot(self.X, self.X.T)
-#                index = np.arange(min(XXtkI.shape))
-#                XXtkI[index, index] += self.rr.k
-#                invXXtkI = np.linalg.inv(XXtkI)
-#                self._XtinvXXtkI = np.dot(self.X.T, invXXtkI)
-#
-#            beta_hat = (v - np.dot(self._XtinvXXtkI, np.dot(self.X, v))) \
-#                       / self.rr.k
 
         beta_hat = betak
 
@@ -926,27 +965,25 @@ class LinearRegressionL1L2GL(LinearRegressionL1L2TV):
 #           + self.l1.f(beta_hat_) \
 #           + self.gl.phi(alpha_, beta_hat_)
 
+        # The smoothing is passed explicitly, so the function is not changed.
         mu = consts.TOLERANCE
-        old_mu = self.gl.set_mu(mu)
 
-        alpha = self.gl.alpha(beta)
+        alpha = self.gl.alpha(beta, mu=mu)
 
         P = self.rr.f(beta) \
           + self.l1.f(beta) \
-          + self.gl.phi(alpha, beta)
+          + self.gl.phi(alpha, beta, mu=mu)
 
         beta_hat = self.betahat(alpha, beta, eps=eps, max_iter=max_iter)
 
         D = self.rr.f(beta_hat) \
           + self.l1.f(beta_hat) \
-          + self.gl.phi(alpha, beta_hat)
+          + self.gl.phi(alpha, beta_hat, mu=mu)
 
 #        print "rr.f  :", self.rr.f(beta) - self.rr.f(beta_hat)
 #        print "l1.f  :", self.l1.f(beta) - self.l1.f(beta_hat)
 #        print "gl.phi:", self.gl.phi(alpha, beta) - self.gl.phi(alpha, beta_hat)
 
-        self.gl.set_mu(old_mu)
-
 #        print "old gap:", (P_ - D_), ", new gap:", (P - D)
 #        print "new gap:", (P - D)
 
@@ -973,7 +1010,7 @@ class LinearRegressionL1L2GL(LinearRegressionL1L2TV):
         """
         return self.gl.project(a)
 
-    def step(self, x):
+    def step(self, x, mu=None):
         """The step size to use in descent methods.
 
         From the interface "StepSize".
@@ -981,8 +1018,12 @@ class LinearRegressionL1L2GL(LinearRegressionL1L2TV):
         Parameters
         ----------
         x : Numpy array. The point at which to evaluate the step size.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
         """
-        return 1.0 / self.L()
+        return 1.0 / self.L(mu=mu)
 
 
 class LogisticRegressionL1L2TV(LinearRegressionL1L2TV):
@@ -1036,6 +1077,98 @@ class LogisticRegressionL1L2TV(LinearRegressionL1L2TV):
 
         self.reset()
 
+    def set_response(self, y, weights=None):
+        """Replaces the response vector, but keeps everything that only
+        depends on X and A, e.g. the Lipschitz constants.
+
+        Parameters
+        ----------
+        y : Numpy array (n-by-1). The new class labels.
+
+        weights : Numpy array (n-by-1). The new sample weights. The Lipschitz
+                constant depends on the weights, and is therefore recomputed
+                if the weights are given. Default is None, which keeps the
+                current weights.
+        """
+        super(LogisticRegressionL1L2TV, self).set_response(y)
+
+        if weights is not None:
+            self.rr.weights = weights
+            self.rr.reset()
+        else:
+            self.rr.kernel_reset()
+
+
+class MultinomialLogisticRegressionL1L2TV(_L1L2TV):
+    """Combination (sum) of MultinomialLogisticRegression, L1 and
+    TotalVariation, for a p-by-K matrix of regression coefficients.
+
+    The L1 and TV penalties are applied to every column of the coefficient
+    matrix, with the same linear operator, and the Lipschitz constants are
+    those of a single column. All K classes are thus fitted jointly, with a
+    single continuation schedule.
+    """
+    def __init__(self, X, Y, k, l, g, A=None, mu=0.0, weights=None,
+                 penalty_start=0, mean=True):
+        """
+        Parameters
+        ----------
+        X : Numpy array. The X matrix (n-by-p) for the logistic regression.
+
+        Y : Numpy array. The class indicator matrix (n-by-K) for the logistic
+                regression.
+
+        k : Non-negative float. The Lagrange multiplier, or regularisation
+                constant, for the ridge penalty.
+
+        l : Non-negative float. The Lagrange multiplier, or regularisation
+                constant, for the L1 penalty.
+
+        g : Non-negative float. The Lagrange multiplier, or regularisation
+                constant, of the smoothed TV function.
+
+        A : Numpy array (usually sparse). The linear operator for the Nesterov
+                formulation for TV. May not be None!
+
+        mu : Non-negative float. The regularisation constant for the smoothing
+                of the TV function.
+
+        weights: List with n elements. The sample's weights.
+
+        penalty_start : Non-negative integer. The number of columns, variables
+                etc., to except from penalisation. Equivalently, the first
+                index to be penalised. Default is 0, all columns are included.
+
+        mean : Boolean. Whether to compute the mean loss or not. Default is
+                True, the mean loss is computed.
+        """
+        self.X = X
+        self.y = Y
+
+        self.rr = MultinomialLogisticRegression(X, Y, k,
+                                                weights=weights,
+                                                penalty_start=penalty_start,
+                                                mean=mean)
+        self.l1 = L1(l, penalty_start=penalty_start)
+        self.tv = TotalVariation(g, A=A, mu=mu, penalty_start=penalty_start)
+
+        self.penalty_start = penalty_start
+        self.mean = mean
+
+        self.reset()
+
+    def M(self):
+        """The maximum value of the regularisation of the dual variable. We
+        have
+
+            M = max_{alpha in K} 0.5*|alpha|²_2,
+
+        where there is one dual variable for every column.
+
+        From the interface "NesterovFunction".
+        """
+        return self.y.shape[1] * self.tv.M()
+
 
 class LogisticRegressionL1L2GL(LinearRegressionL1L2GL):
     """Combination (sum) of RidgeLogisticRegression, L1 and TotalVariation.
@@ -1084,11 +1217,13 @@ class LogisticRegressionL1L2GL(LinearRegressionL1L2GL):
 
 
 class LinearRegressionL2SmoothedL1TV(properties.CompositeFunction,
+                                     properties.Gradient,
                                      properties.LipschitzContinuousGradient,
                                      nesterov_properties.NesterovFunction,
                                      properties.GradientMap,
                                      properties.DualFunction,
-                                     properties.StronglyConvex):
+                                     properties.StronglyConvex,
+                                     properties.StepSize):
     """Combination (sum) of Linear Regression, L2 and simultaneously smoothed
     L1 and TotalVariation.
 
@@ -1111,7 +1246,8 @@ class LinearRegressionL2SmoothedL1TV(properties.CompositeFunction,
             formulation of the smoothed TV function. May not be None!
 
     Al1 : Numpy array (usually sparse). The linear operator for the Nesterov
-            formulation of the smoothed L1 function. May not be None!
+            formulation of the smoothed L1 function. Default is None, which
+            means the identity.
 
     mu : Non-negative float. The regularisation constant for the smoothing of
             the TV function.
@@ -1152,7 +1288,7 @@ class LinearRegressionL2SmoothedL1TV(properties.CompositeFunction,
         self.h.reset()
 
         self._Xy = None
-        self._XtinvXXtkI = None
+        self._solver = None
 
     def set_params(self, **kwargs):
 
@@ -1160,6 +1296,12 @@ class LinearRegressionL2SmoothedL1TV(properties.CompositeFunction,
         mu = kwargs.pop("mu", self.get_mu())
         self.set_mu(mu)
 
+        # The regularisation constants of L1TV. This is cheap, since they are
+        # not stored in the linear operators. Note that self.g is the loss.
+        for name in ["l", "g"]:
+            if name in kwargs:
+                self.h.set_params(**{name: float(kwargs.pop(name))})
+
         super(LinearRegressionL2SmoothedL1TV, self).set_params(**kwargs)
 
     def get_mu(self):
@@ -1192,12 +1334,53 @@ class LinearRegressionL2SmoothedL1TV(properties.CompositeFunction,
         return self.g.f(beta) \
              + self.h.f(beta)
 
+    def fmu(self, beta, mu=None):
+        """ Function value of the smoothed function.
+        """
+        return self.g.f(beta) \
+             + self.h.fmu(beta, mu)
+
     def phi(self, alpha, beta):
         """ Function value.
         """
         return self.g.f(beta) \
              + self.h.phi(alpha, beta)
 
+    def grad(self, beta, mu=None):
+        """Gradient of the smoothed function.
+
+        From the interface "Gradient". The function is smooth, so it may be
+        minimised by e.g. GradientDescent.
+
+        Parameters
+        ----------
+        beta : Numpy array. The point at which to evaluate the gradient.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
+        """
+        return self.g.grad(beta) \
+             + self.h.grad(beta, mu=mu)
+
+    def step(self, beta, mu=None):
+        """The step size to use in descent methods, the inverse of the
+        Lipschitz constant of the gradient of the smoothed function.
+
+        From the interface "StepSize". Note that L, from the interface
+        "LipschitzContinuousGradient", is the constant used by the excessive
+        gap method, and not the Lipschitz constant of grad.
+
+        Parameters
+        ----------
+        beta : Numpy array. The point at which to evaluate the step size.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
+        """
+        return 1.0 / (self.g.L() + self.h.L(mu=mu))
+
     def A(self):
         return self.h.A()
 
@@ -1246,12 +1429,21 @@ class LinearRegressionL2SmoothedL1TV(properties.CompositeFunction,
 
         return self.h.project(u_new)
 
-    def alpha(self, beta):
+    def alpha(self, beta, mu=None):
         """ Dual variable of the Nesterov function.
 
         From the interface "NesterovFunction".
+
+        Parameters
+        ----------
+        beta : Numpy array (p-by-1). The variable for which to compute the dual
+                variable alpha.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
         """
-        return self.h.alpha(beta)
+        return self.h.alpha(beta, mu=mu)
 
     def betahat(self, alpha, beta=None):
         """ Returns the beta that minimises the dual function.
@@ -1275,24 +1467,12 @@ class LinearRegressionL2SmoothedL1TV(properties.CompositeFunction,
         if self._Xy is None:
             self._Xy = np.dot(self.X.T, self.y)
 
-        Xty_grad = (self._Xy - grad) / self.g.k
+        # Only a Cholesky factor of the smaller of X'X + kI and XX' + kI is
+        # kept between the calls.
+        if self._solver is None:
+            self._solver = maths.RidgeSolver(self.X, self.g.k)
 
-#        t = time()
-#        XXkI = np.dot(X.T, X)
-#        index = np.arange(min(XXkI.shape))
-#        XXkI[index, index] += self.g.k
-#        invXXkI = np.linalg.inv(XXkI)
-#        print "t:", time() - t
-#        beta = np.dot(invXXkI, Xty_grad)
-
-        if self._XtinvXXtkI is None:
-            XXtkI = np.dot(self.X, self.X.T)
-            index = np.arange(min(XXtkI.shape))
-            XXtkI[index, index] += self.g.k
-            invXXtkI = np.linalg.inv(XXtkI)
-            self._XtinvXXtkI = np.dot(self.X.T, invXXtkI)
-
-        beta = (Xty_grad - np.dot(self._XtinvXXtkI, np.dot(self.X, Xty_grad)))
+        beta = self._solver.solve(self._Xy - grad)
 
         return beta
 
@@ -1378,10 +1558,6 @@ class PrincipalComponentAnalysisL1TV(properties.CompositeFunction,
         self.l1.reset()
         self.tv.reset()
 
-        self._Xty = None
-        self._invXXkI = None
-        self._XtinvXXtkI = None
-
     def set_params(self, **kwargs):
 
         # TODO: This is not a nice solution. Can we solve it better?
@@ -1428,28 +1604,42 @@ class PrincipalComponentAnalysisL1TV(properties.CompositeFunction,
              + self.l1.f(beta) \
              + self.tv.fmu(beta, mu)
 
-    def phi(self, alpha, beta):
+    def phi(self, alpha, beta, mu=None):
         """ Function value with known alpha.
         """
         return self.pca.f(beta) \
              + self.l1.f(beta) \
-             + self.tv.phi(alpha, beta)
+             + self.tv.phi(alpha, beta, mu=mu)
 
-    def grad(self, beta):
+    def grad(self, beta, mu=None):
         """Gradient of the differentiable part of the function.
 
         From the interface "Gradient".
+
+        Parameters
+        ----------
+        beta : Numpy array. The point at which to evaluate the gradient.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
         """
         return self.pca.grad(beta) \
-             + self.tv.grad(beta)
+             + self.tv.grad(beta, mu=mu)
 
-    def L(self):
+    def L(self, mu=None):
         """Lipschitz constant of the gradient.
 
         From the interface "LipschitzContinuousGradient".
+
+        Parameters
+        ----------
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
         """
         return self.pca.L() \
-             + self.tv.L()
+             + self.tv.L(mu=mu)
 
     def prox(self, beta, factor=1.0):
         """The proximal operator of the non-differentiable part of the
@@ -1476,43 +1666,33 @@ class PrincipalComponentAnalysisL1TV(properties.CompositeFunction,
         """
         return self.tv.M()
 
-    def mu_opt(self, eps):
-        """The optimal value of mu given epsilon.
+    def continuation_constants(self):
+        """Returns the constants of the continuation, (gM, gA2, Lg), where
+        gM is gamma times M, gA2 is gamma times the largest eigenvalue of
+        A'A, and Lg is the Lipschitz constant of the loss.
 
-        From the interface "Continuation".
+        None of them depend on mu, and the state of the function is not
+        changed. See algorithms.utils.ContinuationSchedule.
         """
         gM = self.tv.l * self.tv.M()
+        gA2 = _smoothing_constant(self.tv)  # Gamma is in here!
+        Lg = self.pca.L()
 
-        # Mu is set to 1.0, because it is in fact not here "anymore". It is
-        # factored out in this solution.
-        old_mu = self.tv.set_mu(1.0)
-        gA2 = self.tv.L()  # Gamma is in here!
-        self.tv.set_mu(old_mu)
+        return gM, gA2, Lg
 
-        Lg = self.rr.L()
+    def mu_opt(self, eps):
+        """The optimal value of mu given epsilon.
 
-        return (-gM * gA2 + np.sqrt((gM * gA2) ** 2.0
-             + gM * Lg * gA2 * eps)) \
-             / (gM * Lg)
+        From the interface "Continuation".
+        """
+        return _schedule(self).mu_opt(eps)
 
     def eps_opt(self, mu):
         """The optimal value of epsilon given mu.
 
         From the interface "Continuation".
         """
-        gM = self.tv.l * self.tv.M()
-
-        # Mu is set to 1.0, because it is in fact not here "anymore". It is
-        # factored out in this solution.
-        old_mu = self.tv.set_mu(1.0)
-        gA2 = self.tv.L()  # Gamma is in here!
-        self.tv.set_mu(old_mu)
-
-        Lg = self.rr.L()
-
-        return (2.0 * gM * gA2 * mu
-             + gM * Lg * mu ** 2.0) \
-             / gA2
+        return _schedule(self).eps_opt(mu)
 
     def eps_max(self, mu):
         """The maximum value of epsilon.
@@ -1527,9 +1707,7 @@ class PrincipalComponentAnalysisL1TV(properties.CompositeFunction,
         -------
         eps : Positive float. The upper limit, the maximum, precision.
         """
-        gM = self.tv.l * self.tv.M()
-
-        return float(mu) * gM
+        return _schedule(self).eps_max(mu)
 
     def mu_max(self, eps):
         """The maximum value of mu.
@@ -1545,9 +1723,7 @@ class PrincipalComponentAnalysisL1TV(properties.CompositeFunction,
         mu : Positive float. The upper limit, the maximum, of the
                 regularisation constant of the smoothing.
         """
-        gM = self.tv.l * self.tv.M()
-
-        return float(eps) / gM
+        return _schedule(self).mu_max(eps)
 
     def betahat(self, alphak, betak):
         """ Returns the beta that minimises the dual function. Used when we
@@ -1564,31 +1740,6 @@ class PrincipalComponentAnalysisL1TV(properties.CompositeFunction,
 #        Ata_l1 = self.l1.l * SmoothedL1.project([betak / consts.TOLERANCE])[0]
 #        v = (self._Xty - Ata_tv - Ata_l1)
 #
-#        shape = self.X.shape
-#
-#        if shape[0] > shape[1]:  # If n > p
-#
-#            # Ridge solution
-#            if self._invXXkI is None:
-#                XtXkI = np.dot(self.X.T, self.X)
-#                index = np.arange(min(XtXkI.shape))
-#                XtXkI[index, index] += self.rr.k
-#                self._invXXkI = np.linalg.inv(XtXkI)
-#
-#            beta_hat = np.dot(self._invXXkI, v)
-#
-#        else:  # If p > n
-#            # Ridge solution using the Woodbury matrix identity:
-#            if self._XtinvXXtkI is None:
-#                XXtkI = np.dot(self.X, self.X.T)
-#                index = np.arange(min(XXtkI.shape))
-#                XXtkI[index, index] += self.rr.k
-#                invXXtkI = np.linalg.inv(XXtkI)
-#                self._XtinvXXtkI = np.dot(self.X.T, invXXtkI)
-#
-#            beta_hat = (v - np.dot(self._XtinvXXtkI, np.dot(self.X, v))) \
-#                       / self.rr.k
-#
 #        return beta_hat
 
     def gap(self, beta, beta_hat=None):
@@ -1640,7 +1791,7 @@ class PrincipalComponentAnalysisL1TV(properties.CompositeFunction,
         """
         return self.rr.k
 
-    def step(self, x):
+    def step(self, x, mu=None):
         """The step size to use in descent methods.
 
         From the interface "StepSize".
@@ -1648,5 +1799,174 @@ class PrincipalComponentAnalysisL1TV(properties.CompositeFunction,
         Parameters
         ----------
         x : Numpy array. The point at which to evaluate the step size.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
+        """
+        return 1.0 / self.L(mu=mu)
+
+
+class ShardedFunction(properties.CompositeFunction):
+    """The sum of a loss function over row shards of the data, and a penalty:
+
+        f(beta) = sum_k loss_k(beta) + penalty(beta),
+
+    where loss_k is the loss on the k:th shard of the rows of X and y.
+
+    The shards are either loss functions, or callables without arguments that
+    return the loss function of the shard, e.g. by loading the shard from
+    disk. In the latter case, the data of a shard need only be held by the
+    worker that owns it (see parsimony.algorithms.distributed).
+
+    Parameters
+    ----------
+    shards : List of Functions or callables. The loss functions of the
+            shards. Note that the losses are summed, so for the mean loss over
+            all samples, use losses with mean=False and divide the penalty
+            parameters by the total number of samples.
+
+    penalty : Function. The penalty. Default is None, no penalty.
+    """
+    def __init__(self, shards, penalty=None):
+
+        self.shards = list(shards)
+        if penalty is None:
+            penalty = ZeroFunction()
+        self.penalty = penalty
+
+        self.reset()
+
+    def reset(self):
+
+        for shard in self.shards:
+            if isinstance(shard, properties.Function):
+                shard.reset()
+        self.penalty.reset()
+
+    def f(self, beta):
+        """Function value.
+
+        Shards that are callables are loaded for this evaluation.
+        """
+        f = self.penalty.f(beta)
+        for shard in self.shards:
+            f += shard_function(shard).f(beta)
+
+        return f
+
+
+def shard_function(shard):
+    """Returns the loss function of a shard, that is either a Function or a
+    callable that returns one.
+    """
+    if isinstance(shard, properties.Function):
+        return shard
+
+    return shard()
+
+
+class FixedMuFunction(properties.CompositeFunction,
+                      properties.Gradient,
+                      properties.LipschitzContinuousGradient,
+                      properties.StepSize,
+                      properties.ProximalOperator,
+                      properties.StronglyConvex):
+    """A view of a smoothed function with a fixed value of mu.
+
+    The methods of the view pass mu explicitly to the methods of the function,
+    which is never changed. Several views, with different values of mu, may
+    therefore share the same function, and be minimised concurrently, e.g. by
+    different threads, provided that the loss of the function may be
+    evaluated concurrently. This holds for the linear and logistic regression
+    losses, whose caches are either only filled once or kept per thread.
+
+    Parameters
+    ----------
+    function : Function. A function whose methods grad, L and step accept the
+            smoothing parameter mu, e.g. LinearRegressionL1L2TV.
+
+    mu : Non-negative float. The regularisation constant for the smoothing.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import parsimony.functions.nesterov.tv as tv
+    >>> from parsimony.functions.combinedfunctions import LinearRegressionL1L2TV
+    >>> from parsimony.functions.combinedfunctions import FixedMuFunction
+    >>>
+    >>> np.random.seed(42)
+    >>> X = np.random.rand(10, 5)
+    >>> y = np.random.rand(10, 1)
+    >>> A, _ = tv.A_from_shape((5,))
+    >>> function = LinearRegressionL1L2TV(X, y, 0.1, 0.1, 0.1, A=A, mu=1.0)
+    >>> view = FixedMuFunction(function, 0.01)
+    >>> beta = np.random.rand(5, 1)
+    >>> np.allclose(view.grad(beta), function.grad(beta, mu=0.01))
+    True
+    >>> function.get_mu()
+    1.0
+    """
+    def __init__(self, function, mu):
+
+        self.function = function
+        self.mu = max(0.0, float(mu))
+
+    def reset(self):
+
+        self.function.reset()
+
+    def get_mu(self):
+        """Returns the regularisation constant for the smoothing.
+        """
+        return self.mu
+
+    def f(self, beta):
+        """Function value of the underlying, non-smoothed, function.
         """
-        return 1.0 / self.L()
\ No newline at end of file
+        return self.function.f(beta)
+
+    def fmu(self, beta):
+        """Function value of the smoothed function.
+        """
+        return self.function.fmu(beta, mu=self.mu)
+
+    def grad(self, beta):
+        """Gradient of the differentiable part of the smoothed function.
+
+        From the interface "Gradient".
+        """
+        return self.function.grad(beta, mu=self.mu)
+
+    def L(self):
+        """Lipschitz constant of the gradient.
+
+        From the interface "LipschitzContinuousGradient".
+        """
+        return self.function.L(mu=self.mu)
+
+    def step(self, x):
+        """The step size to use in descent methods.
+
+        From the interface "StepSize".
+        """
+        return self.function.step(x, mu=self.mu)
+
+    def prox(self, beta, factor=1.0):
+        """The proximal operator of the non-differentiable part of the
+        function.
+
+        From the interface "ProximalOperator".
+        """
+        return self.function.prox(beta, factor)
+
+    def parameter(self):
+        """Returns the strongly convex parameter of the function, or zero if
+        the function is not strongly convex.
+
+        From the interface "StronglyConvex".
+        """
+        if isinstance(self.function, properties.StronglyConvex):
+            return self.function.parameter()
+
+        return 0.0
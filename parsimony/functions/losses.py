@@ -18,6 +18,8 @@ Copyright (c) 2013-2014, CEA/DSV/I2BM/Neurospin. All rights reserved.
 @email:   lofstedt.tommy@gmail.com, edouard.duchesnay@cea.fr
 @license: BSD 3-clause.
 """
+import threading
+
 import numpy as np
 
 try:
@@ -28,6 +30,7 @@ import parsimony.utils as utils
 
 __all__ = ["LinearRegression", "RidgeRegression",
            "LogisticRegression", "RidgeLogisticRegression",
+           "MultinomialLogisticRegression",
            "LatentVariableVariance", "LinearFunction"]
 
 
@@ -63,6 +66,22 @@ class LinearRegression(properties.CompositeFunction,
         From the interface "Function".
         """
         self._L = None
+        self._XtX = None
+        self._Xty = None
+
+    def set_params(self, **kwargs):
+        """Sets the given attributes, e.g. y, and frees the results that
+        depend on them.
+
+        From the interface "Function".
+        """
+        super(LinearRegression, self).set_params(**kwargs)
+
+        if set(kwargs.keys()) <= set(["y"]):
+            # X'X and the Lipschitz constant do not depend on y.
+            self._Xty = None
+        else:
+            self.reset()
 
     def f(self, beta):
         """Function value.
@@ -105,7 +124,17 @@ class LinearRegression(properties.CompositeFunction,
         >>> np.linalg.norm(lr.grad(beta) - lr.approx_grad(beta, eps=1e-4))
         1.2935592057892195e-08
         """
-        grad = np.dot(self.X.T, np.dot(self.X, beta) - self.y)
+        n, p = self.X.shape
+        if beta.shape[1] > 1 and n > p:
+            # Many columns, e.g. one for every value on a grid of
+            # regularisation constants. Then X'X.B - X'y is cheaper.
+            if self._XtX is None:
+                self._XtX = np.dot(self.X.T, self.X)
+            if self._Xty is None:
+                self._Xty = np.dot(self.X.T, self.y)
+            grad = np.dot(self._XtX, beta) - self._Xty
+        else:
+            grad = np.dot(self.X.T, np.dot(self.X, beta) - self.y)
 
         if self.mean:
             grad /= float(self.X.shape[0])
@@ -272,7 +301,8 @@ class RidgeRegression(properties.CompositeFunction,
             gradOLS /= float(self.X.shape[0])
 
         if self.penalty_start > 0:
-            gradL2 = np.vstack((np.zeros((self.penalty_start, 1)),
+            gradL2 = np.vstack((np.zeros((self.penalty_start,
+                                          beta.shape[1])),
                                 self.k * beta[self.penalty_start:, :]))
         else:
             gradL2 = self.k * beta
@@ -331,8 +361,170 @@ class RidgeRegression(properties.CompositeFunction,
         return 1.0 / self.L()
 
 
+class LogisticKernel(object):
+    """Numerically stable computations shared by the logistic regression
+    losses.
+
+    The function value, the gradient and the probabilities are computed in
+    one pass over X.beta, into buffers that are allocated once and reused.
+    The results are kept until the functions are evaluated at a different
+    beta, so that e.g. f and grad at the same point share all computations.
+
+    Every thread has its own buffers and results, so that the same function
+    may be evaluated concurrently by several threads.
+
+    The log-likelihood is computed with
+
+        log(1 + exp(z)) = max(z, 0) + log(1 + exp(-|z|)),
+
+    and the probabilities with
+
+        1 / (1 + exp(-z)) = 1 / (1 + exp(-|z|))           if z >= 0,
+                          = exp(-|z|) / (1 + exp(-|z|))   if z < 0,
+
+    which neither overflow nor lose precision for large |z|.
+
+    Implementing classes must have the attributes X, y, weights and mean,
+    and call kernel_reset from their reset method, and whenever X, y or
+    weights are changed.
+    """
+    def kernel_reset(self):
+        """Frees the buffers and the results of the last computation.
+        """
+        # The buffers and results of every thread. They are freed with the
+        # thread.
+        self._kernel_states = threading.local()
+
+    def __getstate__(self):
+        # The buffers and results are not copied, nor pickled, since the
+        # thread-local storage can not be.
+        state = self.__dict__.copy()
+        state.pop("_kernel_states", None)
+
+        return state
+
+    def __setstate__(self, state):
+
+        self.__dict__.update(state)
+        self.kernel_reset()
+
+    def kernel_f(self, beta):
+        """The (mean) negative log-likelihood at beta.
+        """
+        state = self._kernel_update(beta)
+
+        negloglike = state["negloglike"]
+        if self.mean:
+            negloglike /= float(self.X.shape[0])
+
+        return negloglike
+
+    def kernel_grad(self, beta):
+        """The gradient of the (mean) negative log-likelihood at beta.
+        """
+        state = self._kernel_update(beta)
+
+        if state["grad"] is None:
+            # The buffer is free once the function value has been computed.
+            r = np.subtract(self.y, state["pi"], out=state["buff"])
+            r *= self.weights
+            grad = -np.dot(self.X.T, r)
+            if self.mean:
+                grad /= float(self.X.shape[0])
+            state["grad"] = grad
+
+        return state["grad"].copy()
+
+    def kernel_pi(self, beta):
+        """The probabilities p(y = 1 | x_i, beta).
+        """
+        state = self._kernel_update(beta)
+
+        return state["pi"].copy()
+
+    def kernel_hessian(self, beta, vector=None):
+        """The Hessian of the (mean) negative log-likelihood at beta, X'DX,
+        with D = diag(wi * pi * (1 - pi)).
+
+        If vector is given, the Hessian-vector product X'D(X.vector) is
+        returned instead, without ever forming the Hessian. This costs two
+        matrix-vector products with X.
+        """
+        state = self._kernel_update(beta)
+
+        if state["d"] is None:
+            d = state["pi"] * (1.0 - state["pi"])
+            d *= self.weights
+            state["d"] = d
+        d = state["d"]
+
+        if vector is None:
+            H = np.dot(self.X.T, d * self.X)
+        else:
+            H = np.dot(self.X.T, d * np.dot(self.X, vector))
+        if self.mean:
+            H /= float(self.X.shape[0])
+
+        return H
+
+    def _kernel_update(self, beta):
+        """Returns the buffers and results of the current thread, updated to
+        beta.
+        """
+        state = getattr(self._kernel_states, "state", None)
+        if state is None:
+            state = dict(beta=None, Xbeta=None)
+            self._kernel_states.state = state
+
+        if state["beta"] is not None and state["beta"].shape == beta.shape \
+                and np.array_equal(state["beta"], beta):
+            return state
+
+        n = self.X.shape[0]
+        shape = (n, beta.shape[1])
+        if state["Xbeta"] is None or state["Xbeta"].shape != shape:
+            dtype = np.result_type(self.X, beta, float)
+            state["Xbeta"] = np.empty(shape, dtype=dtype)
+            state["exp"] = np.empty(shape, dtype=dtype)
+            state["pi"] = np.empty(shape, dtype=dtype)
+            state["buff"] = np.empty(shape, dtype=dtype)
+
+        z = state["Xbeta"]
+        z[:] = np.dot(self.X, beta)
+
+        # e = exp(-|z|) is in (0, 1], so nothing overflows.
+        e = state["exp"]
+        np.abs(z, out=e)
+        np.negative(e, out=e)
+        np.exp(e, out=e)
+
+        # The negative log-likelihood terms, log(1 + exp(z)) - y.z.
+        pi = state["pi"]
+        terms = state["buff"]
+        np.log1p(e, out=terms)
+        np.maximum(z, 0.0, out=pi)
+        terms += pi
+        np.multiply(self.y, z, out=pi)
+        terms -= pi
+        terms *= self.weights
+        state["negloglike"] = np.sum(terms)
+
+        # The probabilities, 1 / (1 + exp(-z)).
+        np.add(1.0, e, out=pi)
+        np.reciprocal(pi, out=pi)
+        np.multiply(pi, e, out=pi, where=z < 0.0)
+
+        state["beta"] = beta.copy()
+        state["grad"] = None
+        state["d"] = None
+
+        return state
+
+
 class LogisticRegression(properties.AtomicFunction,
+                         LogisticKernel,
                          properties.Gradient,
+                         properties.Hessian,
                          properties.LipschitzContinuousGradient,
                          properties.StepSize):
     """The Logistic Regression loss function.
@@ -376,6 +568,21 @@ class LogisticRegression(properties.AtomicFunction,
         From the interface "Function".
         """
         self._L = None
+        self.kernel_reset()
+
+    def set_params(self, **kwargs):
+        """Sets the given attributes, e.g. y or weights, and frees the results
+        that depend on them.
+
+        From the interface "Function".
+        """
+        super(LogisticRegression, self).set_params(**kwargs)
+
+        if set(kwargs.keys()) <= set(["y"]):
+            # The Lipschitz constant does not depend on y.
+            self.kernel_reset()
+        else:
+            self.reset()
 
     def f(self, beta):
         """Function value at the point beta.
@@ -386,15 +593,21 @@ class LogisticRegression(properties.AtomicFunction,
         ----------
         beta : Numpy array. Regression coefficient vector. The point at which
                 to evaluate the function.
-        """
-        Xbeta = np.dot(self.X, beta)
-        negloglike = -np.sum(self.weights *
-                                ((self.y * Xbeta) - np.log(1 + np.exp(Xbeta))))
-
-        if self.mean:
-            negloglike /= float(self.X.shape[0])
 
-        return negloglike
+        Examples
+        --------
+        >>> import numpy as np
+        >>> from parsimony.functions.losses import LogisticRegression
+        >>>
+        >>> X = np.array([[1.0], [-1.0]])
+        >>> y = np.array([[1.0], [0.0]])
+        >>> lr = LogisticRegression(X=X, y=y, mean=False)
+        >>> lr.f(np.array([[1000.0]]))
+        0.0
+        >>> lr.f(np.array([[-1000.0]]))
+        2000.0
+        """
+        return self.kernel_f(beta)
 
     def grad(self, beta):
         """Gradient of the function at beta.
@@ -426,15 +639,59 @@ class LogisticRegression(properties.AtomicFunction,
         >>> np.linalg.norm(lr.grad(beta) - lr.approx_grad(beta, eps=1e-4))
         3.9366299418257381e-08
         """
-        Xbeta = np.dot(self.X, beta)
-        pi = 1.0 / (1.0 + np.exp(-Xbeta))
+        return self.kernel_grad(beta)
 
-        grad = -np.dot(self.X.T, self.weights * (self.y - pi))
+    def hessian(self, beta, vector=None):
+        """The Hessian of the function at beta, X'DX with
+        D = diag(wi * pi * (1 - pi)).
 
-        if self.mean:
-            grad /= float(self.X.shape[0])
+        From the interface "Hessian".
 
-        return grad
+        Parameters
+        ----------
+        beta : Numpy array. The point at which to evaluate the Hessian.
+
+        vector : Numpy array. If not None, the product of the Hessian and this
+                vector is returned instead. The Hessian is then never formed.
+
+        Examples
+        --------
+        >>> import numpy as np
+        >>> from parsimony.functions.losses import LogisticRegression
+        >>>
+        >>> np.random.seed(42)
+        >>> X = np.random.rand(100, 15)
+        >>> y = np.random.randint(0, 2, (100, 1))
+        >>> lr = LogisticRegression(X=X, y=y, mean=True)
+        >>> beta = np.random.rand(15, 1)
+        >>> v = np.random.rand(15, 1)
+        >>> Hv = lr.hessian(beta, v)
+        >>> np.allclose(Hv, np.dot(lr.hessian(beta), v))
+        True
+        >>> eps = 1e-6
+        >>> Hv_ = (lr.grad(beta + eps * v) - lr.grad(beta - eps * v)) / 2e-6
+        >>> np.linalg.norm(Hv - Hv_) < 1e-8
+        True
+        """
+        return self.kernel_hessian(beta, vector)
+
+    def hessian_inverse(self, beta, vector=None):
+        """The (pseudo-)inverse of the Hessian of the function at beta.
+
+        From the interface "Hessian".
+
+        Parameters
+        ----------
+        beta : Numpy array. The point at which to evaluate the Hessian.
+
+        vector : Numpy array. If not None, the product of the inverse Hessian
+                and this vector is returned instead.
+        """
+        Hinv = np.linalg.pinv(self.kernel_hessian(beta))
+        if vector is None:
+            return Hinv
+        else:
+            return np.dot(Hinv, vector)
 
     def L(self):
         """Lipschitz constant of the gradient.
@@ -489,7 +746,9 @@ class LogisticRegression(properties.AtomicFunction,
 
 
 class RidgeLogisticRegression(properties.CompositeFunction,
+                              LogisticKernel,
                               properties.Gradient,
+                              properties.Hessian,
                               properties.LipschitzContinuousGradient,
                               properties.StepSize):
     """The Logistic Regression loss function with a squared L2 penalty.
@@ -544,6 +803,21 @@ class RidgeLogisticRegression(properties.CompositeFunction,
         From the interface "Function".
         """
         self._L = None
+        self.kernel_reset()
+
+    def set_params(self, **kwargs):
+        """Sets the given attributes, e.g. y or weights, and frees the results
+        that depend on them.
+
+        From the interface "Function".
+        """
+        super(RidgeLogisticRegression, self).set_params(**kwargs)
+
+        if set(kwargs.keys()) <= set(["y"]):
+            # The Lipschitz constant does not depend on y.
+            self.kernel_reset()
+        else:
+            self.reset()
 
     def f(self, beta):
         """Function value of Logistic regression at beta.
@@ -554,12 +828,7 @@ class RidgeLogisticRegression(properties.CompositeFunction,
                 to evaluate the function.
         """
         # TODO check the correctness of the re-weighted loglike
-        Xbeta = np.dot(self.X, beta)
-        negloglike = -np.sum(self.weights *
-                             ((self.y * Xbeta) - np.log(1 + np.exp(Xbeta))))
-
-        if self.mean:
-            negloglike /= float(self.X.shape[0])
+        negloglike = self.kernel_f(beta)
 
         if self.penalty_start > 0:
             beta_ = beta[self.penalty_start:, :]
@@ -602,15 +871,11 @@ class RidgeLogisticRegression(properties.CompositeFunction,
         >>> np.linalg.norm(rr.grad(beta) - rr.approx_grad(beta, eps=1e-4))
         3.5290185882784444e-08
         """
-        Xbeta = np.dot(self.X, beta)
-        pi = 1.0 / (1.0 + np.exp(-Xbeta))
-
-        grad = -np.dot(self.X.T, self.weights * (self.y - pi))
-        if self.mean:
-            grad /= float(self.X.shape[0])
+        grad = self.kernel_grad(beta)
 
         if self.penalty_start > 0:
-            gradL2 = np.vstack((np.zeros((self.penalty_start, 1)),
+            gradL2 = np.vstack((np.zeros((self.penalty_start,
+                                          beta.shape[1])),
                                 self.k * beta[self.penalty_start:, :]))
         else:
             gradL2 = self.k * beta
@@ -619,6 +884,73 @@ class RidgeLogisticRegression(properties.CompositeFunction,
 
         return grad
 
+    def hessian(self, beta, vector=None):
+        """The Hessian of the function at beta, X'DX + k.I with
+        D = diag(wi * pi * (1 - pi)), where the unpenalised rows of I are
+        zero.
+
+        From the interface "Hessian".
+
+        Parameters
+        ----------
+        beta : Numpy array. The point at which to evaluate the Hessian.
+
+        vector : Numpy array. If not None, the product of the Hessian and this
+                vector is returned instead. The Hessian is then never formed.
+
+        Examples
+        --------
+        >>> import numpy as np
+        >>> from parsimony.functions.losses import RidgeLogisticRegression
+        >>>
+        >>> np.random.seed(42)
+        >>> X = np.random.rand(100, 15)
+        >>> y = np.random.randint(0, 2, (100, 1))
+        >>> rr = RidgeLogisticRegression(X=X, y=y, k=0.5, penalty_start=1)
+        >>> beta = np.random.rand(15, 1)
+        >>> v = np.random.rand(15, 1)
+        >>> np.allclose(rr.hessian(beta, v), np.dot(rr.hessian(beta), v))
+        True
+        >>> np.allclose(rr.hessian_inverse(beta, rr.hessian(beta, v)), v)
+        True
+        """
+        H = self.kernel_hessian(beta, vector)
+
+        if vector is None:
+            idx = np.arange(self.penalty_start, H.shape[0])
+            H[idx, idx] += self.k
+        else:
+            start = self.penalty_start
+            H[start:, :] += self.k * vector[start:, :]
+
+        return H
+
+    def hessian_inverse(self, beta, vector=None):
+        """The (pseudo-)inverse of the Hessian of the function at beta.
+
+        From the interface "Hessian".
+
+        Parameters
+        ----------
+        beta : Numpy array. The point at which to evaluate the Hessian.
+
+        vector : Numpy array. If not None, the product of the inverse Hessian
+                and this vector is returned instead.
+        """
+        H = self.hessian(beta)
+        if self.k > 0.0 and self.penalty_start == 0:
+            # Positive definite.
+            if vector is None:
+                return np.linalg.inv(H)
+            else:
+                return np.linalg.solve(H, vector)
+
+        Hinv = np.linalg.pinv(H)
+        if vector is None:
+            return Hinv
+        else:
+            return np.dot(Hinv, vector)
+
 #        return -np.dot(self.X.T,
 #                       np.dot(self.W, (self.y - pi))) \
 #                       + self.k * beta
@@ -657,6 +989,216 @@ class RidgeLogisticRegression(properties.CompositeFunction,
         return 1.0 / self.L()
 
 
+class MultinomialLogisticRegression(properties.CompositeFunction,
+                                    properties.Gradient,
+                                    properties.LipschitzContinuousGradient,
+                                    properties.StepSize):
+    """The multinomial (softmax) logistic regression loss function with a
+    squared L2 penalty.
+
+    Ridge (re-weighted) log-likelihood (cross-entropy) for K classes:
+
+    * f(B) = -Sum wi Sum_k yik log(pik) + k/2 * ||B||^2_F
+           = -Sum wi (Sum_k yik xi'bk - log(Sum_k e(xi'bk))) + k/2 * ||B||^2_F
+
+    * grad f(B) = -X'W(Y - P) + k B
+
+    where B is the p-by-K matrix of regression coefficients, with columns bk,
+    Y is the n-by-K class indicator matrix, pik = p(y=k | xi, B) =
+    e(xi'bk) / Sum_j e(xi'bj) and wi is the weight for sample i.
+
+    The function value and the gradient are computed from the same product
+    X.B, which is kept until the functions are evaluated at another B. Since
+    the Hessian of the log-sum-exp is bounded by (1 / 2) * I, the Lipschitz
+    constant of the gradient is bounded by the largest eigenvalue of
+    (1 / 2) * X'WX, for all classes at once.
+
+    Parameters
+    ----------
+    X : Numpy array (n-by-p). The regressor matrix.
+
+    Y : Numpy array (n-by-K). The class indicator matrix, with a one in column
+            k for the samples in class k and zeros elsewhere.
+
+    k : Non-negative float. The ridge parameter.
+
+    weights: Numpy array (n-by-1). The sample's weights.
+
+    penalty_start : Non-negative integer. The number of columns, variables
+            etc., to except from penalisation. Equivalently, the first index
+            to be penalised. Default is 0, all columns are included.
+
+    mean : Boolean. Whether to compute the mean loss or not. Default is True,
+            the mean loss is computed.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from parsimony.functions.losses import MultinomialLogisticRegression
+    >>> from parsimony.functions.losses import LogisticRegression
+    >>>
+    >>> np.random.seed(42)
+    >>> X = np.random.rand(100, 15)
+    >>> y = np.random.randint(0, 3, (100, 1))
+    >>> Y = (y == np.arange(3)).astype(float)
+    >>> mlr = MultinomialLogisticRegression(X, Y, k=0.5)
+    >>> B = np.random.rand(15, 3)
+    >>> np.linalg.norm(mlr.grad(B) - mlr.approx_grad(B, eps=1e-4)) < 1e-8
+    True
+    >>>
+    >>> # With two classes, it is the (binary) logistic regression loss.
+    >>> Y = np.hstack((1.0 - Y[:, [0]], Y[:, [0]]))
+    >>> mlr = MultinomialLogisticRegression(X, Y)
+    >>> lr = LogisticRegression(X, Y[:, [1]])
+    >>> b = np.random.rand(15, 1)
+    >>> B = np.hstack((np.zeros((15, 1)), b))
+    >>> np.allclose(mlr.f(B), lr.f(b))
+    True
+    >>> np.allclose(mlr.grad(B)[:, [1]], lr.grad(b))
+    True
+    """
+    def __init__(self, X, Y, k=0.0, weights=None, penalty_start=0,
+                 mean=True):
+
+        self.X = X
+        self.Y = Y
+        self.k = max(0.0, float(k))
+        if weights is None:
+            weights = np.ones((Y.shape[0], 1))
+        self.weights = weights
+        self.penalty_start = max(0, int(penalty_start))
+        self.mean = bool(mean)
+
+        self.reset()
+
+    def reset(self):
+        """Free any cached computations from previous use of this Function.
+
+        From the interface "Function".
+        """
+        self._L = None
+        # The last (beta, negative log-likelihood, probabilities). Replaced
+        # as a whole, so that concurrent threads never see a mix.
+        self._cache = None
+
+    def set_params(self, **kwargs):
+        """Sets the given attributes, e.g. Y or weights, and frees the results
+        that depend on them.
+
+        From the interface "Function".
+        """
+        super(MultinomialLogisticRegression, self).set_params(**kwargs)
+
+        if set(kwargs.keys()) <= set(["Y"]):
+            # The Lipschitz constant does not depend on Y.
+            self._cache = None
+        else:
+            self.reset()
+
+    def f(self, beta):
+        """Function value at the point beta.
+
+        From the interface "Function".
+
+        Parameters
+        ----------
+        beta : Numpy array (p-by-K). Regression coefficient matrix. The point
+                at which to evaluate the function.
+        """
+        negloglike, P = self._update(beta)
+        if self.mean:
+            negloglike /= float(self.X.shape[0])
+
+        if self.penalty_start > 0:
+            beta_ = beta[self.penalty_start:, :]
+        else:
+            beta_ = beta
+
+        return negloglike + (self.k / 2.0) * np.sum(beta_ ** 2.0)
+
+    def grad(self, beta):
+        """Gradient of the function at beta.
+
+        From the interface "Gradient".
+
+        Parameters
+        ----------
+        beta : Numpy array (p-by-K). The point at which to evaluate the
+                gradient.
+        """
+        negloglike, P = self._update(beta)
+
+        R = self.Y - P
+        R *= self.weights
+        grad = -np.dot(self.X.T, R)
+        if self.mean:
+            grad /= float(self.X.shape[0])
+
+        if self.k > 0.0:
+            start = self.penalty_start
+            grad[start:, :] += self.k * beta[start:, :]
+
+        return grad
+
+    def predict_probability(self, beta):
+        """The class probabilities p(y = k | xi, beta) (n-by-K).
+        """
+        negloglike, P = self._update(beta)
+
+        return P.copy()
+
+    def L(self):
+        """Lipschitz constant of the gradient.
+
+        Returns the maximum eigenvalue of (1 / 2) * X'WX + k.
+
+        From the interface "LipschitzContinuousGradient".
+        """
+        if self._L is None:
+            # The Hessian of log(Sum_k e(zk)) is bounded by (1 / 2) * I.
+            PWX = np.sqrt(0.5 * self.weights) * self.X
+            s = np.linalg.svd(PWX, full_matrices=False, compute_uv=False)
+            self._L = np.max(s) ** 2.0
+
+            if self.mean:
+                self._L /= float(self.X.shape[0])
+
+            self._L += self.k
+
+        return self._L
+
+    def step(self, beta, index=0):
+        """The step size to use in descent methods.
+
+        Parameters
+        ----------
+        beta : Numpy array. The point at which to determine the step size.
+        """
+        return 1.0 / self.L()
+
+    def _update(self, beta):
+        """Returns the negative log-likelihood and the probabilities at beta.
+        """
+        cache = self._cache
+        if cache is not None and cache[0].shape == beta.shape \
+                and np.array_equal(cache[0], beta):
+            return cache[1], cache[2]
+
+        Z = np.dot(self.X, beta)
+
+        # Stable log-sum-exp and softmax.
+        Z -= np.max(Z, axis=1)[:, np.newaxis]
+        P = np.exp(Z)
+        s = np.sum(P, axis=1)[:, np.newaxis]
+        P /= s
+
+        terms = np.log(s) - np.sum(self.Y * Z, axis=1)[:, np.newaxis]
+        negloglike = np.sum(self.weights * terms)
+        self._cache = (beta.copy(), negloglike, P)
+
+        return negloglike, P
+
+
 class LatentVariableVariance(properties.Function,
                              properties.Gradient,
                              properties.StepSize,
@@ -68,11 +68,21 @@ class CombinedMultiblockFunction(mb_properties.MultiblockFunction,
 
     constraints : A list of lists. Element i of the outer list is also a list
             that contains the constraints for block i.
+
+    cache_size : Non-negative integer. The maximum number of bytes to use for
+            storing cross-products of LatentVariableCovariance functions. The
+            cross-products are computed for the pairs of blocks where they
+            make the gradients cheaper, i.e. when the blocks have few columns
+            compared to the number of rows. Default is 256 MiB. Use 0 to never
+            compute the cross-products.
     """
-    def __init__(self, X, functions=[], penalties=[], prox=[], constraints=[]):
+    def __init__(self, X, functions=[], penalties=[], prox=[], constraints=[],
+                 cache_size=256 * 1024 ** 2):
 
         self.K = len(X)
         self.X = X
+        self.cache_size = max(0, int(cache_size))
+        self._cached = False
 
         if len(functions) != self.K:
             self._f = [0] * self.K
@@ -138,6 +148,17 @@ class CombinedMultiblockFunction(mb_properties.MultiblockFunction,
             for cik in ci:
                 cik.reset()
 
+        self._cached = False
+
+    def _update_cache(self):
+
+        if not self._cached:
+            _cache_cross_products([fijk for fi in self._f
+                                        for fij in fi
+                                            for fijk in fij],
+                                  self.cache_size)
+            self._cached = True
+
     def add_function(self, function, i, j):
         """Add a function that connects blocks i and j.
 
@@ -157,6 +178,7 @@ class CombinedMultiblockFunction(mb_properties.MultiblockFunction,
                 raise ValueError("Functions must have gradients.")
 
         self._f[i][j].append(function)
+        self._cached = False
 
     def add_penalty(self, penalty, i):
 
@@ -202,6 +224,8 @@ class CombinedMultiblockFunction(mb_properties.MultiblockFunction,
         ----------
         w : List of numpy arrays. The weight vectors.
         """
+        self._update_cache()
+
         val = 0.0
 
         for i in xrange(len(self._f)):
@@ -228,7 +252,7 @@ class CombinedMultiblockFunction(mb_properties.MultiblockFunction,
 
         return val
 
-    def grad(self, w, index):
+    def grad(self, w, index, mu=None):
         """Gradient of the differentiable part of the function.
 
         From the interface "MultiblockGradient".
@@ -239,7 +263,13 @@ class CombinedMultiblockFunction(mb_properties.MultiblockFunction,
                 which to evaluate the gradient.
 
         index : Non-negative integer. Which variable the step is for.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing of the Nesterov functions. Default is None, which
+                means that the functions' mu is used.
         """
+        self._update_cache()
+
         grad = np.zeros(w[index].shape)
 
         # Add gradients from the loss functions.
@@ -271,7 +301,7 @@ class CombinedMultiblockFunction(mb_properties.MultiblockFunction,
 
         Ni = self._N[index]
         for k in xrange(len(Ni)):
-            grad += Ni[k].grad(w[index])
+            grad += Ni[k].grad(w[index], mu=mu)
 
         return grad
 
@@ -339,7 +369,7 @@ class CombinedMultiblockFunction(mb_properties.MultiblockFunction,
 
         return proj_w
 
-    def step(self, w, index):
+    def step(self, w, index, mu=None):
         """The step size to use in descent methods.
 
         From the interface "StepSize".
@@ -349,6 +379,10 @@ class CombinedMultiblockFunction(mb_properties.MultiblockFunction,
         w : Numpy array. The point at which to determine the step size.
 
         index : Non-negative integer. The variable which the step is for.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing of the Nesterov functions. Default is None, which
+                means that the functions' mu is used.
         """
         all_lipschitz = True
         L = 0.0
@@ -410,7 +444,7 @@ class CombinedMultiblockFunction(mb_properties.MultiblockFunction,
                 all_lipschitz = False
                 break
             else:
-                L += Ni[k].L()  # w[index])
+                L += Ni[k].L(mu=mu)  # w[index])
 
         step = 0.0
         if all_lipschitz and L > 0.0:
@@ -441,13 +475,13 @@ class CombinedMultiblockFunction(mb_properties.MultiblockFunction,
                     # Temporarily replace the index:th variable with x.
                     w_old = self.w[self.index]
                     self.w[self.index] = x
-                    g = self.func.grad(w, index)
+                    g = self.func.grad(w, index, mu=mu)
                     self.w[self.index] = w_old
 
                     return g
 
             func = F(self, w, index)
-            p = -self.grad(w, index)
+            p = -self.grad(w, index, mu=mu)
 
             from parsimony.algorithms.utils import BacktrackingLineSearch
             import parsimony.functions.penalties as penalties
@@ -532,6 +566,38 @@ class MultiblockNesterovFunctionWrapper(MultiblockFunctionWrapper,
                                                                 w,
                                                                 index)
 
+    def grad(self, w, mu=None):
+        """Gradient of the function.
+
+        Parameters
+        ----------
+        w : Numpy array (p-by-1). The point at which to evaluate the gradient.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
+        """
+        return self.function.grad(self.w[:self.index] + \
+                                  [w] + \
+                                  self.w[self.index + 1:],
+                                  self.index, mu=mu)
+
+    def step(self, w, index=0, mu=None):
+        """The step size to use in descent methods.
+
+        Parameters
+        ----------
+        w : Numpy array. The point at which to determine the step size.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
+        """
+        return self.function.step(self.w[:self.index] + \
+                                  [w] + \
+                                  self.w[self.index + 1:],
+                                  self.index, mu=mu)
+
     def get_params(self, *args):
 
         Ni = self.function._N[self.index]
@@ -780,7 +846,38 @@ class LatentVariableCovariance(mb_properties.MultiblockFunction,
                            mb_properties.MultiblockGradient,
                            mb_properties.MultiblockLipschitzContinuousGradient,
                            properties.Eigenvalues):
+    """The negative covariance between two latent variables,
+
+        f(w, c) = -Cov(X.w, Y.c).
 
+    When the cross-product X'Y has been computed, with cache_cross_product,
+    the function value and the gradients are computed from it, in O(pq)
+    instead of O(n(p + q)) time.
+
+    Parameters
+    ----------
+    X : List of two numpy arrays. The two blocks, X and Y.
+
+    unbiased : Boolean. Whether to use the unbiased (divide by n - 1) or the
+            biased (divide by n) estimate of the covariance. Default is True,
+            the unbiased estimate.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from parsimony.functions.multiblock.losses import \\
+    ...         LatentVariableCovariance
+    >>> np.random.seed(42)
+    >>> X = np.random.rand(100, 10)
+    >>> Y = np.random.rand(100, 5)
+    >>> w = [np.random.rand(10, 1), np.random.rand(5, 1)]
+    >>> cov = LatentVariableCovariance([X, Y])
+    >>> f, g = cov.f(w), cov.grad(w, 1)
+    >>> cov.cache_cross_product().shape
+    (10, 5)
+    >>> np.allclose(f, cov.f(w)) and np.allclose(g, cov.grad(w, 1))
+    True
+    """
     def __init__(self, X, unbiased=True):
 
         self.X = X
@@ -794,15 +891,39 @@ class LatentVariableCovariance(mb_properties.MultiblockFunction,
     def reset(self):
 
         self._lambda_max = None
+        self._XtY = None
+
+    def cache_cross_product(self, XtY=None):
+        """Computes and stores the cross-product X'Y. It is used by all
+        following evaluations, until the function is reset.
+
+        Parameters
+        ----------
+        XtY : Numpy array, p-by-q. The cross-product, if it has already been
+                computed (e.g. shared with another function). Optional.
+
+        Returns
+        -------
+        XtY : Numpy array, p-by-q. The stored cross-product.
+        """
+        if XtY is None:
+            XtY = np.dot(self.X[0].T, self.X[1])
+
+        self._XtY = XtY
+
+        return XtY
 
     def f(self, w):
         """Function value.
 
         From the interface "Function".
         """
-        wX = np.dot(self.X[0], w[0]).T
-        Yc = np.dot(self.X[1], w[1])
-        wXYc = np.dot(wX, Yc)
+        if self._XtY is not None:
+            wXYc = np.dot(w[0].T, np.dot(self._XtY, w[1]))
+        else:
+            wX = np.dot(self.X[0], w[0]).T
+            Yc = np.dot(self.X[1], w[1])
+            wXYc = np.dot(wX, Yc)
         return -wXYc[0, 0] / float(self.n)
 
     def grad(self, w, index):
@@ -811,8 +932,15 @@ class LatentVariableCovariance(mb_properties.MultiblockFunction,
         From the interface "MultiblockGradient".
         """
         index = int(index)
-        grad = -np.dot(self.X[index].T,
-                       np.dot(self.X[1 - index], w[1 - index])) / float(self.n)
+        if self._XtY is not None:
+            if index == 0:
+                grad = -np.dot(self._XtY, w[1]) / float(self.n)
+            else:
+                grad = -np.dot(self._XtY.T, w[0]) / float(self.n)
+        else:
+            grad = -np.dot(self.X[index].T,
+                           np.dot(self.X[1 - index], w[1 - index]))
+            grad /= float(self.n)
 
 #        def fun(x):
 #            w_ = [0, 0]
@@ -842,14 +970,58 @@ class LatentVariableCovariance(mb_properties.MultiblockFunction,
 
         From the interface "Eigenvalues".
         """
-        # Note that we can save the state here since lmax(A) does not
+        # Note that we can save the state here since lmax(A) does not change.
+        if self._lambda_max is None:
+            from parsimony.algorithms.nipals import FastSVD, FastSVDProduct
+            if self._XtY is not None:
+                v = FastSVD().run(self._XtY, max_iter=100)
+                s = np.dot(self._XtY, v)
+            else:
+                v = FastSVDProduct().run(self.X[0].T, self.X[1], max_iter=100)
+                s = np.dot(self.X[0].T, np.dot(self.X[1], v))
 
-        from algorithms import FastSVDProduct
-        svd = FastSVDProduct()
-        v = svd(self.X[0].T, self.X[1], max_iter=100)
-        s = np.dot(self.X[0].T, np.dot(self.X[1], v))
+            self._lambda_max = np.sum(s ** 2.0) / (self.n ** 2.0)
 
-        return np.sum(s ** 2.0) / (self.n ** 2.0)
+        return self._lambda_max
+
+
+def _cache_cross_products(functions, cache_size):
+    """Stores the cross-products of the LatentVariableCovariance functions,
+    for the block pairs where this makes the gradients cheaper.
+
+    A cross-product of a p-by-q pair makes the gradients cost O(pq) instead
+    of O(n(p + q)). The pairs with the largest savings are cached first, and
+    the products are shared between functions on the same, or transposed,
+    pair of blocks. The total size of the products is at most cache_size
+    bytes.
+    """
+    candidates = []
+    for function in functions:
+        if not isinstance(function, LatentVariableCovariance):
+            continue
+        X, Y = function.X
+        if not isinstance(X, np.ndarray) or not isinstance(Y, np.ndarray):
+            continue
+        n, p = X.shape
+        q = Y.shape[1]
+        saving = n * (p + q) - p * q
+        if saving > 0:
+            candidates.append((saving, function))
+
+    candidates.sort(key=lambda c: c[0], reverse=True)
+
+    products = dict()
+    for saving, function in candidates:
+        X, Y = function.X
+        if (id(X), id(Y)) in products:
+            function.cache_cross_product(products[(id(X), id(Y))])
+        elif (id(Y), id(X)) in products:
+            function.cache_cross_product(products[(id(Y), id(X))].T)
+        else:
+            size = X.shape[1] * Y.shape[1] * np.result_type(X, Y).itemsize
+            if size <= cache_size:
+                cache_size -= size
+                products[(id(X), id(Y))] = function.cache_cross_product()
 
 
 class GeneralisedMultiblock(mb_properties.MultiblockFunction,
@@ -861,10 +1033,25 @@ class GeneralisedMultiblock(mb_properties.MultiblockFunction,
 #                            NesterovFunction, Continuation, DualFunction
                             ):
 
-    def __init__(self, X, functions):
+    """A multiblock function given by a function matrix.
+
+    Parameters
+    ----------
+    X : List of numpy arrays. The blocks of data in the multiblock model.
+
+    functions : List of lists. A function matrix. Element i,j, for i != j, is
+            a function, or None, that connects block i to block j. Element i,i
+            is a list of functions of block i.
+
+    cache_size : Non-negative integer. The maximum number of bytes to use for
+            storing cross-products of LatentVariableCovariance functions.
+            Default is 256 MiB. Use 0 to never compute the cross-products.
+    """
+    def __init__(self, X, functions, cache_size=256 * 1024 ** 2):
 
         self.X = X
         self.functions = functions
+        self.cache_size = max(0, int(cache_size))
 
         self.reset()
 
@@ -879,9 +1066,23 @@ class GeneralisedMultiblock(mb_properties.MultiblockFunction,
                     if not self.functions[i][j] is None:
                         self.functions[i][j].reset()
 
+        self._cached = False
+
+    def _update_cache(self):
+
+        if not self._cached:
+            _cache_cross_products([self.functions[i][j]
+                                   for i in xrange(len(self.functions))
+                                       for j in xrange(len(self.functions[i]))
+                                           if i != j],
+                                  self.cache_size)
+            self._cached = True
+
     def f(self, w):
         """Function value.
         """
+        self._update_cache()
+
         val = 0.0
         for i in xrange(len(self.functions)):
             fi = self.functions[i]
@@ -907,6 +1108,8 @@ class GeneralisedMultiblock(mb_properties.MultiblockFunction,
 
         From the interface "MultiblockGradient".
         """
+        self._update_cache()
+
         grad = 0.0
         fi = self.functions[index]
         for j in xrange(len(fi)):
@@ -104,7 +104,7 @@ class GroupLassoOverlap(properties.AtomicFunction,
 
         return self.l * (normsum - self.c)
 
-    def phi(self, alpha, beta):
+    def phi(self, alpha, beta, mu=None):
         """Function value with known alpha.
 
         From the interface "NesterovFunction".
@@ -123,7 +123,8 @@ class GroupLassoOverlap(properties.AtomicFunction,
         for a in alpha:
             alpha_sqsum += np.sum(a ** 2.0)
 
-        mu = self.get_mu()
+        if mu is None:
+            mu = self.get_mu()
 
         return self.l * ((np.dot(beta_.T, Aa)[0, 0]
                           - (mu / 2.0) * alpha_sqsum) - self.c)
@@ -145,17 +146,26 @@ class GroupLassoOverlap(properties.AtomicFunction,
 
         return normsum <= self.c
 
-    def L(self):
+    def L(self, mu=None):
         """ Lipschitz constant of the gradient.
 
         From the interface "LipschitzContinuousGradient".
+
+        Parameters
+        ----------
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
         """
         if self.l < consts.TOLERANCE:
             return 0.0
 
+        if mu is None:
+            mu = self.get_mu()
+
         lmaxA = self.lambda_max()
 
-        return self.l * lmaxA / self.mu
+        return self.l * lmaxA / mu
 
     def lambda_max(self):
         """ Largest eigenvalue of the corresponding covariance matrix.
@@ -101,7 +101,7 @@ class L1(properties.AtomicFunction,
 #        return self.l * ((np.dot(beta.T, Aa)[0, 0]
 #                          - (mu / 2.0) * alpha_sqsum) - self.c)
 
-    def phi(self, alpha, beta):
+    def phi(self, alpha, beta, mu=None):
         """ Function value with known alpha.
 
         From the interface "NesterovFunction".
@@ -114,27 +114,33 @@ class L1(properties.AtomicFunction,
         else:
             beta_ = beta
 
+        if mu is None:
+            mu = self.get_mu()
+
         return self.l * ((np.dot(alpha[0].T, beta_)[0, 0]
-                         - (self.mu / 2.0) * np.sum(alpha[0] ** 2.0)) - self.c)
+                         - (mu / 2.0) * np.sum(alpha[0] ** 2.0)) - self.c)
 
-    def grad(self, beta):
+    def grad(self, beta, mu=None):
         """ Gradient of the function at beta.
 
         From the interface "Gradient". Overloaded since we can do it faster
         than the default.
         """
-        alpha = self.alpha(beta)
+        alpha = self.alpha(beta, mu=mu)
 
         return self.l * alpha[0]
 
-    def L(self):
+    def L(self, mu=None):
         """ Lipschitz constant of the gradient.
 
         From the interface "LipschitzContinuousGradient".
         """
-        return self.l / self.mu
+        if mu is None:
+            mu = self.get_mu()
+
+        return self.l / mu
 
-    def alpha(self, beta):
+    def alpha(self, beta, mu=None):
         """ Dual variable of the Nesterov function.
 
         From the interface "NesterovFunction". Overloaded since we can do it
@@ -145,7 +151,10 @@ class L1(properties.AtomicFunction,
         else:
             beta_ = beta
 
-        alpha = self.project([beta_ / self.mu])
+        if mu is None:
+            mu = self.get_mu()
+
+        alpha = self.project([beta_ / mu])
 
         return alpha
 
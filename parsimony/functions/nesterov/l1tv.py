@@ -30,12 +30,20 @@ __all__ = ["L1TV", "A_from_mask", "A_from_shape"]
 class L1TV(properties.AtomicFunction,
            NesterovFunction,
            properties.Penalty,
+           properties.Gradient,
+           properties.LipschitzContinuousGradient,
            properties.Eigenvalues):
     """The proximal operator of the smoothed sum of the TV and L1 functions
 
         f(beta) = (l * L1(beta) + g * TV(beta))_mu,
 
     where (...)_mu means that what's within parentheses is smoothed.
+
+    The linear operators are not copied. The operators returned by A() are
+    scaled by the current l and g when they are applied, so that l and g may
+    be changed, e.g. with set_params, without rebuilding any matrices. The
+    operator of the L1 part is the identity, applied without a matrix, unless
+    another operator is given.
     """
     def __init__(self, l, g, Atv=None, Al1=None, mu=0.0, penalty_start=0):
         """
@@ -51,7 +59,8 @@ class L1TV(properties.AtomicFunction,
                 total variation part. May not be None.
 
         Al1 : A (usually sparse) matrix. The linear operator for the smoothed
-                L1 part. May not be None.
+                L1 part. Default is None, which means the identity. An
+                identity matrix is not stored.
 
         mu : Non-negative float. The regularisation constant for the smoothing.
 
@@ -63,14 +72,14 @@ class L1TV(properties.AtomicFunction,
 
         # WARNING: Number of non-zero rows may differ from p.
         self._p = Atv[0].shape[1]
-        if Al1 is None:
-            Al1 = sparse.eye(self._p, self._p)
-        elif isinstance(Al1, (list, tuple)):
+        if isinstance(Al1, (list, tuple)):
             Al1 = Al1[0]
-        A = [l * Al1,
-             g * Atv[0],
-             g * Atv[1],
-             g * Atv[2]]
+        if Al1 is None \
+                or (Al1.shape[0] == self._p and _is_identity(Al1)):
+            Al1 = _Identity(self._p)
+
+        # The unscaled operators. The constants are applied in A().
+        A = [Al1, Atv[0], Atv[1], Atv[2]]
 
         super(L1TV, self).__init__(l, A=A, mu=mu, penalty_start=penalty_start)
 
@@ -78,7 +87,20 @@ class L1TV(properties.AtomicFunction,
 
     def reset(self):
 
-        self._lambda_max = None
+        self._lambda_max_tv = None
+
+    def A(self):
+        """Linear operator of the Nesterov function, i.e. l.Al1 and g.Atv.
+
+        From the interface "NesterovFunction". The operators are scaled by
+        the current l and g when they are applied. No matrix is copied.
+        """
+        A = self._A
+
+        return [_ScaledOperator(self.l, A[0]),
+                _ScaledOperator(self.g, A[1]),
+                _ScaledOperator(self.g, A[2]),
+                _ScaledOperator(self.g, A[3])]
 
     def f(self, beta):
         """ Function value.
@@ -109,7 +131,7 @@ class L1TV(properties.AtomicFunction,
         if mu is None:
             mu = self.get_mu()
 
-        alpha = self.alpha(beta)
+        alpha = self.alpha(beta, mu=mu)
         alpha_sqsum = 0.0
         for a in alpha:
             alpha_sqsum += np.sum(a ** 2.0)
@@ -118,7 +140,7 @@ class L1TV(properties.AtomicFunction,
 
         return np.dot(beta.T, Aa)[0, 0] - (mu / 2.0) * alpha_sqsum
 
-    def phi(self, alpha, beta):
+    def phi(self, alpha, beta, mu=None):
         """ Function value with known alpha.
 
         From the interface "NesterovFunction".
@@ -137,35 +159,78 @@ class L1TV(properties.AtomicFunction,
         else:
             beta_ = beta
 
-        return np.dot(beta_.T, Aa)[0, 0] - (self.mu / 2.0) * alpha_sqsum
+        if mu is None:
+            mu = self.get_mu()
+
+        return np.dot(beta_.T, Aa)[0, 0] - (mu / 2.0) * alpha_sqsum
 
-    def lambda_max(self):
-        """ Largest eigenvalue of the corresponding covariance matrix.
+    def grad(self, beta, mu=None):
+        """ Gradient of the smoothed function at beta.
 
-        From the interface "Eigenvalues".
+        From the interface "Gradient". Overloaded since the regularisation
+        constants are already in the A matrices.
+
+        Parameters
+        ----------
+        beta : Numpy array. The point at which to evaluate the gradient.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
         """
-        # Note that we can save the state here since lmax(A) does not change.
-        if len(self._A) == 4 and self._A[2].nnz == 0 and self._A[3].nnz == 0:
-#        if len(self._shape) == 3 \
-#            and self._shape[0] == 1 and self._shape[1] == 1:
-            # TODO: Instead of p, this should really be the number of non-zero
-            # rows of A.
-            p = self._A[1].shape[0]
-            lmaxTV = 2.0 * (1.0 - math.cos(float(p - 1) * math.pi
-                                           / float(p)))
-            self._lambda_max = lmaxTV * self.g ** 2.0 + self.l ** 2.0
+        alpha = self.alpha(beta, mu=mu)
+        grad = self.Aa(alpha)
+
+        if self.penalty_start > 0:
+            grad = np.vstack((np.zeros((self.penalty_start, beta.shape[1])),
+                              grad))
+
+        return grad
+
+    def L(self, mu=None):
+        """ Lipschitz constant of the gradient.
 
-        elif self._lambda_max is None:
+        From the interface "LipschitzContinuousGradient".
 
-            from parsimony.algorithms.nipals import FastSparseSVD
+        Parameters
+        ----------
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
+        """
+        if mu is None:
+            mu = self.get_mu()
+
+        return self.lambda_max() / mu
 
-            A = sparse.vstack(self.A()[1:])
-            # TODO: Add max_iter here!!
-            v = FastSparseSVD().run(A)  # , max_iter=max_iter)
-            us = A.dot(v)
-            self._lambda_max = np.sum(us ** 2.0) + self.l ** 2.0
+    def lambda_max(self):
+        """ Largest eigenvalue of the corresponding covariance matrix.
 
-        return self._lambda_max
+        From the interface "Eigenvalues".
+        """
+        # Note that we can save the state here since lmax(A) does not change.
+        # Only the eigenvalue of the unscaled TV operator is saved, so that l
+        # and g may change.
+        if self._lambda_max_tv is None:
+            if self._A[2].nnz == 0 and self._A[3].nnz == 0:
+#            if len(self._shape) == 3 \
+#                and self._shape[0] == 1 and self._shape[1] == 1:
+                # TODO: Instead of p, this should really be the number of
+                # non-zero rows of A.
+                p = self._A[1].shape[0]
+                self._lambda_max_tv = 2.0 * (1.0 - math.cos(float(p - 1)
+                                                            * math.pi
+                                                            / float(p)))
+            else:
+                from parsimony.algorithms.nipals import FastSparseSVD
+
+                A = sparse.vstack(self._A[1:])
+                # TODO: Add max_iter here!!
+                v = FastSparseSVD().run(A)  # , max_iter=max_iter)
+                us = A.dot(v)
+                self._lambda_max_tv = np.sum(us ** 2.0)
+
+        return self._lambda_max_tv * self.g ** 2.0 + self.l ** 2.0
 
 #    """ Linear operator of the Nesterov function.
 #
@@ -188,7 +253,7 @@ class L1TV(properties.AtomicFunction,
 #
 #        return Aa
 
-    def alpha(self, beta):
+    def alpha(self, beta, mu=None):
         """ Dual variable of the Nesterov function.
 
         From the interface "NesterovFunction". Overloaded since we need to do
@@ -201,11 +266,14 @@ class L1TV(properties.AtomicFunction,
         else:
             beta_ = beta
 
+        if mu is None:
+            mu = self.get_mu()
+
         a = [0] * len(A)
-        a[0] = (1.0 / self.mu) * A[0].dot(beta_)
-        a[1] = (1.0 / self.mu) * A[1].dot(beta_)
-        a[2] = (1.0 / self.mu) * A[2].dot(beta_)
-        a[3] = (1.0 / self.mu) * A[3].dot(beta_)
+        a[0] = (1.0 / mu) * A[0].dot(beta_)
+        a[1] = (1.0 / mu) * A[1].dot(beta_)
+        a[2] = (1.0 / mu) * A[2].dot(beta_)
+        a[3] = (1.0 / mu) * A[3].dot(beta_)
         # Remember: lambda and gamma are already in the A matrices.
 
         return self.project(a)
@@ -257,6 +325,63 @@ class L1TV(properties.AtomicFunction,
              + (A[1].shape[0] / 2.0)
 
 
+class _ScaledOperator(object):
+    """The linear operator scale.A, applied without computing scale.A.
+    """
+    def __init__(self, scale, A):
+
+        self.scale = scale
+        self.A = A
+
+    @property
+    def shape(self):
+        return self.A.shape
+
+    @property
+    def nnz(self):
+        return self.A.nnz
+
+    @property
+    def T(self):
+        return _ScaledOperator(self.scale, self.A.T)
+
+    def dot(self, x):
+        return self.scale * self.A.dot(x)
+
+    def __mul__(self, scale):
+        return _ScaledOperator(self.scale * scale, self.A)
+
+    __rmul__ = __mul__
+
+
+class _Identity(object):
+    """The p-by-p identity operator, without a matrix.
+    """
+    def __init__(self, p):
+
+        self.shape = (p, p)
+        self.nnz = p
+
+    @property
+    def T(self):
+        return self
+
+    def dot(self, x):
+        return x
+
+
+def _is_identity(A):
+    """Whether the matrix A is a square (sparse) identity matrix.
+    """
+    if A.shape[0] != A.shape[1]:
+        return False
+
+    A = sparse.csr_matrix(A)
+
+    return A.nnz == A.shape[0] \
+        and np.all(A.diagonal() == 1.0)
+
+
 def A_from_mask(mask, num_variables, penalty_start=0):
     """Generates the linear operator for the total variation Nesterov function
     from a mask for a 3D image.
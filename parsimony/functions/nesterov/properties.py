@@ -29,7 +29,10 @@ class NesterovFunction(object):
             constant, of the function.
 
     mu : Non-negative float. The Nesterov function regularisation constant for
-            the smoothing.
+            the smoothing. The methods that depend on mu also take it as an
+            argument, and then do not use, or change, this attribute. A
+            function may therefore be shared between threads that use
+            different values of mu.
 
     penalty_start : Non-negative integer. The number of columns, variables
             etc., to except from penalisation. Equivalently, the first index
@@ -72,7 +75,7 @@ class NesterovFunction(object):
         if mu is None:
             mu = self.get_mu()
 
-        alpha = self.alpha(beta)
+        alpha = self.alpha(beta, mu=mu)
         alpha_sqsum = 0.0
         for a in alpha:
             alpha_sqsum += np.sum(a ** 2.0)
@@ -84,30 +87,45 @@ class NesterovFunction(object):
         else:
             beta_ = beta
 
-        return self.l * (np.dot(beta_.T, Aa)[0, 0] - (mu / 2.0) * alpha_sqsum)
+        return self.l * (np.sum(beta_ * Aa) - (mu / 2.0) * alpha_sqsum)
 
     @abc.abstractmethod
-    def phi(self, alpha, beta):
+    def phi(self, alpha, beta, mu=None):
         """ Function value with known alpha.
+
+        Parameters
+        ----------
+        alpha : List of numpy arrays. The dual variable.
+
+        beta : Numpy array. The point at which to evaluate the function.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
         """
         raise NotImplementedError('Abstract method "phi" must be '
                                   'specialised!')
 
-    def grad(self, beta):
+    def grad(self, beta, mu=None):
         """ Gradient of the function at beta.
 
         Parameters
         ----------
         beta : Numpy array. The point at which to evaluate the gradient.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
         """
         if self.l < consts.TOLERANCE:
             return 0.0
 
         # \beta need not be sliced here.
-        alpha = self.alpha(beta)
+        alpha = self.alpha(beta, mu=mu)
 
         if self.penalty_start > 0:
-            grad = self.l * np.vstack((np.zeros((self.penalty_start, 1)),
+            grad = self.l * np.vstack((np.zeros((self.penalty_start,
+                                                 beta.shape[1])),
                                        self.Aa(alpha)))
         else:
             grad = self.l * self.Aa(alpha)
@@ -141,13 +159,17 @@ class NesterovFunction(object):
 
         return old_mu
 
-    def alpha(self, beta):
+    def alpha(self, beta, mu=None):
         """ Dual variable of the Nesterov function.
 
         Parameters
         ----------
         beta : Numpy array (p-by-1). The variable for which to compute the dual
                 variable alpha.
+
+        mu : Non-negative float. The regularisation constant for the
+                smoothing. Default is None, which means that the function's
+                mu is used.
         """
         if self.penalty_start > 0:
             beta_ = beta[self.penalty_start:, :]
@@ -155,7 +177,8 @@ class NesterovFunction(object):
             beta_ = beta
 
         A = self.A()
-        mu = self.get_mu()
+        if mu is None:
+            mu = self.get_mu()
         alpha = [0] * len(A)
         for i in xrange(len(A)):
             alpha[i] = A[i].dot(beta_) / mu
@@ -33,6 +33,45 @@ __all__ = ["ZeroFunction", "L1", "L0", "LInf", "L2", "L2Squared",
            "SufficientDescentCondition"]
 
 
+def _column_parameter(l):
+    """Returns l as a float, or as an array with shape (1, m) if one value is
+    given for every column of a p-by-m variable.
+    """
+    if np.isscalar(l) or np.size(l) == 1:
+        return float(np.asarray(l).ravel()[0])
+    else:
+        return np.asarray(l, dtype=np.float64).reshape((1, -1))
+
+
+def _l1_ball_threshold(a, c):
+    """Returns the threshold t such that sum(max(a - t, 0)) = c.
+
+    The elements of a must be non-negative, and sum(a) > c. The median of the
+    remaining candidates is used as pivot, and every pivot halves their
+    number, which makes this linear in the number of elements (see e.g.
+    Duchi et al. (2008), Efficient projections onto the l1-ball for learning
+    in high dimensions).
+    """
+    if c <= 0.0:
+        return np.max(a)
+
+    s = 0.0  # The sum of the elements known to be above the threshold.
+    k = 0  # The number of elements known to be above the threshold.
+    U = a
+    while U.size > 0:
+        pivot = np.partition(U, U.size // 2)[U.size // 2]
+        G = U[U >= pivot]
+        sum_G = np.sum(G)
+        if (s + sum_G) - (k + G.size) * pivot < c:
+            s += sum_G
+            k += G.size
+            U = U[U < pivot]
+        else:
+            U = G[G > pivot]
+
+    return (s - c) / k
+
+
 class ZeroFunction(properties.AtomicFunction,
                    properties.Gradient,
                    properties.Penalty,
@@ -121,8 +160,10 @@ class L1(properties.AtomicFunction,
 
     Parameters
     ----------
-    l : Non-negative float. The Lagrange multiplier, or regularisation
-            constant, of the function.
+    l : Non-negative float or array with m elements. The Lagrange multiplier,
+            or regularisation constant, of the function. If an array is given,
+            the function is applied to p-by-m variables with one
+            regularisation constant for every column.
 
     c : Float. The limit of the constraint. The function is feasible if
             ||\beta||_1 <= c. The default value is c=0, i.e. the default is a
@@ -134,7 +175,7 @@ class L1(properties.AtomicFunction,
     """
     def __init__(self, l=1.0, c=0.0, penalty_start=0):
 
-        self.l = float(l)
+        self.l = _column_parameter(l)
         self.c = float(c)
         self.penalty_start = int(penalty_start)
 
@@ -146,13 +187,25 @@ class L1(properties.AtomicFunction,
         else:
             beta_ = beta
 
-        return self.l * (maths.norm1(beta_) - self.c)
+        # The sum over all columns, like the proximal operator.
+        return np.sum(self.l * (np.sum(np.abs(beta_), axis=0) - self.c))
 
     def prox(self, beta, factor=1.0):
         """The corresponding proximal operator.
 
         From the interface "ProximalOperator".
+
+        Parameters
+        ----------
+        beta : Numpy array. The point at which to apply the proximal operator.
+
+        factor : Positive float or numpy array. The step size. May be an array
+                with as many rows as beta, with one step size for every
+                variable, since the proximal operator is separable. Default is
+                1.0.
         """
+        if np.ndim(factor) > 0 and np.shape(factor)[0] == beta.shape[0]:
+            factor = factor[self.penalty_start:, :]
         l = self.l * factor
         if self.penalty_start > 0:
             beta_ = beta[self.penalty_start:, :]
@@ -166,89 +219,59 @@ class L1(properties.AtomicFunction,
 
         return prox
 
-    def proj(self, beta):
+    def proj(self, beta, out=None):
         """The corresponding projection operator.
 
         From the interface "ProjectionOperator".
-        """
-        if self.penalty_start > 0:
-            beta_ = beta[self.penalty_start:, :]
-        else:
-            beta_ = beta
-
-        p = beta_.shape[0]
 
-        abs_beta = np.absolute(beta_)
-        norm1 = np.sum(abs_beta)
-
-        if norm1 <= self.c:  # Feasible?
-            return beta
+        The projection takes expected linear time in the number of variables.
 
-        a = np.flipud(np.sort(abs_beta, axis=0)).ravel()
-        suma = np.cumsum(a)
-
-        phi = np.zeros((p + 1,))
-        np.multiply(a, np.arange(-1, -p - 1, -1), phi[:p])
-        phi[:p] += (suma - self.c)
-        phi[p] = suma[p - 1] - self.c
-
-        i = np.searchsorted(phi, 0.0)  # First positive (or zero).
-#        assert phi[i] >= 0.0
-        if phi[i] < 0.0:
-            # TODO: This should not be able to happen! Do we know it doesn't?
-            return self.__proj_old(beta)
-        i -= 1  # The last negative phi before positive (or zero).
-#        assert phi[i] < 0.0
-        if phi[i] >= 0.0:
-            # TODO: This should not be able to happen! Do we know it doesn't?
-            return self.__proj_old(beta)
-
-        l = a[i] + phi[i] / (i + 1)  # Find the Lagrange multiplier.
-
-        # The correction by eps is to nudge the L1 norm just below self.c.
-        eps = consts.FLOAT_EPSILON
-        l += eps
-
-        return (np.abs(beta_) > l) * (beta_ - l * np.sign(beta_ - l))
+        Parameters
+        ----------
+        beta : Numpy array (p-by-m). The point to project. Every column is
+                projected onto the L1 ball separately.
 
-    def __proj_old(self, beta):
-        """The corresponding projection operator.
+        out : Numpy array (p-by-m). The array in which to put the projection.
+                May be beta itself. Default is None, which means that a new
+                array is returned, or beta if it is already feasible.
 
-        From the interface "ProjectionOperator".
+        Examples
+        --------
+        >>> import numpy as np
+        >>> from parsimony.functions.penalties import L1
+        >>>
+        >>> np.random.seed(42)
+        >>> beta = np.random.randn(100, 3)
+        >>> l1 = L1(c=2.0)
+        >>> np.round(np.sum(np.abs(l1.proj(beta)), axis=0), 10)
+        array([ 2.,  2.,  2.])
+        >>> l1.proj(beta, out=beta) is beta
+        True
+        >>> l1.feasible(beta[:, [1]])
+        True
         """
-        if self.penalty_start > 0:
-            beta_ = beta[self.penalty_start:, :]
-        else:
-            beta_ = beta
-
+        beta_ = beta[self.penalty_start:, :]
         abs_beta = np.absolute(beta_)
-        norm1 = np.sum(abs_beta)
-
-        if norm1 <= self.c:  # Feasible?
-            return beta
-
-        from parsimony.algorithms.explicit import Bisection
-        bisection = Bisection(force_negative=True,
-                              parameter_positive=True,
-                              parameter_negative=False,
-                              parameter_zero=False,
-                              eps=1e-8)
+        infeasible = np.flatnonzero(np.sum(abs_beta, axis=0) > self.c)
 
-        class F(properties.Function):
-            def __init__(self, beta, c):
-                self.beta = beta
-                self.c = c
+        if out is None:
+            if infeasible.size == 0:  # Feasible?
+                return beta
+            out = np.copy(beta)
+        elif out is not beta:
+            out[...] = beta
 
-            def f(self, l):
-                beta = (abs_beta > l) \
-                    * (self.beta - l * np.sign(self.beta - l))
+        out_ = out[self.penalty_start:, :]
+        for j in infeasible:
+            # The Lagrange multiplier. The correction by eps is to nudge the
+            # L1 norm just below self.c.
+            l = _l1_ball_threshold(abs_beta[:, j], self.c)
+            l += consts.FLOAT_EPSILON
 
-                return maths.norm1(beta) - self.c
+            out_[:, j] = np.sign(beta_[:, j]) \
+                * np.maximum(abs_beta[:, j] - l, 0.0)
 
-        func = F(beta_, self.c)
-        l = bisection.run(func, [0.0, np.max(np.abs(beta_))])
-
-        return (abs_beta > l) * (beta_ - l * np.sign(beta_ - l))
+        return out
 
     def feasible(self, beta):
         """Feasibility of the constraint.
@@ -383,11 +406,22 @@ class L0(properties.AtomicFunction,
 
         return prox
 
-    def proj(self, x):
+    def proj(self, x, out=None):
         """The corresponding projection operator.
 
         From the interface "ProjectionOperator".
 
+        Keeps the floor(c) elements of largest magnitude of every column of
+        x, found by partitioning in linear time.
+
+        Parameters
+        ----------
+        x : Numpy array (p-by-m). The point to project.
+
+        out : Numpy array (p-by-m). The array in which to put the projection.
+                May be x itself. Default is None, which means that a new array
+                is returned, or x if it is already feasible.
+
         Examples
         --------
         >>> import numpy as np
@@ -408,25 +442,26 @@ class L0(properties.AtomicFunction,
                [ 0.        ],
                [ 0.        ]])
         """
-        if self.penalty_start > 0:
-            x_ = x[self.penalty_start:, :]
-        else:
-            x_ = x
+        x_ = x[self.penalty_start:, :]
+        p = x_.shape[0]
 
-        if maths.norm0(x_) <= self.c:
-            return x
+        if out is None:
+            if np.all(np.sum(x_ != 0.0, axis=0) <= self.c):
+                return x
+            out = np.copy(x)
+        elif out is not x:
+            out[...] = x
 
+        out_ = out[self.penalty_start:, :]
         K = int(np.floor(self.c) + 0.5)
-        ind = np.abs(x_.ravel()).argsort()[:K]
-        y = np.copy(x_)
-        y[ind] = 0.0
-
-        if self.penalty_start > 0:
-            # Add the unregularised variables.
-            y = np.vstack((x[:self.penalty_start, :],
-                           y))
+        if K <= 0:
+            out_[...] = 0.0
+        elif K < p:
+            # The p - K elements of smallest magnitude in every column.
+            ind = np.argpartition(np.abs(x_), p - K - 1, axis=0)[:p - K, :]
+            out_[ind, np.arange(x_.shape[1])] = 0.0
 
-        return y
+        return out
 
     def feasible(self, beta):
         """Feasibility of the constraint.
@@ -557,8 +592,8 @@ class LInf(properties.AtomicFunction,
                [ 0.5       ],
                [ 0.5       ],
                [ 0.5       ]])
-        >>> np.linalg.norm(linf_prox - linf_proj)
-        7.2392821740411278e-09
+        >>> np.linalg.norm(linf_prox - linf_proj) < 5e-8
+        True
         """
         if self.penalty_start > 0:
             x_ = x[self.penalty_start:, :]
@@ -577,11 +612,19 @@ class LInf(properties.AtomicFunction,
 
         return y
 
-    def proj(self, x):
+    def proj(self, x, out=None):
         """The corresponding projection operator.
 
         From the interface "ProjectionOperator".
 
+        Parameters
+        ----------
+        x : Numpy array (p-by-m). The point to project.
+
+        out : Numpy array (p-by-m). The array in which to put the projection.
+                May be x itself. Default is None, which means that a new array
+                is returned, or x if it is already feasible.
+
         Examples
         --------
         >>> import numpy as np
@@ -602,24 +645,19 @@ class LInf(properties.AtomicFunction,
                [ 0.20223002],
                [ 0.41614516]])
         """
-        if self.penalty_start > 0:
-            x_ = x[self.penalty_start:, :]
-        else:
-            x_ = x
+        x_ = x[self.penalty_start:, :]
 
-        if maths.normInf(x_) <= self.c:
-            return x
+        if out is None:
+            if maths.normInf(x_) <= self.c:
+                return x
+            out = np.copy(x)
+        elif out is not x:
+            out[...] = x
 
-        y = np.copy(x_)
-        y[y > self.c] = self.c
-        y[y < -self.c] = -self.c
+        out_ = out[self.penalty_start:, :]
+        np.clip(x_, -self.c, self.c, out=out_)
 
-        # Put the unregularised variables back.
-        if self.penalty_start > 0:
-            y = np.vstack((x[:self.penalty_start, :],
-                           y))
-
-        return y
+        return out
 
     def feasible(self, x):
         """Feasibility of the constraint.
@@ -812,8 +850,10 @@ class L2Squared(properties.AtomicFunction,
 
     Parameters
     ----------
-    l : Non-negative float. The Lagrange multiplier, or regularisation
-            constant, of the function.
+    l : Non-negative float or array with m elements. The Lagrange multiplier,
+            or regularisation constant, of the function. If an array is given,
+            the function is applied to p-by-m variables with one
+            regularisation constant for every column.
 
     c : Float. The limit of the constraint. The function is feasible if
             0.5 * ||\beta||²_2 <= c. The default value is c=0, i.e. the
@@ -825,7 +865,7 @@ class L2Squared(properties.AtomicFunction,
     """
     def __init__(self, l=1.0, c=0.0, penalty_start=0):
 
-        self.l = float(l)
+        self.l = _column_parameter(l)
         self.c = float(c)
         self.penalty_start = int(penalty_start)
 
@@ -839,7 +879,9 @@ class L2Squared(properties.AtomicFunction,
         else:
             beta_ = beta
 
-        return self.l * (0.5 * np.dot(beta_.T, beta_)[0, 0] - self.c)
+        sqnorm = np.sum(beta_ ** 2.0, axis=0)
+
+        return np.sum(self.l * (0.5 * sqnorm - self.c))
 
     def grad(self, beta):
         """Gradient of the function.
@@ -868,7 +910,7 @@ class L2Squared(properties.AtomicFunction,
 
         if self.penalty_start > 0:
             beta_ = beta[self.penalty_start:, :]
-            grad = np.vstack((np.zeros((self.penalty_start, 1)),
+            grad = np.vstack((np.zeros((self.penalty_start, beta.shape[1])),
                               self.l * beta_))
         else:
             beta_ = beta
@@ -1044,7 +1086,8 @@ class L1L2Squared(properties.AtomicFunction,
 class QuadraticConstraint(properties.AtomicFunction,
                           properties.Gradient,
                           properties.Penalty,
-                          properties.Constraint):
+                          properties.Constraint,
+                          properties.ProjectionOperator):
     """The proximal operator of the quadratic function
 
         f(x) = l * (x'Mx - c),
@@ -1064,6 +1107,13 @@ class QuadraticConstraint(properties.AtomicFunction,
 
     if two matrices are given.
 
+    An eigendecomposition of the matrix is computed on first use, and the
+    function value, the gradient and the projection are all computed through
+    it. Eigenvalues that are zero are dropped, and if M and N are the same
+    n-by-p factor, the decomposition is computed from the singular value
+    decomposition of the factor. The matrices must therefore not be changed
+    without calling reset().
+
     Parameters
     ----------
     l : Non-negative float. The Lagrange multiplier, or regularisation
@@ -1074,7 +1124,8 @@ class QuadraticConstraint(properties.AtomicFunction,
             regularisation formulation.
 
     M : Numpy array. The given positive definite matrix. It is assumed that
-            the first penalty_start columns must be excluded.
+            the first penalty_start rows and columns must be excluded, or
+            only the first penalty_start columns if N is given.
 
     N : Numpy array. The second matrix if the factors of the positive-definite
             matrix are given. It is assumed that the first penalty_start
@@ -1083,18 +1134,44 @@ class QuadraticConstraint(properties.AtomicFunction,
     penalty_start : Non-negative integer. The number of columns, variables
             etc., to be exempt from penalisation. Equivalently, the first index
             to be penalised. Default is 0, all columns are included.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import parsimony.functions.penalties as penalties
+    >>> np.random.seed(42)
+    >>>
+    >>> X = np.random.randn(10, 50)
+    >>> x = np.random.randn(50, 1)
+    >>> quad = penalties.QuadraticConstraint(c=1.0, M=X, N=X)
+    >>> abs(quad.f(x) - (np.linalg.norm(np.dot(X, x)) ** 2.0 - 1.0)) < 5e-12
+    True
+    >>> y = quad.proj(x)
+    >>> abs(quad.f(y)) < 5e-8 and quad.feasible(y)
+    True
     """
     def __init__(self, l=1.0, c=0.0, M=None, N=None, penalty_start=0):
 
         self.l = float(l)
         self.c = float(c)
+        self.penalty_start = max(0, int(penalty_start))
         if self.penalty_start > 0:
-            self.M = M[:, self.penalty_start:]  # NOTE! We slice M here!
-            self.N = N[:, self.penalty_start:]  # NOTE! We slice N here!
-        else:
-            self.M = M
-            self.N = N
-        self.penalty_start = penalty_start
+            if N is None:
+                # NOTE! We slice M here!
+                M = M[self.penalty_start:, self.penalty_start:]
+            else:
+                M = M[:, self.penalty_start:]  # NOTE! We slice M here!
+                N = N[:, self.penalty_start:]  # NOTE! We slice N here!
+        self.M = M
+        self.N = N
+
+        self.reset()
+
+    def reset(self):
+
+        self._V = None
+        self._lambdas = None
+        self._mu = None
 
     def f(self, beta):
         """Function value.
@@ -1104,14 +1181,7 @@ class QuadraticConstraint(properties.AtomicFunction,
         else:
             beta_ = beta
 
-        if self.N is None:
-            val = self.l * (np.dot(beta_.T, np.dot(self.M, beta_)) - self.c)
-        else:
-            val = self.l * (np.dot(beta_.T, np.dot(self.M.T,
-                                                   np.dot(self.N, beta_))) \
-                    - self.c)
-
-        return val
+        return self.l * (self._compute_value(beta_) - self.c)
 
     def grad(self, beta):
         """Gradient of the function.
@@ -1123,13 +1193,14 @@ class QuadraticConstraint(properties.AtomicFunction,
         else:
             beta_ = beta
 
-        if self.N is None:
-            grad = (2.0 * self.l) * np.dot(self.M, beta_)
-        else:
-            grad = (2.0 * self.l) * np.dot(self.M.T, np.dot(self.N, beta_))
+        V, lambdas, lambda0 = self._spectrum()
+        Mbeta = np.dot(V.T, (lambdas - lambda0) * np.dot(V, beta_))
+        if lambda0 > 0.0:
+            Mbeta += lambda0 * beta_
+        grad = (2.0 * self.l) * Mbeta
 
         if self.penalty_start > 0:
-            grad = np.vstack(np.zeros((self.penalty_start, 1)), grad)
+            grad = np.vstack((np.zeros((self.penalty_start, 1)), grad))
 
         return grad
 
@@ -1143,16 +1214,90 @@ class QuadraticConstraint(properties.AtomicFunction,
         else:
             beta_ = beta
 
-        if self.N is None:
-            bMb = np.dot(beta_.T, np.dot(self.M, beta_))
+        return self._compute_value(beta_) <= self.c
+
+    def proj(self, beta):
+        """The projection operator corresponding to the function.
+
+        From the interface "ProjectionOperator".
+
+        The projection is (I + 2 * mu * M)^-1 * beta, computed in the
+        eigenbasis of M, where the Lagrange multiplier mu is the root of a
+        secular equation. It is found by a safeguarded Newton method, started
+        from the multiplier of the previous projection.
+        """
+        if self.penalty_start > 0:
+            beta_ = beta[self.penalty_start:, :]
+        else:
+            beta_ = beta
+
+        if self._compute_value(beta_) <= self.c:
+            return beta
+
+        V, lambdas, lambda0 = self._spectrum()
+
+        atilde = np.dot(V, beta_)
+        atilde2 = atilde ** 2.0
+        ssdiff = max(0.0, np.dot(beta_.T, beta_)[0, 0] - np.sum(atilde2))
+
+        if self.c <= 0.0 and lambda0 <= 0.0:
+            # The limit mu -> infinity, the projection onto the null space.
+            y = beta_ - np.dot(V.T, atilde)
         else:
-            bMb = np.dot(beta_.T, np.dot(self.M.T, np.dot(self.N, beta_)))
+            mu = _secular_root(atilde2, lambdas, self.c, lambda0=lambda0,
+                               ssdiff=ssdiff, mu=self._mu)
+            self._mu = mu
 
-        return bMb <= self.c
+            a = 1.0 + 2.0 * mu * lambda0
+            y = beta_ * (1.0 / a) \
+              + np.dot(V.T,
+                       atilde * (1.0 / (1.0 + (2.0 * mu) * lambdas) - 1.0 / a))
+
+        if self.penalty_start > 0:
+            y = np.vstack((beta[:self.penalty_start, :],
+                           y))
+
+        return y
+
+    def _spectrum(self):
+        """Returns the eigendecomposition of the matrix, as (V, lambdas,
+        lambda0), with the eigenvectors in the rows of V, the corresponding
+        eigenvalues in lambdas (r-by-1) and lambda0 the eigenvalue of the
+        orthogonal complement of the rows of V.
+        """
+        if self._V is None or self._lambdas is None:
+            if self.N is None:
+                lambdas, V = np.linalg.eigh(self.M)
+            elif self.N is self.M:
+                # numpy.linalg.svd runs faster on the transpose.
+                V, S, _ = np.linalg.svd(self.M.T, full_matrices=0)
+                lambdas = S ** 2.0
+            else:
+                MtN = np.dot(self.M.T, self.N)
+                lambdas, V = np.linalg.eigh(0.5 * (MtN + MtN.T))
 
+            # The orthogonal complement has eigenvalue zero.
+            keep = lambdas > consts.FLOAT_EPSILON * max(V.shape) \
+                * max(0.0, np.max(lambdas))
+            self._V = V[:, keep].T
+            self._lambdas = lambdas[keep].reshape((-1, 1))
 
-class RGCCAConstraint(QuadraticConstraint,
-                      properties.ProjectionOperator):
+        return self._V, self._lambdas, 0.0
+
+    def _compute_value(self, beta):
+        """Helper function to compute beta'M.beta.
+
+        Note that beta must already be sliced!
+        """
+        V, lambdas, lambda0 = self._spectrum()
+        val = np.sum((lambdas - lambda0) * np.dot(V, beta) ** 2.0)
+        if lambda0 > 0.0:
+            val += lambda0 * np.dot(beta.T, beta)[0, 0]
+
+        return val
+
+
+class RGCCAConstraint(QuadraticConstraint):
     """The proximal operator of the quadratic function
 
         f(x) = l * (x'(tau * I + ((1 - tau) / n) * X'X)x - c),
@@ -1197,21 +1342,9 @@ class RGCCAConstraint(QuadraticConstraint,
 
     def reset(self):
 
-        self._U = None
-        self._S = None
         self._V = None
-
-    def f(self, beta):
-        """Function value.
-        """
-        if self.penalty_start > 0:
-            beta_ = beta[self.penalty_start:, :]
-        else:
-            beta_ = beta
-
-        xtMx = self._compute_value(beta_)
-
-        return self.l * (xtMx - self.c)
+        self._s2 = None
+        self._mu = None
 
     def grad(self, beta):
         """Gradient of the function.
@@ -1236,33 +1369,24 @@ class RGCCAConstraint(QuadraticConstraint,
             grad = (self.tau * 2.0) * beta_
 
         if self.penalty_start > 0:
-            grad = np.vstack(np.zeros((self.penalty_start, 1)),
-                             grad)
+            grad = np.vstack((np.zeros((self.penalty_start, 1)),
+                              grad))
 
 #        approx_grad = utils.approx_grad(self.f, beta, eps=1e-4)
 #        print maths.norm(grad - approx_grad)
 
         return grad
 
-    def feasible(self, beta):
-        """Feasibility of the constraint.
-
-        From the interface "Constraint".
-        """
-        if self.penalty_start > 0:
-            beta_ = beta[self.penalty_start:, :]
-        else:
-            beta_ = beta
-
-        xtMx = self._compute_value(beta_)
-
-        return xtMx <= self.c
-
     def proj(self, beta):
         """The projection operator corresponding to the function.
 
         From the interface "ProjectionOperator".
 
+        The singular value decomposition of X is computed once and reused in
+        all following projections, also when tau is changed. The Lagrange
+        multiplier is found by a safeguarded Newton method, started from the
+        multiplier of the previous projection.
+
         Examples
         --------
         >>> import parsimony.functions.penalties as penalties
@@ -1279,118 +1403,66 @@ class RGCCAConstraint(QuadraticConstraint,
         -2.2204460492503131e-16
         >>> np.linalg.norm(y)
         0.99999999999999989
+        >>>
+        >>> X = np.random.randn(10, 50)
+        >>> x = np.random.randn(50, 1)
+        >>> rgcca = penalties.RGCCAConstraint(c=1.0, tau=0.5, X=X)
+        >>> y = rgcca.proj(x)
+        >>> abs(rgcca.f(y)) < 5e-8 and rgcca.feasible(y)
+        True
+        >>> rgcca.set_params(tau=0.1)
+        >>> y = rgcca.proj(x)
+        >>> abs(rgcca.f(y)) < 5e-8 and rgcca.feasible(y)
+        True
         """
-        if self.penalty_start > 0:
-            beta_ = beta[self.penalty_start:, :]
-        else:
-            beta_ = beta
-
-        xtMx = self._compute_value(beta_)
-        if xtMx <= self.c:
-            return beta
-
-        n, p = self.X.shape
+        if self.tau == 1.0:
 
-        if self.unbiased:
-            n_ = float(n - 1.0)
-        else:
-            n_ = float(n)
+            if self.penalty_start > 0:
+                beta_ = beta[self.penalty_start:, :]
+            else:
+                beta_ = beta
 
-        if self.tau == 1.0:
+            xtMx = self._compute_value(beta_)
+            if xtMx <= self.c:
+                return beta
 
             sqnorm = np.dot(beta_.T, beta_)
             eps = consts.FLOAT_EPSILON
             y = beta_ * np.sqrt((self.c - eps) / sqnorm)
 
-        else:
+            if self.penalty_start > 0:
+                y = np.vstack((beta[:self.penalty_start, :],
+                               y))
 
-            if self._U is None or self._S is None or self._V is None:
-#                self._U, self._S, self._V = np.linalg.svd(X_, full_matrices=0)
-                # numpy.linalg.svd runs faster on the transpose.
-                self._V, self._S, self._U = np.linalg.svd(self.X.T,
-                                                          full_matrices=0)
-                self._V = self._V.T
-                self._U = self._U.T
-                self._S = ((1.0 - self.tau) / n_) * (self._S ** 2.0) + self.tau
-                self._S = self._S.reshape((min(n, p), 1))
-
-            atilde = np.dot(self._V, beta_)
-            atilde2 = atilde ** 2.0
-            ssdiff = np.dot(beta_.T, beta_)[0, 0] - np.sum(atilde2)
-            atilde2lambdas = atilde2 * self._S
-            atilde2lambdas2 = atilde2lambdas * self._S
-            tau2 = self.tau ** 2.0
-
-            from parsimony.algorithms.utils import NewtonRaphson
-            newton = NewtonRaphson(force_negative=True,
-                                   parameter_positive=True,
-                                   parameter_negative=False,
-                                   parameter_zero=True,
-                                   eps=consts.TOLERANCE,
-                                   max_iter=30)
-
-            class F(properties.Function,
-                    properties.Gradient):
-
-                def __init__(self, tau, S, c):
-                    self.tau = tau
-                    self.S = S
-                    self.c = c
-
-                # TODO: We can share variables between f and df and speed up
-                # some shared computations.
-                def f(self, mu):
-                    term1 = (self.tau \
-                            / ((1.0 + 2.0 * mu * self.tau) ** 2.0)) * ssdiff
-                    term2 = np.sum(atilde2lambdas \
-                            / ((1.0 + (2.0 * mu) * self.S) ** 2.0))
-                    return term1 + term2 - self.c
-
-                def grad(self, mu):
-                    term1 = -4.0 * tau2 \
-                                / ((1.0 + 2.0 * mu * self.tau) ** 3.0) * ssdiff
-                    term2 = -4.0 * np.sum(atilde2lambdas2 \
-                                / ((1.0 + (2.0 * mu) * self.S) ** 3.0))
-                    return term1 + term2
-
-#            if max(n, p) >= 1000:
-#                # A rough heuristic for finding a start value. Works well in
-#                # many cases, and when it does not work we have only lost one
-#                # iteration and restart at 0.0.
-#                start_mu = np.sqrt(min(n, p)) \
-#                        / max(1.0, self.c) \
-#                        / max(0.1, self.tau)
-#            elif max(n, p) >= 100:
-#                start_mu = 1.0
-#            else:
-            start_mu = 0.0
-            mu = newton.run(F(self.tau, self._S, self.c), start_mu)
-
-            if p > n:
-                l2 = ((self._S - self.tau) \
-                        / ((1.0 - self.tau) / n_)).reshape((n,))
-
-                a = 1.0 + 2.0 * mu * self.tau
-                b = 2.0 * mu * (1.0 - self.tau) / n_
-                y = (beta_ - np.dot(self.X.T, np.dot(self._U,
-                             (np.reciprocal(l2 + (a / b)) \
-                             * np.dot(self._U.T,
-                                      np.dot(self.X, beta_)).T).T))) / a
-
-            else:  # The case when n >= p
-                l2 = ((self._S - self.tau) \
-                        / ((1.0 - self.tau) / n_)).reshape((p,))
-
-                a = 1.0 + 2.0 * mu * self.tau
-                b = 2.0 * mu * (1.0 - self.tau) / n_
-                y = np.dot(self._V.T, (np.reciprocal(a + b * l2) \
-                            * atilde.T).T)
+            return y
 
-        if self.penalty_start > 0:
-            y = np.vstack((beta[:self.penalty_start, :],
-                           y))
+        return super(RGCCAConstraint, self).proj(beta)
 
-        return y
+    def _spectrum(self):
+        """Returns the eigendecomposition of
+        tau * I + ((1 - tau) / n) * X'X.
+
+        Only the singular value decomposition of X is cached, so that the
+        eigenvalues follow changes of tau.
+        """
+        if self._V is None or self._s2 is None:
+            n, p = self.X.shape
+            # numpy.linalg.svd runs faster on the transpose.
+            V, S, _ = np.linalg.svd(self.X.T, full_matrices=0)
+            # Only the range of X' is needed, the eigenvalues of the
+            # orthogonal complement are all equal to tau.
+            rank = np.sum(S > consts.FLOAT_EPSILON * max(n, p) * S[0])
+            self._V = V[:, :rank].T
+            self._s2 = (S[:rank] ** 2.0).reshape((rank, 1))
+
+        if self.unbiased:
+            n_ = float(self.X.shape[0] - 1.0)
+        else:
+            n_ = float(self.X.shape[0])
+
+        lambdas = ((1.0 - self.tau) / n_) * self._s2 + self.tau
+
+        return self._V, lambdas, self.tau
 
     def _compute_value(self, beta):
         """Helper function to compute the function value.
@@ -1409,10 +1481,74 @@ class RGCCAConstraint(QuadraticConstraint,
         return val[0, 0]
 
 
+def _secular_root(atilde2, lambdas, c, lambda0=0.0, ssdiff=0.0, mu=None,
+                  eps=consts.TOLERANCE, max_iter=50):
+    """Finds the Lagrange multiplier, mu >= 0, of the projection onto
+    {x: x'Mx <= c}, i.e. the root of the decreasing and convex function
+
+        g(mu) = lambda0 * ssdiff / (1 + 2 * mu * lambda0) ** 2
+              + sum(atilde2 * lambdas / (1 + 2 * mu * lambdas) ** 2) - c,
+
+    where lambdas are the eigenvalues of M, atilde2 the squared coordinates
+    of the projected point in the corresponding eigenvectors, and ssdiff the
+    squared norm of its component in the orthogonal complement, with
+    eigenvalue lambda0.
+
+    The Newton steps are kept within the bracket of the root, and it is
+    started at mu, e.g. the root of the previous projection.
+    """
+    atilde2lambdas = atilde2 * lambdas
+
+    def g(mu):
+        d0 = 1.0 / (1.0 + 2.0 * mu * lambda0)
+        d = 1.0 / (1.0 + (2.0 * mu) * lambdas)
+        terms = atilde2lambdas * (d ** 2.0)
+        val = lambda0 * ssdiff * (d0 ** 2.0) + np.sum(terms) - c
+        grad = -4.0 * ((lambda0 ** 2.0) * ssdiff * (d0 ** 3.0)
+                       + np.sum(terms * lambdas * d))
+
+        return val, grad
+
+    low, high = 0.0, np.inf  # g(low) > 0 and g(high) <= 0.
+    mu = 0.0 if mu is None else mu
+    for i in xrange(max_iter):
+        val, grad = g(mu)
+        if val > 0.0:
+            low = mu
+        else:
+            high = mu
+        if grad >= 0.0:  # Only when x = 0, but then it is feasible.
+            break
+
+        mu_new = mu - val / grad
+        if mu_new <= low or mu_new >= high:
+            mu_new = 0.5 * (low + high)
+
+        if abs(mu_new - mu) <= eps * max(1.0, mu):
+            mu = mu_new
+            break
+
+        mu = mu_new
+
+    # Newton approaches the root from below, i.e. from the infeasible side.
+    # Step past the root, with a margin for rounding errors, to get a feasible
+    # point.
+    scale = (ssdiff + np.sum(atilde2)) * np.max(np.append(lambdas, lambda0))
+    margin = 100.0 * consts.FLOAT_EPSILON * max(1.0, abs(c), scale)
+    val, grad = g(mu)
+    for i in xrange(5):
+        if val <= -margin or grad >= 0.0:
+            break
+        mu = min(mu - 2.0 * (val + margin) / grad, high)
+        val, grad = g(mu)
+
+    return mu
+
+
 class SufficientDescentCondition(properties.Function,
                                  properties.Constraint):
 
-    def __init__(self, function, p, c):
+    def __init__(self, function, p, c, delta=None):
         """The sufficient condition
 
             f(x + a * p) <= f(x) + c * a * grad(f(x))'p
@@ -1422,10 +1558,21 @@ class SufficientDescentCondition(properties.Function,
         Parameters
         ----------
         c : Float, 0 < c < 1. A constant for the condition. Should be small.
+
+        delta : Float. The predicted decrease to use instead of grad(f(x))'p.
+                Must be negative. Use e.g. grad(f(x))'p + h(x + p) - h(x) for
+                a composite function f + h with non-smooth h, as in proximal
+                Newton methods. Default is None, which means to use
+                grad(f(x))'p.
         """
         self.function = function
         self.p = p
         self.c = c
+        self.delta = delta
+
+        self._x = None
+        self._f_x = None
+        self._delta = None
 
     def f(self, x, a):
 
@@ -1439,14 +1586,18 @@ class SufficientDescentCondition(properties.Function,
         x = xa[0]
         a = xa[1]
 
+        # The line search only varies a, so f(x) and grad(f(x))'p are only
+        # computed once for every x.
+        if x is not self._x:
+            self._x = x
+            self._f_x = self.function.f(x)
+            if self.delta is None:
+                self._delta = np.dot(self.function.grad(x).T, self.p)[0, 0]
+            else:
+                self._delta = self.delta
+
         f_x_ap = self.function.f(x + a * self.p)
-        f_x = self.function.f(x)
-        grad_p = np.dot(self.function.grad(x).T, self.p)[0, 0]
-#        print "f_x_ap = %.10f, f_x = %.10f, grad_p = %.10f, feas = %.10f" \
-#                % (f_x_ap, f_x, grad_p, f_x + self.c * a * grad_p)
-#        if grad_p >= 0.0:
-#            pass
-        feasible = f_x_ap <= f_x + self.c * a * grad_p
+        feasible = f_x_ap <= self._f_x + self.c * a * self._delta
 
         return feasible
 
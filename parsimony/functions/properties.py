@@ -279,26 +279,27 @@ class Gradient(object):
 
         Parameters
         ----------
-        beta : Numpy array (p-by-1). The point at which to evaluate the
-                gradient.
+        beta : Numpy array (p-by-1 or p-by-K). The point at which to evaluate
+                the gradient.
 
         eps : Positive integer. The precision of the numerical solution.
                 Smaller is better, but too small may result in floating point
                 precision errors.
         """
-        p = x.shape[0]
+        p, K = x.shape
         grad = np.zeros(x.shape)
         if isinstance(self, (Penalty, Constraint)):
             start = self.penalty_start
         else:
             start = 0
-        for i in xrange(start, p):
-            x[i, 0] -= eps
-            loss1 = self.f(x)
-            x[i, 0] += 2.0 * eps
-            loss2 = self.f(x)
-            x[i, 0] -= eps
-            grad[i, 0] = (loss2 - loss1) / (2.0 * eps)
+        for j in xrange(K):
+            for i in xrange(start, p):
+                x[i, j] -= eps
+                loss1 = self.f(x)
+                x[i, j] += 2.0 * eps
+                loss2 = self.f(x)
+                x[i, j] -= eps
+                grad[i, j] = (loss2 - loss1) / (2.0 * eps)
 
         return grad
 
@@ -18,6 +18,8 @@ from .plot import plot_map2d
 from .classif_label import class_weight_to_sample_weight, check_labels
 from . import start_vectors
 from . import resampling
+from . import permutation
+from . import stability
 
 
 __all__ = ["maths", "consts",
@@ -26,4 +28,5 @@ __all__ = ["maths", "consts",
            "optimal_shrinkage", "AnonymousClass",
            "plot_map2d",
            "class_weight_to_sample_weight", "check_labels",
-           "start_vectors", "resampling"]
\ No newline at end of file
+           "start_vectors", "resampling", "permutation",
+           "stability"]
\ No newline at end of file
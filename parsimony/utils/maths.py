@@ -9,10 +9,12 @@ Copyright (c) 2013-2014, CEA/DSV/I2BM/Neurospin. All rights reserved.
 @license: BSD 3-clause.
 """
 import numpy as np
+import scipy.linalg
 
 from parsimony.utils.consts import TOLERANCE
 
-__all__ = ["norm", "normFro", "norm1", "norm0", "normInf", "corr", "cov"]
+__all__ = ["norm", "normFro", "norm1", "norm0", "normInf", "corr", "cov",
+           "logistic", "RidgeSolver"]
 
 
 def norm(x):
@@ -192,6 +194,104 @@ def cov(a, b):
         return ip
 
 
+def logistic(z):
+    """Returns the logistic function, 1 / (1 + exp(-z)), of every element of z.
+
+    It is computed as
+
+        1 / (1 + exp(-|z|))           if z >= 0,
+        exp(-|z|) / (1 + exp(-|z|))   if z < 0,
+
+    which neither overflows nor loses precision for large |z|.
+
+    Example
+    -------
+    >>> import numpy as np
+    >>> from parsimony.utils.maths import logistic
+    >>> print logistic(np.array([[-1000.0], [0.0], [1000.0]]))
+    [[ 0. ]
+     [ 0.5]
+     [ 1. ]]
+    """
+    z = np.asarray(z, dtype=np.float64)
+
+    e = np.exp(-np.abs(z))
+    prob = 1.0 / (1.0 + e)
+    neg = z < 0.0
+    prob[neg] *= e[neg]
+
+    return prob
+
+
+class RidgeSolver(object):
+    """Solves (c.X'X + k.I).x = b for any number of right-hand sides b.
+
+    The matrix is factorised once, on the first call to solve, and only the
+    Cholesky factor is kept. If n >= p, the p-by-p matrix c.X'X + k.I is
+    factorised. Otherwise, the n-by-n matrix X.X' + (k / c).I is factorised,
+    and the solution is computed using the Woodbury matrix identity
+
+        (c.X'X + k.I)^-1 = (I - X'.(X.X' + (k / c).I)^-1.X) / k.
+
+    Every solve is then two triangular solves with the factor.
+
+    Parameters
+    ----------
+    X : Numpy array (n-by-p). The matrix.
+
+    k : Positive float. The ridge constant.
+
+    c : Positive float. The scale of X'X. Default is 1.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from parsimony.utils.maths import RidgeSolver
+    >>> np.random.seed(42)
+    >>> X = np.random.rand(5, 10)
+    >>> b = np.random.rand(10, 1)
+    >>> x = RidgeSolver(X, 0.5).solve(b)
+    >>> np.linalg.norm(np.dot(X.T, np.dot(X, x)) + 0.5 * x - b) < 5e-15
+    True
+    >>> x = RidgeSolver(X.T, 0.5, c=2.0).solve(b[:5, :])
+    >>> np.linalg.norm(2.0 * np.dot(X, np.dot(X.T, x)) + 0.5 * x - b[:5, :]) \\
+    ...     < 5e-15
+    True
+    """
+    def __init__(self, X, k, c=1.0):
+
+        self.X = X
+        self.k = float(k)
+        self.c = float(c)
+
+        self._factor = None
+
+    def solve(self, b):
+        """Returns (c.X'X + k.I)^-1.b.
+
+        Parameters
+        ----------
+        b : Numpy array (p-by-m). The right-hand sides.
+        """
+        n, p = self.X.shape
+        if self._factor is None:
+            if n >= p:
+                A = self.c * np.dot(self.X.T, self.X)
+                A.flat[::p + 1] += self.k
+            else:
+                A = np.dot(self.X, self.X.T)
+                A.flat[::n + 1] += self.k / self.c
+            self._factor = scipy.linalg.cho_factor(A)
+
+        if n >= p:
+            return scipy.linalg.cho_solve(self._factor, b)
+        else:
+            Xb = np.dot(self.X, b)
+            return (b - np.dot(self.X.T,
+                               scipy.linalg.cho_solve(self._factor, Xb))) \
+                / self.k
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
\ No newline at end of file
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+The :mod:`parsimony.utils.permutation` module contains a driver for
+permutation tests of penalised estimators.
+
+Created on Tue Sep 16 14:12:47 2014
+
+Copyright (c) 2013-2014, CEA/DSV/I2BM/Neurospin. All rights reserved.
+
+@author:  Tommy Löfstedt
+@email:   lofstedt.tommy@gmail.com
+@license: BSD 3-clause.
+"""
+import os
+import copy
+import shutil
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+__all__ = ["PermutationTest"]
+
+
+class PermutationTest(object):
+    """Permutation test of the regression coefficients of penalised
+    estimators, e.g. LinearRegressionL1L2TV or LogisticRegressionL1L2TV.
+
+    The estimator is first fitted to the data. The response is then permuted
+    num_perms times, and the model is refitted to every permuted response.
+    The p-value of a statistic is the fraction of the permutations (counting
+    the unpermuted data as one of them) for which its absolute value is at
+    least as large as for the unpermuted data. The p-values corrected for
+    multiple comparisons use the maximum absolute statistic of every
+    permutation instead.
+
+    Only the response changes between the permutations. Everything that only
+    depends on X and A, e.g. the Lipschitz constants and the spectrum of A, is
+    therefore computed once per worker, and every refit starts from the
+    solution on the unpermuted data, with the same mu.
+
+    Parameters
+    ----------
+    estimator : Estimator. The estimator to test. It must have a method
+            build_function(X, y) that returns the function minimised by fit,
+            and a method fit_function(function) that fits the estimator by
+            minimising it. The function must have a method set_response(y).
+
+    num_perms : Positive integer. The number of permutations. Default is
+            1000.
+
+    statistic : Function. Maps the regression coefficients, a numpy array, to
+            the statistics to test, a numpy array with s elements. Default is
+            None, which means that the regression coefficients themselves are
+            tested.
+
+    batch_size : Positive integer. The number of permutations that are solved
+            at once, as the columns of one p-by-batch_size problem. Only used
+            if the algorithm of the estimator is MultiFISTA, and the samples
+            have equal weights. Default is 1.
+
+    num_workers : Positive integer. The number of processes to use. X is
+            shared between the processes through a memory-mapped file. Default
+            is 1, all permutations are computed in this process.
+
+    output : String. The name of a file to which the statistics of all
+            permutations are written, in the numpy format, as they are
+            computed. The statistics are thus never all held in memory.
+            Nothing is written if output is None. Default is None.
+
+    seed : Non-negative integer. The seed of the permutations. A given
+            permutation is the same regardless of batch_size and num_workers.
+            Default is None, which means that the seed is drawn from numpy's
+            global random number generator.
+
+    Attributes
+    ----------
+    reference : Numpy array with s elements. The statistics computed on the
+            unpermuted data.
+
+    pvalues : Numpy array with s elements. The uncorrected p-values.
+
+    pvalues_corrected : Numpy array with s elements. The p-values corrected
+            for multiple comparisons, using the maximum statistic.
+
+    null_max : Numpy array with num_perms elements. The maximum absolute
+            statistic of every permutation.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import parsimony.estimators as estimators
+    >>> import parsimony.algorithms.proximal as proximal
+    >>> import parsimony.functions.nesterov.tv as tv
+    >>> from parsimony.utils.permutation import PermutationTest
+    >>>
+    >>> np.random.seed(42)
+    >>> X = np.random.rand(50, 10)
+    >>> y = np.dot(X[:, :2], [[1.0], [1.0]]) + 0.1 * np.random.randn(50, 1)
+    >>> A, _ = tv.A_from_shape((10,))
+    >>> estimator = estimators.LinearRegressionL1L2TV(0.01, 0.01, 0.01, A,
+    ...                                mu=1e-4,
+    ...                                algorithm=proximal.FISTA(max_iter=1000))
+    >>> perm = PermutationTest(estimator, num_perms=19, seed=0).run(X, y)
+    >>> perm.pvalues[:2]
+    array([ 0.05,  0.05])
+    """
+    def __init__(self, estimator, num_perms=1000, statistic=None,
+                 batch_size=1, num_workers=1, output=None, seed=None):
+
+        self.estimator = estimator
+        self.num_perms = max(1, int(num_perms))
+        self.statistic = statistic
+        self.batch_size = max(1, int(batch_size))
+        self.num_workers = max(1, int(num_workers))
+        self.output = output
+        self.seed = seed
+
+        self.reference = None
+        self.pvalues = None
+        self.pvalues_corrected = None
+        self.null_max = None
+
+    def run(self, X, y, sample_weight=None):
+        """Fits the estimator to the data and to num_perms permutations of
+        the response.
+
+        Parameters
+        ----------
+        X : Numpy array (n-by-p). The regressor matrix.
+
+        y : Numpy array (n-by-1). The response.
+
+        sample_weight : Numpy array (n-by-1). The sample weights. These are
+                permuted with the response. Default is None, which lets the
+                estimator decide the weights.
+        """
+        estimator = self.estimator
+
+        # Only pass sample weights to estimators that accept them.
+        fit_params = dict()
+        if sample_weight is not None:
+            fit_params["sample_weight"] = sample_weight
+
+        function = estimator.build_function(X, y, **fit_params)
+        estimator.fit_function(function)
+        X, y = function.X, function.y
+
+        weights = getattr(function.rr, "weights", None)
+        if weights is not None:
+            weights = np.asarray(weights)
+            if np.all(weights == weights.flat[0]):
+                weights = None  # Nothing to permute.
+        fit_params.pop("sample_weight", None)
+        if weights is not None:
+            fit_params["sample_weight"] = weights
+
+        self.reference = _statistic(self.statistic, estimator.beta)
+
+        seed = self.seed
+        if seed is None:
+            seed = np.random.randint(0, 2 ** 31 - 1)
+
+        if self.output is not None:
+            out = np.lib.format.open_memmap(self.output, mode="w+",
+                                            dtype=np.float64,
+                                            shape=(self.num_perms,
+                                                   self.reference.shape[0]))
+            del out  # Flushes the file. The workers write the results.
+
+        state = dict(estimator=estimator,
+                     y=y,
+                     weights=weights,
+                     fit_params=fit_params,
+                     statistic=self.statistic,
+                     reference=self.reference,
+                     output=self.output,
+                     seed=seed)
+
+        tasks = [(i, min(i + self.batch_size, self.num_perms))
+                 for i in xrange(0, self.num_perms, self.batch_size)]
+
+        counts = np.zeros(self.reference.shape[0], dtype=int)
+        null_max = np.zeros(self.num_perms)
+
+        if self.num_workers <= 1:
+            # The function of the fit is reused for the permutations.
+            _init_worker(X, state, function=function)
+            try:
+                results = map(_run_task, tasks)
+            finally:
+                _close_worker()
+        else:
+            tmp_dir = tempfile.mkdtemp()
+            try:
+                # The processes share the pages of the memory-mapped file.
+                X_file = os.path.join(tmp_dir, "X.npy")
+                np.save(X_file, X)
+                pool = multiprocessing.Pool(self.num_workers,
+                                            initializer=_init_worker,
+                                            initargs=(X_file, state))
+                try:
+                    results = pool.imap_unordered(_run_task, tasks)
+                    results = list(results)
+                finally:
+                    pool.close()
+                    pool.join()
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        for start, stop, count, maxima in results:
+            counts += count
+            null_max[start:stop] = maxima
+
+        abs_reference = np.abs(self.reference)
+        n = float(self.num_perms + 1)
+        self.pvalues = (counts + 1.0) / n
+        self.pvalues_corrected = \
+            (np.sum(null_max[:, np.newaxis] >= abs_reference, axis=0) + 1.0) / n
+        self.null_max = null_max
+
+        return self
+
+
+def _statistic(statistic, beta):
+    """Returns the statistics of every column of beta, as the rows of a
+    matrix, or as a vector if beta has a single column.
+    """
+    if beta.shape[1] == 1:
+        if statistic is None:
+            return np.ravel(beta)
+        return np.ravel(statistic(beta))
+
+    return np.vstack([_statistic(statistic, beta[:, [j]])
+                      for j in xrange(beta.shape[1])])
+
+
+def _permutation(seed, i, n):
+    """Permutation number i, independent of the other permutations.
+    """
+    return np.random.RandomState([seed, i]).permutation(n)
+
+
+# The state of a worker. Set by _init_worker, in every process of the pool.
+_worker = None
+
+
+def _init_worker(X, state, function=None):
+
+    global _worker
+
+    estimator = state["estimator"]
+    if function is None:
+        if isinstance(X, basestring):
+            X = np.load(X, mmap_mode="r")
+
+        function = estimator.build_function(X, state["y"],
+                                            **state["fit_params"])
+    function.set_params(mu=estimator.mu)
+
+    from parsimony.algorithms.proximal import MultiFISTA
+    algorithm = copy.deepcopy(estimator.algorithm)
+    batched = isinstance(algorithm, MultiFISTA) and state["weights"] is None
+
+    output = None
+    if state["output"] is not None:
+        output = np.load(state["output"], mmap_mode="r+")
+
+    _worker = dict(state, function=function, algorithm=algorithm,
+                   batched=batched, output=output,
+                   abs_reference=np.abs(state["reference"]))
+
+
+def _close_worker():
+
+    global _worker
+    _worker = None
+
+
+def _run_task(task):
+    """Fits the permutations start, ..., stop - 1.
+
+    Returns the number of these permutations with a statistic at least as
+    large as the reference, and the maximum statistic of every permutation.
+    """
+    start, stop = task
+    function = _worker["function"]
+    algorithm = _worker["algorithm"]
+    beta = _worker["estimator"].beta
+    y = _worker["y"]
+    weights = _worker["weights"]
+    n = y.shape[0]
+
+    perms = [_permutation(_worker["seed"], i, n) for i in xrange(start, stop)]
+    if _worker["batched"]:
+        function.set_response(np.hstack([y[perm, :] for perm in perms]))
+        betas = algorithm.run(function, np.tile(beta, (1, len(perms))))
+        stats = np.atleast_2d(_statistic(_worker["statistic"], betas))
+    else:
+        stats = []
+        for perm in perms:
+            if weights is None:
+                function.set_response(y[perm, :])
+            else:
+                function.set_response(y[perm, :], weights[perm, :])
+            beta_perm = algorithm.run(function, beta.copy())
+            stats.append(_statistic(_worker["statistic"], beta_perm))
+        stats = np.vstack(stats)
+
+    if _worker["output"] is not None:
+        _worker["output"][start:stop, :] = stats
+        _worker["output"].flush()
+
+    stats = np.abs(stats)
+    count = np.sum(stats >= _worker["abs_reference"], axis=0)
+
+    return start, stop, count, np.max(stats, axis=1)
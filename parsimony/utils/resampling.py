@@ -10,7 +10,7 @@ Copyright (c) 2013-2014, CEA/DSV/I2BM/Neurospin. All rights reserved.
 """
 import numpy as np
 
-__all__ = ["k_fold", "stratified_k_fold"]
+__all__ = ["k_fold", "stratified_k_fold", "subsample"]
 
 
 def k_fold(n, K=7):
@@ -71,4 +71,50 @@ def stratified_k_fold(y, K=7):
         test = np.where(classes == k)[0].tolist()
         train = list(all_ids.difference(test))
 
-        yield train, test
\ No newline at end of file
+        yield train, test
+
+def subsample(n, num_samples=100, fraction=0.5, replace=False, seed=None):
+    """Random subsample (or bootstrap) iterator.
+
+    Returns the sorted indices of the samples in every subsample. Sorted
+    indices keep the rows of X in memory order when the subsample is read.
+
+    Parameters
+    ----------
+    n : Positive integer. The number of samples.
+
+    num_samples : Positive integer. The number of subsamples. Default is 100.
+
+    fraction : Float in (0, 1]. The fraction of the n samples to draw in every
+            subsample. Default is 0.5, half of the samples.
+
+    replace : Boolean. Whether to draw with replacement or not. Use
+            fraction=1.0 and replace=True for bootstrap samples. Default is
+            False.
+
+    seed : Non-negative integer. The seed of the random number generator.
+            Default is None, which means that numpy's global random number
+            generator is used.
+
+    Examples
+    --------
+    >>> from parsimony.utils.resampling import subsample
+    >>> for idx in subsample(10, num_samples=2, fraction=0.5, seed=42):
+    ...     print idx
+    [0 1 5 7 8]
+    [0 1 3 5 8]
+    """
+    if seed is None:
+        random_state = np.random
+    else:
+        random_state = np.random.RandomState(seed)
+    size = max(1, int(round(fraction * n)))
+
+    for i in xrange(num_samples):
+        if replace:
+            idx = random_state.randint(0, n, size)
+        else:
+            idx = random_state.permutation(n)[:size]
+        idx.sort()
+
+        yield idx
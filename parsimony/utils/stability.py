@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+The :mod:`parsimony.utils.stability` module contains a resampling engine for
+stability selection and bootstrap estimates of the regression coefficients.
+
+Created on Thu Sep 18 10:41:05 2014
+
+Copyright (c) 2013-2014, CEA/DSV/I2BM/Neurospin. All rights reserved.
+
+@author:  Tommy Löfstedt
+@email:   lofstedt.tommy@gmail.com
+@license: BSD 3-clause.
+"""
+import os
+import copy
+import shutil
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+from . import consts
+from . import resampling
+
+__all__ = ["StabilitySelection"]
+
+
+class StabilitySelection(object):
+    """Stability selection: fits an estimator to many random subsamples of
+    the data and counts how often every variable is selected.
+
+    Only aggregates are kept. The selection frequencies and the mean and
+    variance of the regression coefficients are updated after every fit, so
+    the memory used does not depend on the number of subsamples.
+
+    The subsamples are index arrays, and every fit is warm-started from the
+    solution of the previous subsample. For squared loss estimators, when p is
+    not larger than the size of the subsamples, the Gram matrix of the
+    subsample is computed once, and the estimator is fitted to an equivalent
+    problem with at most p rows, which makes every iteration of the
+    algorithm independent of the number of samples.
+
+    Otherwise, e.g. for logistic regression, the estimators are fitted to
+    X[idx, :], since the losses need their data in one array. The rows of
+    the subsample are then copied, but into one buffer per worker, that is
+    reused for all subsamples of the same size, so that no memory is
+    allocated for the data of every fit.
+
+    Parameters
+    ----------
+    estimator : Estimator. The estimator to fit to the subsamples. It must
+            have a method fit(X, y, beta=None).
+
+    num_samples : Positive integer. The number of subsamples. Default is 100.
+
+    fraction : Float in (0, 1]. The fraction of the samples drawn in every
+            subsample. Default is 0.5, half of the samples.
+
+    replace : Boolean. Whether to draw with replacement. Use fraction=1.0 and
+            replace=True for bootstrap samples. Default is False.
+
+    threshold : Non-negative float. A variable is selected if the absolute
+            value of its regression coefficient is larger than threshold.
+            Default is consts.TOLERANCE.
+
+    gram : Boolean or None. Whether to fit the squared loss estimators to the
+            problem compressed through the Gram matrix. Default is None, which
+            means that the Gram matrix is used for the squared loss estimators
+            if p is not larger than the size of the subsamples.
+
+    num_workers : Positive integer. The number of processes to use. X is
+            shared between the processes through a memory-mapped file. Every
+            process fits a contiguous range of the subsamples. Default is 1,
+            all subsamples are fitted in this process.
+
+    seed : Non-negative integer. The seed of the subsamples. Default is None,
+            which means that numpy's global random number generator is used.
+
+    Attributes
+    ----------
+    frequencies : Numpy array (p-by-1). The fraction of the subsamples in
+            which every variable was selected.
+
+    mean : Numpy array (p-by-1). The mean of the regression coefficients over
+            the subsamples.
+
+    variance : Numpy array (p-by-1). The variance of the regression
+            coefficients over the subsamples.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import parsimony.estimators as estimators
+    >>> import parsimony.algorithms.proximal as proximal
+    >>> from parsimony.utils.stability import StabilitySelection
+    >>>
+    >>> np.random.seed(42)
+    >>> X = np.random.randn(100, 10)
+    >>> y = np.dot(X[:, :2], [[1.0], [-1.0]]) + 0.1 * np.random.randn(100, 1)
+    >>> lasso = estimators.Lasso(0.1, algorithm=proximal.FISTA(max_iter=1000))
+    >>> stability = StabilitySelection(lasso, num_samples=50, seed=42)
+    >>> stability = stability.run(X, y)
+    >>> stability.frequencies[:4].T
+    array([[ 1.,  1.,  0.,  0.]])
+    >>> stability.selected(0.9)
+    array([0, 1])
+    """
+    def __init__(self, estimator, num_samples=100, fraction=0.5,
+                 replace=False, threshold=consts.TOLERANCE, gram=None,
+                 num_workers=1, seed=None):
+
+        self.estimator = estimator
+        self.num_samples = max(1, int(num_samples))
+        self.fraction = float(fraction)
+        self.replace = bool(replace)
+        self.threshold = max(0.0, float(threshold))
+        self.gram = gram
+        self.num_workers = max(1, int(num_workers))
+        self.seed = seed
+
+        self.frequencies = None
+        self.mean = None
+        self.variance = None
+
+    def run(self, X, y):
+        """Fits the estimator to num_samples subsamples of the data.
+
+        Parameters
+        ----------
+        X : Numpy array (n-by-p). The regressor matrix.
+
+        y : Numpy array (n-by-1). The response.
+        """
+        n, p = X.shape
+        y = np.reshape(y, (n, -1))
+
+        subsamples = list(resampling.subsample(n,
+                                               num_samples=self.num_samples,
+                                               fraction=self.fraction,
+                                               replace=self.replace,
+                                               seed=self.seed))
+
+        gram = self.gram
+        if gram is None:
+            gram = _squared_loss(self.estimator) \
+                and p <= subsamples[0].shape[0]
+
+        state = dict(estimator=self.estimator,
+                     y=y,
+                     threshold=self.threshold,
+                     gram=gram)
+
+        # Contiguous ranges, so that the warm starts follow the subsamples.
+        tasks = _split(subsamples, self.num_workers)
+
+        if self.num_workers <= 1:
+            _init_worker(X, state)
+            results = map(_run_task, tasks)
+            _close_worker()
+        else:
+            tmp_dir = tempfile.mkdtemp()
+            try:
+                # The processes share the pages of the memory-mapped file.
+                X_file = os.path.join(tmp_dir, "X.npy")
+                np.save(X_file, np.asarray(X, dtype=np.float64))
+                pool = multiprocessing.Pool(self.num_workers,
+                                            initializer=_init_worker,
+                                            initargs=(X_file, state))
+                try:
+                    results = pool.map(_run_task, tasks)
+                finally:
+                    pool.close()
+                    pool.join()
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        moments = reduce(_merge, results)
+        num, mean, M2, selected = moments
+
+        self.frequencies = selected / float(num)
+        self.mean = mean
+        self.variance = M2 / float(num)
+
+        return self
+
+    def selected(self, cutoff=0.5):
+        """Returns the indices of the variables selected with a frequency of
+        at least cutoff.
+
+        Parameters
+        ----------
+        cutoff : Float in [0, 1]. The smallest selection frequency of the
+                stable variables. Default is 0.5.
+        """
+        return np.where(self.frequencies.ravel() >= cutoff)[0]
+
+
+def _split(items, num):
+    """Splits items into at most num contiguous, non-empty, lists.
+    """
+    num = min(num, len(items))
+    bounds = np.linspace(0, len(items), num + 1).astype(int)
+
+    return [items[bounds[i]:bounds[i + 1]] for i in xrange(num)]
+
+
+def _squared_loss(estimator):
+    """Whether the estimator minimises a (mean) squared loss plus penalties
+    that do not depend on the samples.
+    """
+    import parsimony.estimators as estimators
+
+    return isinstance(estimator, (estimators.LinearRegression,
+                                  estimators.RidgeRegression,
+                                  estimators.Lasso,
+                                  estimators.ElasticNet,
+                                  estimators.LinearRegressionL1L2TV,
+                                  estimators.LinearRegressionL1L2GL))
+
+
+def _compress(X, y, idx, mean=True, chunk_size=10000):
+    """Returns a problem with at most p rows, and the same squared loss as
+    X[idx, :] and y[idx, :] up to a constant.
+
+    The Gram matrix is accumulated over chunks of the subsample, so X[idx, :]
+    is never held in memory. With X[idx, :]'X[idx, :] = V.S.V', the
+    compressed problem is S^(1 / 2).V' and S^(-1 / 2).V'X[idx, :]'y[idx, :],
+    scaled so that the mean squared loss is unchanged, if mean is True.
+    """
+    p = X.shape[1]
+    XtX = np.zeros((p, p))
+    Xty = np.zeros((p, y.shape[1]))
+    for start in xrange(0, idx.shape[0], chunk_size):
+        rows = idx[start:start + chunk_size]
+        X_ = X[rows, :]
+        XtX += np.dot(X_.T, X_)
+        Xty += np.dot(X_.T, y[rows, :])
+
+    s, V = np.linalg.eigh(XtX)
+    keep = s > consts.TOLERANCE * max(1.0, s[-1])
+    s, V = s[keep], V[:, keep]
+
+    s_sqrt = np.sqrt(s)[:, np.newaxis]
+    X_c = s_sqrt * V.T
+    y_c = np.dot(V.T, Xty) / s_sqrt
+    if mean:
+        scale = np.sqrt(X_c.shape[0] / float(idx.shape[0]))
+        X_c *= scale
+        y_c *= scale
+
+    return X_c, y_c
+
+
+# The state of a worker. Set by _init_worker, in every process of the pool.
+_worker = None
+
+
+def _init_worker(X, state):
+
+    global _worker
+
+    if isinstance(X, basestring):
+        X = np.load(X, mmap_mode="r")
+
+    _worker = dict(state, X=X, estimator=copy.deepcopy(state["estimator"]))
+
+
+def _close_worker():
+
+    global _worker
+    _worker = None
+
+
+def _run_task(subsamples):
+    """Fits the estimator to the given subsamples, one after the other, and
+    returns the number of fits, the mean and the sum of squared deviations of
+    the regression coefficients, and the selection counts.
+    """
+    X = _worker["X"]
+    y = _worker["y"]
+    estimator = _worker["estimator"]
+    mean = getattr(estimator, "mean", True)
+
+    num = 0
+    beta_mean = beta_M2 = selected = None
+    beta = None
+    X_buffer = None
+    for idx in subsamples:
+        if _worker["gram"]:
+            X_, y_ = _compress(X, y, idx, mean=mean)
+        else:
+            # The rows are copied into a buffer that is reused between the
+            # fits. Only beta is kept from a fit.
+            if X_buffer is None or X_buffer.shape[0] != idx.shape[0]:
+                X_buffer = np.empty((idx.shape[0], X.shape[1]),
+                                    dtype=X.dtype)
+            X_ = np.take(X, idx, axis=0, out=X_buffer)
+            y_ = y[idx, :]
+
+        estimator.fit(X_, y_, beta=beta)
+        beta = estimator.beta
+
+        # Welford's update of the mean and the sum of squared deviations.
+        num += 1
+        if beta_mean is None:
+            beta_mean = np.zeros(beta.shape)
+            beta_M2 = np.zeros(beta.shape)
+            selected = np.zeros(beta.shape, dtype=int)
+        delta = beta - beta_mean
+        beta_mean += delta / float(num)
+        beta_M2 += delta * (beta - beta_mean)
+        selected += np.abs(beta) > _worker["threshold"]
+
+    return num, beta_mean, beta_M2, selected
+
+
+def _merge(a, b):
+    """Merges the moments of two sets of fits.
+    """
+    num_a, mean_a, M2_a, selected_a = a
+    num_b, mean_b, M2_b, selected_b = b
+
+    num = num_a + num_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * (num_b / float(num))
+    M2 = M2_a + M2_b + delta ** 2.0 * (num_a * num_b / float(num))
+
+    return num, mean, M2, selected_a + selected_b
@@ -214,68 +214,126 @@ def deprecated(*replaced_by):
 #        print "WARNING:", s
 
 
-def optimal_shrinkage(X, T=None):
+def optimal_shrinkage(X, T=None, chunk_size=None, num_workers=1):
+    """Computes the optimal shrinkage constants of the covariance matrices of
+    the blocks X[i] towards the targets T[i], in the sense of Ledoit and Wolf.
 
-    tau = []
+    The constants are computed from closed-form identities. The variances of
+    the elements of the covariance matrix are summed through the n-by-n
+    matrix X[i].X[i]' and the row sums of X[i] ** 2, so that no N-by-N matrix
+    is formed if the target is the diagonal of the covariance matrix.
 
+    Parameters
+    ----------
+    X : List of numpy arrays. The blocks, of shapes n-by-N_i.
+
+    T : List of numpy arrays (N_i-by-N_i), or None. The shrinkage targets.
+            Default is None, which means that the targets are the diagonals of
+            the covariance matrices.
+
+    chunk_size : Positive integer. The number of columns of a block that are
+            processed at a time. Use this to limit the memory used for very
+            wide blocks. Default is None, which means that a block is
+            processed at once.
+
+    num_workers : Positive integer. The number of threads that compute the
+            constants of the blocks in parallel. Default is 1.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from parsimony.utils import optimal_shrinkage
+    >>> np.random.seed(42)
+    >>> X = [np.random.randn(20, 5) + np.random.randn(20, 1),
+    ...      np.random.randn(30, 8) + np.random.randn(30, 1)]
+    >>> tau = optimal_shrinkage(X)
+    >>> np.round(tau, 8)
+    array([ 0.35127623,  0.25135631])
+    >>> np.allclose(tau, optimal_shrinkage(X, chunk_size=3, num_workers=2))
+    True
+    """
     if T is None:
         T = [T] * len(X)
     if len(X) != len(T):
-        if T is None:
-            T = [T] * len(X)
-        else:
-            T = [T[0]] * len(X)
-
-    import sys
-    for i in xrange(len(X)):
-        Xi = X[i]
-        Ti = T[i]
-#        print "Here1"
-#        sys.stdout.flush()
-        M, N = Xi.shape
-        Si = np.cov(Xi.T)
-#        print "Here2"
-#        sys.stdout.flush()
-        if Ti is None:
-            Ti = np.diag(np.diag(Si))
-#        print "Here3"
-#        sys.stdout.flush()
-
-        # R = _np.corrcoef(X.T)
-        Wm = Si * ((M - 1.0) / M)  # 1 / N instead of 1 / N - 1
-#        print "Here4"
-#        sys.stdout.flush()
-        sum_d = np.sum((Ti - Si) ** 2.0)
-#        print "Here5"
-#        sys.stdout.flush()
-        del Si
-        del Ti
-#        print "Here6"
-#        sys.stdout.flush()
-
-        Var_sij = 0
-        for i in xrange(N):
-            for j in xrange(N):
-                wij = np.multiply(Xi[:, [i]], Xi[:, [j]]) - Wm[i, j]
-                Var_sij += np.dot(wij.T, wij)
-        Var_sij = Var_sij[0, 0] * (M / ((M - 1.0) ** 3.0))
-
-        # diag = _np.diag(C)
-        # SS_sij = _np.sum((C - _np.diag(diag)) ** 2.0)
-        # SS_sij += _np.sum((diag - 1.0) ** 2.0)
-
-#        d = (Ti - Si) ** 2.0
-
-#        l = Var_sij / np.sum(d)
-        l = Var_sij / sum_d
-        l = max(0, min(1, l))
-
-        tau.append(l)
-#        print "tau %f" % (l,)
+        T = [T[0]] * len(X)
+
+    if chunk_size is None:
+        chunk_size = max([Xi.shape[1] for Xi in X] + [1])
+    chunk_size = max(1, int(chunk_size))
+
+    def shrinkage(i):
+        return _optimal_shrinkage(X[i], T[i], chunk_size)
+
+    if num_workers > 1 and len(X) > 1:
+        # The matrix products release the GIL.
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(num_workers, len(X)))
+        try:
+            tau = pool.map(shrinkage, xrange(len(X)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        tau = map(shrinkage, xrange(len(X)))
 
     return tau
 
 
+def _optimal_shrinkage(X, T, chunk_size):
+    """The optimal shrinkage constant of one block.
+
+    With W the covariance matrix with denominator M, and S the unbiased
+    covariance matrix, the sum of the variances
+
+        sum_ij sum_k (x_ki.x_kj - W_ij) ** 2
+            = sum_k (sum_i x_ki ** 2) ** 2 - |X.X'|_F ** 2 / M + M.|m| ** 4,
+
+    where m are the column means of X, and with Xc the centred X,
+
+        |S|_F ** 2 = |Xc.Xc'|_F ** 2 / (M - 1) ** 2.
+
+    All terms are sums over the columns, and are accumulated over chunks of
+    columns.
+    """
+    M, N = X.shape
+
+    row_ss = np.zeros(M)  # Row sums of X ** 2.
+    XXt = np.zeros((M, M))
+    XXtc = np.zeros((M, M))
+    mean_ss = 0.0
+    var_ss = 0.0  # Sum of the squared diagonal of S * (M - 1).
+    for j in xrange(0, N, chunk_size):
+        Xj = np.asarray(X[:, j:j + chunk_size], dtype=np.float64)
+        mj = np.mean(Xj, axis=0)
+
+        row_ss += np.sum(Xj ** 2.0, axis=1)
+        XXt += np.dot(Xj, Xj.T)
+        mean_ss += np.dot(mj, mj)
+
+        Xj = Xj - mj
+        XXtc += np.dot(Xj, Xj.T)
+        var_ss += np.sum(np.sum(Xj ** 2.0, axis=0) ** 2.0)
+
+    Var_sij = np.dot(row_ss, row_ss) - np.sum(XXt ** 2.0) / M \
+        + M * mean_ss ** 2.0
+    Var_sij *= M / ((M - 1.0) ** 3.0)
+
+    if T is None:  # The target is the diagonal of S.
+        sum_d = (np.sum(XXtc ** 2.0) - var_ss) / ((M - 1.0) ** 2.0)
+    else:
+        T = np.asarray(T)
+        Xc = X - np.mean(X, axis=0)
+        sum_d = 0.0
+        for j in xrange(0, N, chunk_size):
+            Sj = np.dot(Xc.T, Xc[:, j:j + chunk_size]) / (M - 1.0)
+            sum_d += np.sum((T[:, j:j + chunk_size] - Sj) ** 2.0)
+
+    l = Var_sij / sum_d
+    l = max(0, min(1, l))
+
+    return l
+
+
 #def delete_sparse_csr_row(mat, i):
 #    """Delete row i in-place from sparse matrix mat (CSR format).
 #
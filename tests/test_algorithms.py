@@ -8,7 +8,7 @@ Copyright (c) 2013-2014, CEA/DSV/I2BM/Neurospin. All rights reserved.
 @email:   jinpeng.li@cea.fr, lofstedt.tommy@gmail.com
 @license: BSD 3-clause.
 """
-from nose.tools import assert_less
+from nose.tools import assert_less, assert_raises
 
 from tests import TestCase
 
@@ -225,6 +225,439 @@ class TestAlgorithms(TestCase):
 #            #            self.assertTrue(weight_err < 0.01, weight_err)
 #            print weight_err
 
+    def test_multi_fista(self):
+        import numpy as np
+        from parsimony.functions import CombinedFunction
+        import parsimony.functions.losses as losses
+        import parsimony.functions.penalties as penalties
+        from parsimony.algorithms.proximal import FISTA, MultiFISTA
+
+        np.random.seed(42)
+
+        # Both n > p and n < p, with an unpenalised intercept.
+        for n, p in [(100, 30), (30, 100)]:
+            X = np.hstack((np.ones((n, 1)), np.random.randn(n, p - 1)))
+            y = np.random.randn(n, 1)
+            ls = np.logspace(-3, 0, 8)
+            ks = np.linspace(0.0, 1.0, 8)
+
+            def function(l, k):
+                function = CombinedFunction()
+                function.add_function(losses.LinearRegression(X, y))
+                function.add_penalty(penalties.L2Squared(l=k,
+                                                         penalty_start=1))
+                function.add_prox(penalties.L1(l=l, penalty_start=1))
+                return function
+
+            multi = MultiFISTA(eps=1e-8, max_iter=20000)
+            B = multi.run(function(ls, ks), np.zeros((p, 8)))
+
+            for j in xrange(8):
+                fista = FISTA(eps=1e-8, max_iter=20000)
+                beta = fista.run(function(ls[j], ks[j]), np.zeros((p, 1)))
+                assert_less(np.linalg.norm(B[:, [j]] - beta), 5e-8)
+                # Every column stops on its own.
+                assert abs(multi.num_iter_columns[j] - fista.num_iter) <= 1
+
+            assert abs(function(ls, ks).f(B)
+                       - sum([function(ls[j], ks[j]).f(B[:, [j]])
+                              for j in xrange(8)])) < 5e-10
+
+            # Only the columns that have not converged are computed.
+            multi_function = function(ls, ks)
+            loss = multi_function._f[0]
+            grad = loss.grad
+            widths = []
+
+            def column_grad(beta):
+                widths.append(beta.shape[1])
+                return grad(beta)
+            loss.grad = column_grad
+            multi.run(multi_function, np.zeros((p, 8)))
+            assert widths[0] == 8
+            assert len(widths) == max(multi.num_iter_columns)
+            assert sum(widths) == sum(multi.num_iter_columns)
+
+            # The cached X'y follows y.
+            loss = losses.LinearRegression(X, y)
+            B = np.random.randn(p, 8)
+            loss.grad(B)
+            loss.set_params(y=-y)
+            assert_less(np.linalg.norm(loss.grad(B)
+                        - losses.LinearRegression(X, -y).grad(B)), 5e-10)
+
+    def test_fista_acceleration(self):
+        import numpy as np
+        import parsimony.functions as functions
+        import parsimony.functions.nesterov.tv as tv
+        from parsimony.algorithms.proximal import FISTA
+        from parsimony.algorithms.primaldual import StaticCONESTA
+
+        np.random.seed(42)
+
+        X = np.random.rand(100, 60)
+        y = np.random.rand(100, 1)
+        A, _ = tv.A_from_shape((6, 10))
+        start = np.random.rand(60, 1)
+
+        for k in [0.01, 1.0]:
+            function = functions.LinearRegressionL1L2TV(X, y, k, 0.05, 0.1,
+                                                        A=A, mu=1e-3)
+            fista = FISTA(eps=1e-8, max_iter=100000)
+            beta = fista.run(function, start.copy())
+            num_iter = fista.num_iter
+
+            for params in [dict(backtrack=True),
+                           dict(restart="gradient"),
+                           dict(restart="function"),
+                           dict(strongly_convex=True),
+                           dict(backtrack=True, restart="gradient",
+                                strongly_convex=True)]:
+                fista = FISTA(eps=1e-8, max_iter=100000, **params)
+                beta_ = fista.run(function, start.copy())
+                assert_less(np.linalg.norm(beta - beta_), 5e-8)
+                if "restart" in params:
+                    assert_less(3 * fista.num_iter, num_iter)
+
+            conesta = StaticCONESTA(eps=1e-6, max_iter=100000)
+            beta = conesta.run(function, start.copy())
+            num_iter = conesta.num_iter
+            conesta = StaticCONESTA(eps=1e-6, max_iter=100000,
+                                    backtrack=True, restart="gradient",
+                                    strongly_convex=True)
+            beta_ = conesta.run(function, start.copy())
+            assert_less(np.linalg.norm(beta - beta_), 5e-8)
+            assert_less(2 * conesta.num_iter, num_iter)
+            assert function.get_mu() == 1e-3
+
+        self.assertRaises(ValueError, FISTA, restart="momentum")
+
+    def test_gradient_descent(self):
+        import numpy as np
+        import scipy.sparse as sparse
+        import parsimony.functions as functions
+        import parsimony.functions.losses as losses
+        import parsimony.functions.nesterov.tv as tv
+        from parsimony.algorithms.gradient import GradientDescent, NewtonCG
+        from parsimony.algorithms.utils import Info
+
+        np.random.seed(42)
+
+        n, p = 100, 60
+        X = np.random.rand(n, p)
+        y = np.random.rand(n, 1)
+        A, _ = tv.A_from_shape((6, 10))
+
+        ridge = losses.RidgeRegression(X, y, 0.01)
+        beta_ridge = np.linalg.solve(np.dot(X.T, X) / n + 0.01 * np.eye(p),
+                                     np.dot(X.T, y) / n)
+        logistic = losses.RidgeLogisticRegression(X, (y > 0.5).astype(float),
+                                                  0.01)
+        newton = NewtonCG(eps=1e-12, info=[Info.num_iter])
+        beta_logistic = newton.run(logistic, np.zeros((p, 1)))
+        assert newton.num_iter == newton.info_get(Info.num_iter)
+        assert 0 < newton.num_iter < newton.max_iter
+        smoothed = functions.LinearRegressionL2SmoothedL1TV(X, y, 0.05, 0.1,
+                                                            0.1, Atv=A,
+                                                            Al1=sparse.eye(p),
+                                                            mu=1e-2)
+        beta_smoothed = GradientDescent(eps=1e-12, max_iter=100000).run(
+                                                    smoothed, np.zeros((p, 1)))
+
+        for function, beta in [(ridge, beta_ridge),
+                               (logistic, beta_logistic),
+                               (smoothed, beta_smoothed)]:
+            gd = GradientDescent(eps=1e-8, max_iter=100000)
+            gd.run(function, np.zeros((p, 1)))
+            num_iter = gd.num_iter
+
+            for method in ["gradient", "nesterov", "bb"]:
+                for line_search in [False, True]:
+                    gd = GradientDescent(eps=1e-8, max_iter=100000,
+                                         method=method,
+                                         line_search=line_search)
+                    beta_ = gd.run(function, np.zeros((p, 1)))
+                    assert_less(np.linalg.norm(beta - beta_), 5e-5)
+                    if method != "gradient":
+                        assert_less(gd.num_iter, num_iter)
+
+        self.assertRaises(ValueError, GradientDescent, method="newton")
+
+    def test_chambolle_pock(self):
+        import numpy as np
+        import parsimony.functions as functions
+        import parsimony.functions.nesterov.tv as tv
+        import parsimony.functions.nesterov.gl as gl
+        from parsimony.algorithms.primaldual import ChambollePock
+        from parsimony.algorithms.primaldual import StaticCONESTA
+        from parsimony.algorithms.utils import Info
+
+        np.random.seed(42)
+
+        X = np.random.rand(100, 60)
+        y = np.random.rand(100, 1)
+        A, _ = tv.A_from_shape((6, 10))
+        groups = [range(0, 25), range(20, 45), range(40, 60)]
+        A_gl = gl.A_from_groups(60, groups)
+        X_1 = np.hstack((np.ones((100, 1)), X))  # With an intercept.
+
+        for function in [functions.LinearRegressionL1L2TV(X, y, 0.1, 0.05,
+                                                          0.1, A=A, mu=1e-4),
+                         functions.LinearRegressionL1L2TV(X_1, y, 0.5, 0.0,
+                                                          0.5, A=A, mu=1e-4,
+                                                          penalty_start=1),
+                         functions.LinearRegressionL1L2GL(X, y, 0.05, 0.1,
+                                                          0.1, A=A_gl,
+                                                          mu=1e-4)]:
+            cp = ChambollePock(eps=1e-6, max_iter=10000,
+                               info=[Info.gap, Info.converged])
+            p = function.X.shape[1]
+            beta = cp.run(function, np.zeros((p, 1)))
+            assert cp.info_get(Info.converged)
+            assert_less(cp.info_get(Info.gap)[-1], 1e-6)
+
+            # The gap bounds the error, CONESTA may be less accurate.
+            conesta = StaticCONESTA(eps=1e-8, max_iter=20000)
+            beta_ = conesta.run(function, np.random.rand(p, 1))
+            assert_less(function.f(beta) - function.f(beta_), 1e-6)
+
+        # The dual function is only computed for a squared loss.
+        function = functions.LogisticRegressionL1L2TV(X, y > 0.5, 0.1, 0.05,
+                                                      0.1, A=A, mu=1e-4)
+        assert_raises(ValueError, ChambollePock().run, function,
+                      np.zeros((60, 1)))
+
+    def test_admm(self):
+        import numpy as np
+        import parsimony.functions as functions
+        import parsimony.functions.nesterov.tv as tv
+        from parsimony.algorithms.primaldual import ADMM
+        from parsimony.algorithms.primaldual import ChambollePock
+        from parsimony.algorithms.utils import Info
+
+        np.random.seed(42)
+
+        A, _ = tv.A_from_shape((6, 10))
+        X = np.random.rand(100, 60)
+        X_1 = np.hstack((np.ones((100, 1)), X))  # With an intercept.
+        X_wide = np.random.rand(30, 60)  # Through the Woodbury identity.
+        y = np.random.rand(100, 1)
+
+        for function in [functions.LinearRegressionL1L2TV(X, y, 0.1, 0.05,
+                                                          0.1, A=A, mu=1e-4),
+                         functions.LinearRegressionL1L2TV(X_1, y, 0.5, 0.0,
+                                                          0.5, A=A, mu=1e-4,
+                                                          penalty_start=1),
+                         functions.LinearRegressionL1L2TV(X_wide, y[:30, :],
+                                                          0.05, 0.1, 0.1, A=A,
+                                                          mu=1e-4)]:
+            p = function.X.shape[1]
+            cp = ChambollePock(eps=1e-8, max_iter=20000)
+            beta_ = cp.run(function, np.zeros((p, 1)))
+
+            for solver in ["cholesky", "cg"]:
+                admm = ADMM(solver=solver, eps=1e-8, max_iter=10000,
+                            info=[Info.converged])
+                beta = admm.run(function, np.zeros((p, 1)))
+                assert admm.info_get(Info.converged)
+                assert_less(abs(function.f(beta) - function.f(beta_)), 1e-6)
+
+        assert_raises(ValueError, ADMM, solver="qr")
+
+    def test_parallel_dykstra(self):
+
+        import numpy as np
+        import parsimony.functions.penalties as penalties
+        from parsimony.algorithms.proximal import \
+                ParallelDykstrasProximalAlgorithm
+
+        np.random.seed(42)
+
+        x = 3.0 * np.random.randn(50, 1)
+        prox = [penalties.L1(l=0.1)]
+        proj = [penalties.L1(c=4.0), penalties.L2(c=2.0),
+                penalties.L2(c=1.5)]
+
+        sequential = ParallelDykstrasProximalAlgorithm(eps=1e-10,
+                                                       max_iter=10000)
+        y = sequential.run(x, prox=prox, proj=proj)
+        for f in proj:
+            assert f.f(y) <= 5e-8
+
+        # The operators are independent, and are computed concurrently.
+        threaded = ParallelDykstrasProximalAlgorithm(eps=1e-10,
+                                                     max_iter=10000,
+                                                     num_workers=4)
+        assert np.all(threaded.run(x, prox=prox, proj=proj) == y)
+
+        # The projection onto the intersection of the sets, although L2.proj
+        # changes its argument.
+        from parsimony.algorithms.proximal import \
+                ParallelDykstrasProjectionAlgorithm, \
+                DykstrasProjectionAlgorithm
+        proj = [penalties.L1(c=3.0), penalties.L2(c=1.5)]
+        y = ParallelDykstrasProjectionAlgorithm(eps=1e-10,
+                                                max_iter=10000).run(proj, x)
+        y_ = DykstrasProjectionAlgorithm(eps=1e-12,
+                                         max_iter=100000).run(proj, x.copy())
+        assert_less(np.linalg.norm(y - y_), 5e-9)
+
+        # The result after max_iter iterations is the latest average.
+        p = [f.proj(x.copy()) for f in proj]
+        x_1 = 0.5 * (p[0] + p[1])
+        z = [x + x_1 - p[0], x + x_1 - p[1]]
+        x_2 = 0.5 * (proj[0].proj(z[0]) + proj[1].proj(z[1]))
+        for max_iter, x_ in [(1, x_1), (2, x_2)]:
+            algorithm = ParallelDykstrasProjectionAlgorithm(eps=1e-10,
+                                                            max_iter=max_iter)
+            y = algorithm.run(proj, x)
+            assert_less(np.linalg.norm(y - x_), 5e-14)
+
+    def test_consensus_admm(self):
+
+        import numpy as np
+        import parsimony.functions.losses as losses
+        import parsimony.functions.penalties as penalties
+        import parsimony.functions.nesterov.tv as tv
+        from parsimony.functions import CombinedFunction, ShardedFunction
+        from parsimony.algorithms.proximal import FISTA
+        from parsimony.algorithms.distributed import ConsensusADMM
+        from parsimony.algorithms.distributed import ProcessTransport
+
+        np.random.seed(42)
+
+        n, p = 60, 40
+        X = np.random.randn(n, p)
+        y = np.dot(X[:, :3], np.ones((3, 1))) + 0.1 * np.random.randn(n, 1)
+        A, _ = tv.A_from_shape((p,))
+
+        # The shards are loaded by the workers that own them.
+        def shard(i, loss, y):
+            return lambda: loss(X[i::3, :], y[i::3, :], mean=False)
+
+        # Linear regression with smoothed TV. The shards have fewer rows than
+        # columns.
+        function = ShardedFunction([shard(i, losses.LinearRegression, y)
+                                    for i in xrange(3)],
+                                   tv.TotalVariation(2.0, A=A, mu=1e-2))
+        admm = ConsensusADMM(rho=20.0, eps=1e-7, max_iter=5000,
+                             max_inner_iter=1000)
+        beta = admm.run(function, np.zeros((p, 1)))
+
+        combined = CombinedFunction()
+        combined.add_function(losses.LinearRegression(X, y, mean=False))
+        combined.add_penalty(tv.TotalVariation(2.0, A=A, mu=1e-2))
+        beta_ = FISTA(eps=1e-10, max_iter=100000).run(combined,
+                                                      np.zeros((p, 1)))
+        assert_less(np.linalg.norm(beta - beta_), 5e-7)
+
+        admm = ConsensusADMM(rho=20.0, eps=1e-7, max_iter=5000,
+                             max_inner_iter=1000,
+                             transport=ProcessTransport())
+        assert np.all(admm.run(function, np.zeros((p, 1))) == beta)
+
+        # Logistic regression with L1.
+        y = (y > 0.0).astype(float)
+        function = ShardedFunction([shard(i, losses.LogisticRegression, y)
+                                    for i in xrange(3)],
+                                   penalties.L1(l=2.0))
+        admm = ConsensusADMM(rho=1.0, eps=1e-7, max_iter=5000)
+        beta = admm.run(function, np.zeros((p, 1)))
+
+        combined = CombinedFunction()
+        combined.add_function(losses.LogisticRegression(X, y, mean=False))
+        combined.add_prox(penalties.L1(l=2.0))
+        beta_ = FISTA(eps=1e-10, max_iter=100000).run(combined,
+                                                      np.zeros((p, 1)))
+        assert_less(np.linalg.norm(beta - beta_), 5e-7)
+
+        # Linear regression with a ridge penalty, against the closed form.
+        y = np.dot(X[:, :3], np.ones((3, 1))) + 0.1 * np.random.randn(n, 1)
+        function = ShardedFunction([shard(i, losses.LinearRegression, y)
+                                    for i in xrange(3)],
+                                   penalties.L2Squared(l=10.0))
+        admm = ConsensusADMM(rho=20.0, eps=1e-9, max_iter=5000)
+        beta = admm.run(function, np.zeros((p, 1)))
+        beta_ = np.linalg.solve(np.dot(X.T, X) + 10.0 * np.eye(p),
+                                np.dot(X.T, y))
+        assert_less(np.linalg.norm(beta - beta_), 5e-8)
+
+        # Without a penalty, the least squares solution.
+        function = ShardedFunction([shard(i, losses.LinearRegression, y)
+                                    for i in xrange(3)])
+        beta = admm.run(function, np.zeros((p, 1)))
+        beta_ = np.linalg.lstsq(X, y, rcond=-1)[0]
+        assert_less(np.linalg.norm(beta - beta_), 5e-8)
+
+    def test_multiblock_jacobi(self):
+        import numpy as np
+        import parsimony.functions.multiblock.losses as mb_losses
+        import parsimony.functions.penalties as penalties
+        import parsimony.functions.nesterov.tv as tv
+        from parsimony.algorithms.utils import Info
+        from parsimony.algorithms.multiblock import MultiblockFISTA
+        from parsimony.algorithms.multiblock import MultiblockCONESTA
+
+        np.random.seed(42)
+
+        X = [np.random.rand(100, 5), np.random.rand(100, 4),
+             np.random.rand(100, 3)]
+        w = [np.random.rand(5, 1), np.random.rand(4, 1),
+             np.random.rand(3, 1)]
+        function = mb_losses.CombinedMultiblockFunction(X)
+        for i in xrange(3):
+            for j in xrange(3):
+                if i != j:
+                    cov = mb_losses.LatentVariableCovariance([X[i], X[j]])
+                    function.add_function(cov, i, j)
+            function.add_constraint(penalties.L2(c=1.0), i)
+
+        eps = 1e-8
+        ws = []
+        for params in [dict(), dict(jacobi=True),
+                       dict(jacobi=True, num_workers=3)]:
+            function.reset()
+            algorithm = MultiblockFISTA(info=[Info.converged], eps=eps,
+                                        outer_iter=500, **params)
+            w_ = algorithm.run(function, [wi.copy() for wi in w])
+            assert algorithm.info_get(Info.converged)
+            ws.append(w_)
+
+            # Converged means that every block is at a fixed point of the
+            # ISTA step, at the final weight vectors of all blocks.
+            for i in xrange(3):
+                step = function.step(w_, i)
+                w_tilde = function.prox(w_[:i]
+                                        + [w_[i] - step * function.grad(w_, i)]
+                                        + w_[i + 1:], i, step)
+                assert_less(np.linalg.norm(w_[i] - w_tilde), 2.0 * step * eps)
+
+        # The threads share the function and its cross-products.
+        for i in xrange(3):
+            assert np.all(ws[2][i] == ws[1][i])
+            assert_less(np.linalg.norm(ws[1][i] - ws[0][i]), 5e-6)
+
+        # The smoothing is passed explicitly, so several threads may share a
+        # Nesterov function.
+        A, _ = tv.A_from_shape((5,))
+        total_variation = tv.TotalVariation(0.1, A=A, mu=0.01)
+        X = [np.random.rand(100, 5), np.random.rand(100, 5)]
+        function = mb_losses.CombinedMultiblockFunction(X)
+        for i in xrange(2):
+            cov = mb_losses.LatentVariableCovariance([X[i], X[1 - i]])
+            function.add_function(cov, i, 1 - i)
+            function.add_penalty(total_variation, i)
+            function.add_constraint(penalties.L2(c=1.0), i)
+        w = [np.random.rand(5, 1), np.random.rand(5, 1)]
+        ws = []
+        for num_workers in [1, 2]:
+            conesta = MultiblockCONESTA(jacobi=True, num_workers=num_workers,
+                                        outer_iter=5, max_iter=500)
+            ws.append(conesta.run(function, [wi.copy() for wi in w]))
+            assert total_variation.get_mu() == 0.01
+        for i in xrange(2):
+            assert np.all(ws[1][i] == ws[0][i])
+
 if __name__ == "__main__":
     import unittest
     unittest.main()
\ No newline at end of file
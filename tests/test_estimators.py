@@ -8,7 +8,7 @@ Copyright (c) 2013-2014, CEA/DSV/I2BM/Neurospin. All rights reserved.
 @email:   lofstedt.tommy@gmail.com
 @license: BSD 3-clause.
 """
-from nose.tools import assert_less
+from nose.tools import assert_less, assert_raises
 
 from tests import TestCase
 
@@ -52,6 +52,266 @@ class TestEstimators(TestCase):
 #        print "converged:", ret_info[Info.converged]
         assert ret_info[Info.converged] == False
 
+    def test_model_bank(self):
+        import numpy as np
+        import parsimony.estimators as estimators
+
+        np.random.seed(42)
+
+        n, p = 30, 100
+        X = np.random.randn(n, p)
+        y = np.random.randn(n, 1)
+
+        def models(nnz, mean):
+            models = []
+            for j in xrange(10):
+                model = estimators.Lasso(1.0, mean=mean)
+                model.beta = np.zeros((p, 1))
+                idx = np.random.choice(p, nnz, replace=False)
+                model.beta[idx] = np.random.randn(nnz, 1)
+                models.append(model)
+            return models
+
+        # Small union of supports, sparse models and dense models.
+        for nnz, attr in [(2, "_support"), (8, "_Bs"), (p, None)]:
+            bank_models = models(nnz, True) + models(nnz, False)
+            bank = estimators.ModelBank(bank_models)
+
+            yhat = np.hstack([m.predict(X) for m in bank_models])
+            assert np.linalg.norm(bank.predict(X) - yhat) < 5e-12
+            scores = [m.score(X, y) for m in bank_models]
+            assert np.linalg.norm(bank.score(X, y) - scores) < 5e-12
+            if attr is not None:
+                assert getattr(bank, attr) is not None
+
+    def test_compact_model(self):
+        import os
+        import tempfile
+        import numpy as np
+        import scipy.sparse as sparse
+        import parsimony.estimators as estimators
+        import parsimony.algorithms.gradient as gradient
+
+        np.random.seed(42)
+
+        n, p = 20, 50
+        X = np.random.randn(n, p)
+        y = np.random.randint(0, 2, (n, 1)).astype(float)
+
+        model = estimators.LogisticRegression(
+                                        algorithm=gradient.GradientDescent())
+        model.beta = np.zeros((p, 1))
+        model.beta[[3, 17, 41]] = np.random.randn(3, 1)
+        compact = model.compact()
+        assert compact.logistic
+        assert np.all(compact.support == [3, 17, 41])
+
+        # Dense, sparse and memory-mapped column-major X.
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            Xmm = np.memmap(path, dtype=np.float64, mode="w+", shape=(n, p),
+                            order="F")
+            Xmm[:] = X
+            for X_ in [X, sparse.csc_matrix(X), Xmm]:
+                assert np.all(compact.predict(X_) == model.predict(X))
+                assert np.linalg.norm(compact.predict_probability(X_)
+                                      - model.predict_probability(X)) < 5e-15
+                assert compact.score(X_, y) == model.score(X, y)
+            del Xmm
+        finally:
+            os.remove(path)
+
+        fd, path = tempfile.mkstemp(suffix=".npz")
+        os.close(fd)
+        try:
+            compact.save(path)
+            loaded = estimators.CompactModel.load(path)
+        finally:
+            os.remove(path)
+        assert loaded.logistic and loaded.p == p
+        assert np.all(loaded.beta() == model.beta)
+
+        # Large negative logits must not overflow.
+        model.beta *= 1000.0
+        bank = estimators.ModelBank([model])
+        logit = np.dot(X, model.beta)
+        assert np.min(logit) < -710.0
+        with np.errstate(over="raise"):
+            for prob in [model.compact().predict_probability(X),
+                         bank.predict_probability(X)]:
+                assert np.all(prob[logit > 0] > 0.5)
+                assert np.all(prob[logit < 0] < 0.5)
+                assert np.all(prob >= 0.0)
+
+    def test_permutation_test(self):
+        import os
+        import tempfile
+        import numpy as np
+        import parsimony.estimators as estimators
+        import parsimony.algorithms.proximal as proximal
+        import parsimony.functions.nesterov.tv as tv
+        from parsimony.utils.permutation import PermutationTest
+
+        np.random.seed(42)
+
+        n, p = 50, 20
+        X = np.random.rand(n, p)
+        y = np.dot(X[:, :3], np.ones((3, 1))) + 0.1 * np.random.randn(n, 1)
+        A, _ = tv.A_from_shape((p,))
+
+        def run(algorithm, **kwargs):
+            np.random.seed(0)  # The start vector of the reference fit.
+            estimator = estimators.LinearRegressionL1L2TV(0.05, 0.5, 0.01, A,
+                                                          mu=0.01,
+                                                          algorithm=algorithm)
+            fd, path = tempfile.mkstemp(suffix=".npy")
+            os.close(fd)
+            try:
+                perm = PermutationTest(estimator, num_perms=10, seed=1,
+                                       output=path, **kwargs).run(X, y)
+                null = np.load(path)
+            finally:
+                os.remove(path)
+
+            return perm, null
+
+        perm, null = run(proximal.FISTA(eps=1e-10, max_iter=5000))
+        assert null.shape == (10, p)
+        assert np.all(perm.null_max == np.max(np.abs(null), axis=1))
+        assert np.all(perm.pvalues[:3] == 1.0 / 11.0)
+        assert np.all(perm.pvalues_corrected >= perm.pvalues)
+
+        # The same permutations in parallel, and in batches.
+        perm_, null_ = run(proximal.FISTA(eps=1e-10, max_iter=5000),
+                           num_workers=2)
+        assert np.all(null_ == null)
+        perm_, null_ = run(proximal.MultiFISTA(eps=1e-10, max_iter=5000),
+                           batch_size=4)
+        assert_less(np.max(np.abs(null_ - null)), 5e-8)
+        assert np.all(perm_.pvalues == perm.pvalues)
+
+        # Serially, the function is built once, and the worker state is
+        # freed even if a permutation fails.
+        import parsimony.utils.permutation as permutation
+        estimator = estimators.LinearRegressionL1L2TV(0.05, 0.5, 0.01, A,
+                                                      mu=0.01)
+        build_function = estimator.build_function
+        built = []
+
+        def counted_build_function(*args, **kwargs):
+            built.append(1)
+            return build_function(*args, **kwargs)
+        estimator.build_function = counted_build_function
+        PermutationTest(estimator, num_perms=2, seed=1).run(X, y)
+        assert len(built) == 1
+
+        def statistic(beta):
+            if permutation._worker is not None:
+                raise ValueError()
+            return beta.ravel()
+        assert_raises(ValueError, PermutationTest(estimator, num_perms=2,
+                                                  statistic=statistic).run,
+                      X, y)
+        assert permutation._worker is None
+
+    def test_stability_selection(self):
+        import numpy as np
+        import parsimony.estimators as estimators
+        import parsimony.algorithms.proximal as proximal
+        from parsimony.utils.stability import StabilitySelection
+
+        np.random.seed(42)
+
+        n, p = 100, 20
+        X = np.random.randn(n, p)
+        y = np.dot(X[:, :3], [[1.0], [-1.0], [0.5]]) \
+            + 0.5 * np.random.randn(n, 1)
+
+        def run(**kwargs):
+            lasso = estimators.Lasso(0.1, algorithm=proximal.FISTA(eps=1e-12,
+                                                              max_iter=10000))
+            return StabilitySelection(lasso, num_samples=20, seed=42,
+                                      **kwargs).run(X, y)
+
+        direct = run(gram=False)
+        assert np.all(direct.selected(1.0) == [0, 1, 2])
+        assert np.all((direct.frequencies >= 0.0)
+                      & (direct.frequencies <= 1.0))
+        assert np.all(direct.variance >= 0.0)
+
+        # The compressed problems have the same solutions.
+        compressed = run(gram=True)
+        assert_less(np.max(np.abs(compressed.mean - direct.mean)), 5e-10)
+        assert_less(np.max(np.abs(compressed.variance - direct.variance)),
+                    5e-10)
+        assert np.all(compressed.frequencies == direct.frequencies)
+
+        # The moments from several processes are merged.
+        for gram in [True, False]:
+            parallel = run(gram=gram, num_workers=3)
+            assert_less(np.max(np.abs(parallel.mean - direct.mean)), 5e-10)
+            assert_less(np.max(np.abs(parallel.variance - direct.variance)),
+                        5e-10)
+
+    def test_block_pls(self):
+        import numpy as np
+        import parsimony.estimators as estimators
+        import parsimony.algorithms.nipals as nipals
+
+        np.random.seed(42)
+
+        n, p, q = 50, 30, 6
+        X = np.random.randn(n, p)
+        Y = np.dot(X[:, :8], np.random.randn(8, q)) + np.random.randn(n, q)
+
+        # The components are the same as those of the deflated X, also
+        # when there are more components than columns of Y.
+        for Y_, K in [(Y, 4), (Y, 10), (Y[:, [0]], 3)]:
+            plsr = estimators.PLSRegression(K=K, algorithm=nipals.PLSR(
+                max_iter=5000, eps=1e-14)).fit(X, Y_)
+            block = estimators.PLSRegression(K=K, algorithm=nipals.BlockPLSR(
+                max_iter=5000, eps=1e-14)).fit(X, Y_)
+            for name in ["W", "T", "C", "U", "P", "beta"]:
+                A = getattr(plsr, name)
+                assert_less(np.linalg.norm(getattr(block, name) - A),
+                            5e-12 * np.linalg.norm(A))
+            assert_less(np.linalg.norm(np.dot(block.W.T, block.W)
+                                       - np.eye(K)), 5e-10)
+            assert_less(abs(block.score(X, Y_) - plsr.score(X, Y_)), 5e-12)
+
+        for l, penalise_y in [([30.0, 0.0], False), ([30.0, 5.0], True)]:
+            sparse = estimators.SparsePLSRegression(l=l, K=3,
+                algorithm=nipals.SparsePLSR(penalise_y=penalise_y,
+                                            max_iter=5000, eps=1e-14))
+            block = estimators.SparsePLSRegression(l=l, K=3,
+                algorithm=nipals.SparseBlockPLSR(penalise_y=penalise_y,
+                                                 max_iter=5000, eps=1e-14))
+            sparse.fit(X, Y)
+            block.fit(X, Y)
+            for name in ["W", "T", "C", "P", "beta"]:
+                A = getattr(sparse, name)
+                assert_less(np.linalg.norm(getattr(block, name) - A),
+                            5e-12 * np.linalg.norm(A))
+
+            # The weight vectors of Y of the non-zero components are
+            # normalised.
+            W, C = nipals.SparseBlockPLSR(l=l, penalise_y=penalise_y).run(
+                [X, Y], 3)
+            nonzero = np.any(W != 0.0, axis=0)
+            assert nonzero[0]
+            assert_less(np.max(np.abs(np.sum(C[:, nonzero] ** 2.0, axis=0)
+                                      - 1.0)), 5e-15)
+
+        # The given algorithm is not changed.
+        algorithm = nipals.SparseBlockPLSR(l=[0.0, 0.0])
+        sparse = estimators.SparsePLSRegression(l=[30.0, 0.0], K=3,
+                                                algorithm=algorithm)
+        sparse.fit(X, Y)
+        assert algorithm.l == [0.0, 0.0]
+        assert np.all(np.sum(sparse.W == 0.0, axis=0) > 0)
+
+
 if __name__ == "__main__":
     import unittest
     unittest.main()
\ No newline at end of file
@@ -10,6 +10,8 @@ Copyright (c) 2013-2014, CEA/DSV/I2BM/Neurospin. All rights reserved.
 """
 import unittest
 
+from nose.tools import assert_raises
+
 from tests import TestCase
 
 
@@ -81,6 +83,390 @@ class TestFunctions(TestCase):
 #        #        self.assertTrue(err_weight_l1 < 0.01, err_weight_l1)
 #        print err_weight_l1
 
+    def test_multiblock_cross_products(self):
+        import numpy as np
+        import parsimony.functions.multiblock.losses as mb_losses
+        import parsimony.functions.penalties as penalties
+
+        np.random.seed(42)
+
+        n = 50
+        X = [np.random.rand(n, 10), np.random.rand(n, 8),
+             np.random.rand(n, 200)]
+        w = [np.random.rand(10, 1), np.random.rand(8, 1),
+             np.random.rand(200, 1)]
+
+        def function(cache_size):
+            function = mb_losses.CombinedMultiblockFunction(
+                                                X, cache_size=cache_size)
+            for i in xrange(len(X)):
+                for j in xrange(len(X)):
+                    if i != j:
+                        cov = mb_losses.LatentVariableCovariance([X[i], X[j]])
+                        function.add_function(cov, i, j)
+                function.add_constraint(penalties.L2(c=1.0), i)
+
+            return function
+
+        # Room for the 10-by-8 product only.
+        cached = function(1000)
+        uncached = function(0)
+
+        assert abs(cached.f(w) - uncached.f(w)) < 5e-13
+        for i in xrange(len(X)):
+            err = np.linalg.norm(cached.grad(w, i) - uncached.grad(w, i))
+            assert err < 5e-13
+
+        # Only the pair of small blocks fits, and the product is shared.
+        cov01 = cached._f[0][1][0]
+        cov10 = cached._f[1][0][0]
+        assert cov01._XtY is not None
+        assert cov10._XtY.base is cov01._XtY
+        assert cached._f[0][2][0]._XtY is None
+        for i in xrange(len(X)):
+            for j in xrange(len(X)):
+                if i != j:
+                    assert uncached._f[i][j][0]._XtY is None
+
+        cached.reset()
+        assert cov01._XtY is None
+        cached.f(w)
+        assert cov01._XtY is not None
+
+    def test_multinomial_columnwise_penalties(self):
+        import numpy as np
+        import parsimony.functions as functions
+        import parsimony.functions.nesterov.tv as tv
+
+        np.random.seed(42)
+
+        shape = (1, 4, 5)
+        n, p, K = 30, 21, 3
+        X = np.random.randn(n, p)
+        y = np.random.randint(0, K, (n, 1))
+        Y = (y == np.arange(K)).astype(float)
+        A, _ = tv.A_from_shape(shape)
+        beta = np.random.randn(p, K)
+
+        function = functions.MultinomialLogisticRegressionL1L2TV(
+                X, Y, k=0.1, l=0.2, g=0.3, A=A, mu=0.01, penalty_start=1)
+
+        # The penalties and their gradients are the sums over the columns.
+        for f in [function.l1, function.tv]:
+            f_col = sum([f.f(beta[:, [k]]) for k in xrange(K)])
+            assert abs(f.f(beta) - f_col) < 5e-13
+        grad_col = np.hstack([function.tv.grad(beta[:, [k]])
+                              for k in xrange(K)])
+        assert np.linalg.norm(function.tv.grad(beta) - grad_col) < 5e-13
+
+        prox_col = np.hstack([function.prox(beta[:, [k]], 0.1)
+                              for k in xrange(K)])
+        assert np.linalg.norm(function.prox(beta, 0.1) - prox_col) < 5e-13
+
+        # The smooth part has the right gradient.
+        grad = function.grad(beta)
+        function.set_mu(0.01)
+        approx_grad = np.zeros(beta.shape)
+        eps = 1e-5
+        for j in xrange(K):
+            for i in xrange(p):
+                beta[i, j] += eps
+                f2 = function.rr.f(beta) + function.tv.fmu(beta)
+                beta[i, j] -= 2.0 * eps
+                f1 = function.rr.f(beta) + function.tv.fmu(beta)
+                beta[i, j] += eps
+                approx_grad[i, j] = (f2 - f1) / (2.0 * eps)
+        assert np.linalg.norm(grad - approx_grad) < 5e-6
+
+        # The Lipschitz constant is shared between the classes.
+        assert abs(function.tv.L() - 0.3 * function.tv.lambda_max() / 0.01) \
+            < 5e-10
+        assert function.M() == K * function.tv.M()
+
+        # There is no dual, so algorithms that need one are rejected.
+        import parsimony.algorithms.primaldual as primaldual
+        import parsimony.functions.properties as properties
+        assert not isinstance(function, properties.DualFunction)
+        for algorithm in [primaldual.DynamicCONESTA(max_iter=10),
+                          primaldual.ChambollePock(max_iter=10)]:
+            assert_raises(ValueError, algorithm.run, function, beta)
+        primaldual.StaticCONESTA(max_iter=10).run(function, beta)
+
+    def test_l2_smoothed_l1tv_betahat(self):
+
+        import numpy as np
+        import parsimony.functions.combinedfunctions as combinedfunctions
+        import parsimony.functions.nesterov.l1tv as l1tv
+
+        np.random.seed(42)
+
+        shape = (1, 2, 5)
+        p = np.prod(shape)
+        Atv, Al1 = l1tv.A_from_shape(shape, p)
+        k = 0.3
+        for n in [25, 4]:  # Primal and dual factorisation.
+            X = np.random.randn(n, p)
+            y = np.random.randn(n, 1)
+            function = combinedfunctions.LinearRegressionL2SmoothedL1TV(
+                X, y, 0.1, k, 0.2, Atv=Atv, Al1=Al1)
+
+            alpha = function.alpha(np.random.randn(p, 1))
+            A = function.h.A()
+            grad = sum(A[i].T.dot(alpha[i]) for i in xrange(len(A)))
+            XtXkI = np.dot(X.T, X) + k * np.eye(p)
+            beta = np.linalg.solve(XtXkI, np.dot(X.T, y) - grad)
+
+            # Twice, since the factorisation is cached.
+            for i in xrange(2):
+                beta_hat = function.betahat(alpha)
+                assert np.linalg.norm(beta_hat - beta) < 5e-13
+
+    def test_ridge_betahat(self):
+
+        import numpy as np
+        import parsimony.functions as functions
+        import parsimony.functions.nesterov.tv as tv
+        import parsimony.functions.nesterov.gl as gl
+
+        np.random.seed(42)
+
+        A_tv, _ = tv.A_from_shape((3, 4))
+        A_gl = gl.A_from_groups(12, [range(0, 7), range(5, 12)])
+        for n in [30, 8]:  # Primal and dual factorisation.
+            X = np.random.randn(n, 12)
+            y = np.random.randn(n, 1)
+            for function in [functions.LinearRegressionL1L2TV(X, y, 0.3, 0.0,
+                                                              0.2, A=A_tv),
+                             functions.LinearRegressionL1L2GL(X, y, 0.0, 0.3,
+                                                              0.2, A=A_gl)]:
+                _, _, nesterov = function.split()
+                alpha = nesterov.alpha(np.random.randn(12, 1), mu=0.1)
+                Ata = nesterov.l * nesterov.Aa(alpha)
+                beta = np.linalg.solve(np.dot(X.T, X) / n
+                                       + 0.3 * np.eye(12),
+                                       np.dot(X.T, y) / n - Ata)
+
+                # Twice, since the factorisation is cached.
+                for i in xrange(2):
+                    beta_hat = function.betahat(alpha, np.zeros((12, 1)))
+                    assert np.linalg.norm(beta_hat - beta) < 5e-13
+
+    def test_l1tv_scaled_operators(self):
+
+        import numpy as np
+        import parsimony.functions.combinedfunctions as combinedfunctions
+        import parsimony.functions.nesterov.l1tv as l1tv
+
+        np.random.seed(42)
+
+        shape = (1, 4, 5)
+        p = np.prod(shape)
+        Atv, Al1 = l1tv.A_from_shape(shape, p)
+        X = np.random.randn(30, p)
+        y = np.random.randn(30, 1)
+        beta = np.random.randn(p, 1)
+
+        function = combinedfunctions.LinearRegressionL2SmoothedL1TV(
+            X, y, 0.1, 0.1, 0.2, Atv=Atv, Al1=Al1, mu=1e-3)
+        function.h.lambda_max()
+        function.set_params(l=0.3, g=0.4)
+        function_ = combinedfunctions.LinearRegressionL2SmoothedL1TV(
+            X, y, 0.3, 0.1, 0.4, Atv=Atv, Al1=Al1, mu=1e-3)
+
+        # The operators are not copied, and the constants are not stale.
+        assert function.h.A()[1].A is Atv[0]
+        assert abs(function.h.lambda_max() - function_.h.lambda_max()) \
+            < 5e-13
+        assert abs(function.f(beta) - function_.f(beta)) < 5e-13
+        assert np.linalg.norm(function.grad(beta) - function_.grad(beta)) \
+            < 5e-13
+
+        A = [0.3 * Al1[0]] + [0.4 * A_i for A_i in Atv]
+        f = np.sum(np.abs(A[0].dot(beta))) \
+            + np.sum(np.sqrt(sum([A_i.dot(beta) ** 2.0 for A_i in A[1:]])))
+        assert abs(function.h.f(beta) - f) < 5e-13
+
+    def test_projections(self):
+
+        import numpy as np
+        import parsimony.functions.penalties as penalties
+
+        np.random.seed(42)
+
+        def proj_l1(v, c):  # Projection by sorting.
+            a = np.sort(np.abs(v))[::-1]
+            suma = np.cumsum(a)
+            i = np.nonzero(a * np.arange(1, a.shape[0] + 1) > suma - c)[0][-1]
+            l = (suma[i] - c) / (i + 1.0)
+            return np.sign(v) * np.maximum(np.abs(v) - l, 0.0)
+
+        c = 3.0
+        x = np.round(np.random.randn(51, 4) * 2.0)  # With ties.
+        x[:, 3] *= 0.01  # Feasible column.
+        l1 = penalties.L1(c=c, penalty_start=1)
+        y = l1.proj(x)
+        assert np.all(y[0, :] == x[0, :])
+        assert np.all(y[:, 3] == x[:, 3])
+        for j in xrange(3):
+            assert np.linalg.norm(y[1:, j] - proj_l1(x[1:, j], c)) < 5e-13
+        z = x.copy()
+        assert l1.proj(z, out=z) is z
+        assert np.all(z == y)
+
+        x = np.random.randn(50, 3)
+        y = penalties.L0(c=5.0).proj(x)
+        for j in xrange(3):
+            keep = np.argsort(-np.abs(x[:, j]))[:5]
+            assert np.sum(y[:, j] != 0.0) == 5
+            assert np.all(y[keep, j] == x[keep, j])
+
+        y = penalties.LInf(c=0.5, penalty_start=2).proj(x)
+        assert np.all(y[:2, :] == x[:2, :])
+        assert np.all(y[2:, :] == np.clip(x[2:, :], -0.5, 0.5))
+
+    def test_quadratic_constraint(self):
+
+        import numpy as np
+        import parsimony.functions.penalties as penalties
+
+        np.random.seed(42)
+
+        def proj(M, x, c):  # Bisection on the Lagrange multiplier.
+            I = np.eye(M.shape[0])
+            low, high = 0.0, 1.0
+            y = np.linalg.solve(I + 2.0 * high * M, x)
+            while np.dot(y.T, np.dot(M, y)) > c:
+                high *= 2.0
+                y = np.linalg.solve(I + 2.0 * high * M, x)
+            for i in xrange(100):
+                mu = 0.5 * (low + high)
+                y = np.linalg.solve(I + 2.0 * mu * M, x)
+                if np.dot(y.T, np.dot(M, y)) > c:
+                    low = mu
+                else:
+                    high = mu
+            return np.linalg.solve(I + 2.0 * high * M, x)
+
+        X = np.random.randn(10, 41)
+        A = np.random.randn(41, 41)
+        x = 3.0 * np.random.randn(41, 1)
+        AAt = np.dot(A, A.T)
+        for params, M in [(dict(M=AAt), AAt[1:, 1:]),
+                          (dict(M=X, N=X), np.dot(X[:, 1:].T, X[:, 1:]))]:
+            quad = penalties.QuadraticConstraint(l=2.0, c=1.0, penalty_start=1,
+                                                 **params)
+            xMx = np.dot(x[1:, :].T, np.dot(M, x[1:, :]))[0, 0]
+            assert abs(quad.f(x) - 2.0 * (xMx - 1.0)) < 5e-10 * xMx
+            assert np.linalg.norm(quad.grad(x)[1:, :]
+                                  - 4.0 * np.dot(M, x[1:, :])) < 5e-10 * xMx
+
+            y = quad.proj(x)
+            assert quad.feasible(y)
+            assert y[0, 0] == x[0, 0]
+            assert np.linalg.norm(y[1:, :] - proj(M, x[1:, :], 1.0)) < 5e-8
+
+    def test_continuation_schedule(self):
+
+        import numpy as np
+        import parsimony.functions as functions
+        import parsimony.functions.nesterov.tv as tv
+        from parsimony.algorithms.utils import ContinuationSchedule
+
+        np.random.seed(42)
+
+        X = np.random.rand(30, 12)
+        y = np.random.rand(30, 1)
+        A, _ = tv.A_from_shape((3, 4))
+        function = functions.LinearRegressionL1L2TV(X, y, 0.2, 0.1, 0.3, A=A,
+                                                    mu=0.05)
+        schedule = ContinuationSchedule(*function.continuation_constants())
+
+        gM = 0.3 * function.tv.M()
+        function.tv.set_mu(1.0)
+        gA2 = function.tv.L()
+        function.tv.set_mu(0.05)
+        Lg = function.rr.L()
+        for mu in [1.0, 0.05, 1e-4]:
+            eps = (2.0 * gM * gA2 * mu + gM * Lg * mu ** 2.0) / gA2
+            assert abs(schedule.eps_opt(mu) - eps) < 5e-12 * eps
+            assert abs(schedule.mu_opt(eps) - mu) < 5e-12 * mu
+            assert abs(schedule.eps_max(mu) - gM * mu) < 5e-15
+            assert abs(schedule.step(mu) - 1.0 / (Lg + gA2 / mu)) < 5e-15
+        assert function.get_mu() == 0.05
+        assert abs(function.step(y) - schedule.step(0.05)) < 5e-15
+        assert function.eps_opt(0.05) == schedule.eps_opt(0.05)
+
+    def test_explicit_mu(self):
+
+        import numpy as np
+        from multiprocessing.pool import ThreadPool
+        import parsimony.functions as functions
+        import parsimony.functions.nesterov.tv as tv
+        import parsimony.functions.nesterov.l1tv as l1tv
+        import parsimony.algorithms.primaldual as primaldual
+        import parsimony.algorithms.proximal as proximal
+
+        np.random.seed(42)
+
+        X = np.random.rand(30, 12)
+        y = np.random.rand(30, 1)
+        A, _ = tv.A_from_shape((3, 4))
+        function = functions.LinearRegressionL1L2TV(X, y, 0.2, 0.1, 0.3, A=A,
+                                                    mu=0.05)
+        beta = np.random.rand(12, 1)
+
+        for mu in [1.0, 1e-3]:
+            view = functions.FixedMuFunction(function, mu)
+            grad = view.grad(beta)
+            L = view.L()
+            fmu = view.fmu(beta)
+            function.set_mu(mu)
+            assert np.linalg.norm(grad - function.grad(beta)) < 5e-13
+            assert abs(L - function.L()) < 5e-13
+            assert abs(fmu - function.fmu(beta)) < 5e-13
+            function.set_mu(0.05)
+
+        gap = function.gap(beta)
+        assert function.get_mu() == 0.05
+        function.set_mu(0.01)
+        assert abs(function.gap(beta) - gap) < 5e-13
+        function.set_mu(0.05)
+
+        # The other algorithms pass mu explicitly as well.
+        proximal.FISTA(max_iter=50, conesta_stop=[1e-4]).run(function, beta)
+        primaldual.NaiveCONESTA(max_iter=200).run(function, beta)
+        assert function.get_mu() == 0.05
+        Atv, Al1 = l1tv.A_from_shape((3, 4), 12)
+        smoothed = functions.combinedfunctions.LinearRegressionL2SmoothedL1TV(
+                X, y, 0.1, 0.2, 0.3, Atv=Atv, Al1=Al1, mu=0.05)
+        primaldual.ExcessiveGapMethod(max_iter=50).run(smoothed)
+        assert smoothed.get_mu() == 0.05
+
+        # The same function, minimised by several threads at once. The
+        # logistic loss keeps buffers, that must not be shared.
+        X_ = np.random.randn(30, 12)
+        y_ = (np.random.rand(30, 1) > 0.5).astype(float)
+        logistic = functions.LogisticRegressionL1L2TV(X_, y_, 0.01, 0.001,
+                                                      0.01, A=A, mu=0.05)
+        starts = [np.random.rand(12, 1) for i in range(4)]
+        for function in [function, logistic]:
+            conesta = primaldual.StaticCONESTA(max_iter=500)
+            betas = [conesta.run(function, start.copy()) for start in starts]
+            assert function.get_mu() == 0.05
+
+            def run(start):
+                return primaldual.StaticCONESTA(max_iter=500).run(
+                    function, start.copy())
+            pool = ThreadPool(4)
+            try:
+                betas_ = pool.map(run, starts)
+            finally:
+                pool.close()
+                pool.join()
+            for beta, beta_ in zip(betas, betas_):
+                assert np.linalg.norm(beta - beta_) < 5e-13
+            assert function.get_mu() == 0.05
+
 #    def test_smoothed_l1(self):
 #        import numpy as np
 #        import parsimony.estimators as estimators
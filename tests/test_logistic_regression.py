@@ -1489,6 +1489,69 @@ class TestLogisticRegression(TestCase):
         assert_equal(err, 0.49,
                      msg="The found regression vector is not correct.")
 
+    def test_kernel_cache(self):
+
+        import gc
+        import copy
+        import time
+        import pickle
+        import weakref
+        from multiprocessing.pool import ThreadPool
+        import parsimony.functions.losses as losses
+
+        np.random.seed(42)
+
+        X = np.random.randn(200, 30)
+        y = (np.random.rand(200, 1) > 0.5).astype(float)
+        beta = np.random.randn(30, 1)
+
+        # The cached results depend on y, not only on beta.
+        for loss in [losses.LogisticRegression(X, y),
+                     losses.RidgeLogisticRegression(X, y, k=0.1)]:
+            f = loss.f(beta)
+            loss.set_params(y=1.0 - y)
+            loss_ = loss.__class__(X, 1.0 - y, **({"k": 0.1}
+                                   if hasattr(loss, "k") else {}))
+            assert_almost_equal(loss.f(beta), loss_.f(beta), places=13)
+            assert abs(loss.f(beta) - f) > 0.1
+
+        # The buffers are not shared between threads.
+        loss = losses.RidgeLogisticRegression(X, y, k=0.1)
+        betas = [np.random.randn(30, 1) for i in xrange(800)]
+        grads = [losses.RidgeLogisticRegression(X, y, k=0.1).grad(b)
+                 for b in betas]
+        pool = ThreadPool(4)
+        try:
+            grads_ = pool.map(loss.grad, betas)
+        finally:
+            pool.close()
+            pool.join()
+        for grad, grad_ in zip(grads, grads_):
+            assert np.all(grad == grad_)
+
+        # The buffers of a thread are freed with the thread.
+        def buffers(beta):
+            loss.grad(beta)
+            return weakref.ref(loss._kernel_states.state["Xbeta"])
+        pool = ThreadPool(4)
+        try:
+            refs = pool.map(buffers, betas[:8])
+        finally:
+            pool.close()
+            pool.join()
+        # The thread-local storage is freed just after the threads have been
+        # joined.
+        for i in xrange(100):
+            gc.collect()
+            if all([ref() is None for ref in refs]):
+                break
+            time.sleep(0.01)
+        assert all([ref() is None for ref in refs])
+
+        # The function may still be copied and pickled.
+        for loss_ in [copy.deepcopy(loss), pickle.loads(pickle.dumps(loss))]:
+            assert np.all(loss_.grad(betas[0]) == grads[0])
+
 if __name__ == "__main__":
     import unittest
     unittest.main()
\ No newline at end of file